@@ -2,13 +2,23 @@
 """Play with Python multiprocessing module"""
 
 import logging
+import sys
 from argparse import ArgumentParser
 
 from src.cli_actions import run_session
 from src.cli_actions import run_single
+from src.cli_actions import run_sweep
+from src.cli_actions import run_serializer_benchmark
+from src.cli_actions import run_transport_benchmark
 from src.config import Config
 from src.log import log_setup
+from src.process_manager import AFFINITY_POLICIES
+from src.process_manager import DISPATCH_POLICIES
+from src.process_manager import LANE_MODES
+from src.process_manager import SERIALIZERS
+from src.process_manager import TRANSPORTS
 from src.perf import duration_s
+from src.sweep import Sweep
 
 
 def opt_setup():
@@ -24,6 +34,51 @@ def opt_setup():
         help="Perform multiple runs with an increasing number of consumer processes. Print elapsed time in CSV format for easy graphing."
     )
 
+    parser.add_argument(
+        "--perftest-consumer-threads",
+        type=int,
+        nargs=3,
+        metavar=('min', 'max', 'step'),
+        help="With --perftest-consumer-count: also sweep the number of threads per consumer process, "
+             "for a grid of processes x threads."
+    )
+
+    parser.add_argument(
+        "--warmup-runs",
+        type=int,
+        help="With --perftest-consumer-count: unmeasured runs before measuring each consumer count (default: 0)."
+    )
+
+    parser.add_argument(
+        "--repetitions",
+        type=int,
+        help="With --perftest-consumer-count: measured runs per consumer count, summarized as mean, median, "
+             "standard deviation and 95%% confidence interval (default: 1)."
+    )
+
+    parser.add_argument(
+        "--outlier-k",
+        type=float,
+        help="With --perftest-consumer-count: reject measured runs further than this many interquartile ranges "
+             "from the quartiles, with 4 runs or more (default: 1.5)."
+    )
+
+    parser.add_argument(
+        "--json-output",
+        type=str,
+        metavar="FILE",
+        help="With --perftest-consumer-count or --sweep: also write results, individual runs included, "
+             "to this JSON file."
+    )
+
+    parser.add_argument(
+        "--reuse-workers",
+        action="store_true",
+        default=None,
+        help="With --perftest-consumer-count: keep worker processes alive across runs, adding or retiring "
+             "workers between runs. Report the time spent doing so separately."
+    )
+
     parser.add_argument(
         "--msg-count",
         type=int,
@@ -66,6 +121,128 @@ def opt_setup():
         help="How long it takes to process a message (in seconds)."
     )
 
+    parser.add_argument(
+        "--consumer-threads",
+        type=int,
+        help="Number of threads processing messages in each consumer process (default: 1)."
+    )
+
+    parser.add_argument(
+        "--async-consumer",
+        action="store_true",
+        default=None,
+        help="Consumers wait without blocking, each consumer process keeps several messages in flight."
+    )
+
+    parser.add_argument(
+        "--async-max-in-flight",
+        type=int,
+        help="--async-consumer: maximum number of messages in flight per consumer process (default: 64)."
+    )
+
+    parser.add_argument(
+        "--autoscale",
+        action="store_true",
+        default=None,
+        help="Add or retire consumer processes during the run, following queue depth, producer blocking "
+             "and consumer utilization. Starts with --consumer-count consumers. Requires a shared queue backend."
+    )
+
+    parser.add_argument(
+        "--autoscale-min",
+        type=int,
+        help="--autoscale: minimum number of consumer processes (default: 1)."
+    )
+
+    parser.add_argument(
+        "--autoscale-max",
+        type=int,
+        help="--autoscale: maximum number of consumer processes (default: number of CPUs)."
+    )
+
+    parser.add_argument(
+        "--autoscale-interval-sec",
+        type=float,
+        help="--autoscale: time between two load samples (default: 0.5)."
+    )
+
+    parser.add_argument(
+        "--autoscale-high-utilization",
+        type=float,
+        help="--autoscale: add a consumer above this busy ratio, if messages are backing up (default: 0.8)."
+    )
+
+    parser.add_argument(
+        "--autoscale-low-utilization",
+        type=float,
+        help="--autoscale: retire a consumer below this busy ratio, if no messages are backing up (default: 0.3)."
+    )
+
+    parser.add_argument(
+        "--autoscale-hysteresis",
+        type=int,
+        help="--autoscale: number of consecutive samples needed to act (default: 3)."
+    )
+
+    parser.add_argument(
+        "--retry-backoff-multiplier",
+        type=float,
+        help="After each timeout, wait this many times longer than after the previous one before retrying "
+             "(default: 1, a fixed wait)."
+    )
+
+    parser.add_argument(
+        "--retry-backoff-max-sec",
+        type=float,
+        help="Upper bound of a single wait between two attempts (default: none)."
+    )
+
+    parser.add_argument(
+        "--retry-jitter",
+        type=float,
+        help="Fraction of each wait between two attempts drawn at random, 0 to 1 (default: 0)."
+    )
+
+    parser.add_argument(
+        "--queue-put-deadline-sec",
+        type=float,
+        help="Total time budget of a put(), across attempts and waits (default: none)."
+    )
+
+    parser.add_argument(
+        "--queue-get-deadline-sec",
+        type=float,
+        help="Total time budget of a get(), across attempts and waits (default: none)."
+    )
+
+    parser.add_argument(
+        "--wake-on-state-change",
+        action="store_true",
+        default=None,
+        help="Between two attempts, resume as soon as the queue gets space or data rather than wait it out."
+    )
+
+    parser.add_argument(
+        "--no-trace-latency",
+        dest="trace_latency",
+        action="store_false",
+        default=None,
+        help="Do not timestamp messages. Saves a few clock reads per message, at the cost of latency percentiles."
+    )
+
+    parser.add_argument(
+        "--payload-size",
+        type=int,
+        help="Size in bytes of a dummy payload added to each message (default: 0)."
+    )
+
+    parser.add_argument(
+        "--large-payload-threshold",
+        type=int,
+        help="Payloads of at least these many bytes travel through shared memory rather than through the queue "
+             "(default: none)."
+    )
+
     parser.add_argument(
         "--queue-full-max-attempts",
         type=int,
@@ -94,6 +271,293 @@ def opt_setup():
         help="Retry when queue is empty before raising queue empty exception"
     )
 
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        help="Maximum number of messages sent through the queue as a single item (default: 1)."
+    )
+
+    parser.add_argument(
+        "--batch-linger-sec",
+        type=float,
+        help="Send a partial batch once its oldest message waited this long (default: 0, wait for a full batch)."
+    )
+
+    parser.add_argument(
+        "--adaptive-chunking",
+        action="store_true",
+        default=None,
+        help="Size batches from the observed task duration, large first then shrinking towards the end of the "
+             "run, like guided scheduling. Replaces --batch-size."
+    )
+
+    parser.add_argument(
+        "--chunk-min",
+        type=int,
+        help="--adaptive-chunking: minimum number of messages per batch (default: 1)."
+    )
+
+    parser.add_argument(
+        "--chunk-max",
+        type=int,
+        help="--adaptive-chunking: maximum number of messages per batch (default: 1024)."
+    )
+
+    parser.add_argument(
+        "--chunk-target-sec",
+        type=float,
+        help="--adaptive-chunking: processing time a batch should take, once task duration is known (default: 0.05)."
+    )
+
+    parser.add_argument(
+        "--chunk-guided-factor",
+        type=float,
+        help="--adaptive-chunking: a batch holds at most the remaining messages divided by this many times "
+             "the number of consumers (default: 2)."
+    )
+
+    parser.add_argument(
+        "--queue-backend",
+        type=str,
+        choices=TRANSPORTS,
+        help="How messages reach the consumer processes (default: queue)."
+    )
+
+    parser.add_argument(
+        "--shm-slot-size",
+        type=int,
+        help="shm_ring backend: maximum size in bytes of a pickled batch (default: 4096)."
+    )
+
+    parser.add_argument(
+        "--dispatch-policy",
+        type=str,
+        choices=DISPATCH_POLICIES,
+        help="pipe and queue_per_worker backends: how messages are spread across consumers (default: round_robin)."
+    )
+
+    parser.add_argument(
+        "--dispatch-key",
+        type=str,
+        help="key_hash dispatch policy: message field identifying messages to be processed by the same consumer "
+             "(default: msg_id)."
+    )
+
+    parser.add_argument(
+        "--priority-count",
+        type=int,
+        help="priority backend: number of priority lanes, 0 the most urgent (default: 2)."
+    )
+
+    parser.add_argument(
+        "--lane-mode",
+        type=str,
+        choices=LANE_MODES,
+        help="priority backend: strict always serves the most urgent lane holding messages, "
+             "weighted serves lanes in proportion to --lane-weights (default: strict)."
+    )
+
+    parser.add_argument(
+        "--lane-weights",
+        type=int,
+        nargs="+",
+        metavar="WEIGHT",
+        help="weighted lane mode: weight of each lane (default: halving from lane to lane)."
+    )
+
+    parser.add_argument(
+        "--lane-aging-sec",
+        type=float,
+        help="priority backend: serve a lane first once it has waited this long, 0 to disable (default: 1)."
+    )
+
+    parser.add_argument(
+        "--urgent-every",
+        type=int,
+        help="Give every Nth message priority 0 and the others the least urgent priority, "
+             "0 to give them all priority 0 (default: 0)."
+    )
+
+    parser.add_argument(
+        "--start-method",
+        type=str,
+        choices=["fork", "spawn", "forkserver"],
+        help="How consumer processes are started (default: platform default)."
+    )
+
+    parser.add_argument(
+        "--forkserver-preload",
+        type=str,
+        nargs="+",
+        metavar="MODULE",
+        help="forkserver start method: modules imported once by the fork server rather than by each consumer."
+    )
+
+    parser.add_argument(
+        "--supervise",
+        action="store_true",
+        default=None,
+        help="Replace consumer processes which die and redeliver the messages they did not process. "
+             "Requires a single producer and a single consumer thread, cannot be combined with --autoscale."
+    )
+
+    parser.add_argument(
+        "--max-redeliveries",
+        type=int,
+        help="--supervise: drop a message once it has been redelivered this many times (default: 3)."
+    )
+
+    parser.add_argument(
+        "--crash-probability",
+        type=float,
+        help="Failure injection: probability that a consumer process dies while processing a message "
+             "(default: 0)."
+    )
+
+    parser.add_argument(
+        "--msg-expire-sec",
+        type=float,
+        help="Skip messages a consumer would start this long after they were produced (default: never)."
+    )
+
+    parser.add_argument(
+        "--msg-timeout-sec",
+        type=float,
+        help="Interrupt messages running longer than this. With --supervise, consumer processes which do not "
+             "yield --timeout-kill-grace-sec later are killed and replaced (default: no timeout)."
+    )
+
+    parser.add_argument(
+        "--timeout-kill-grace-sec",
+        type=float,
+        help="--msg-timeout-sec with --supervise: time left to an interrupted message before killing its "
+             "consumer process (default: 1)."
+    )
+
+    parser.add_argument(
+        "--slow-every",
+        type=int,
+        help="Pathological inputs: every Nth message takes --slow-task-duration-sec, 0 for none (default: 0)."
+    )
+
+    parser.add_argument(
+        "--slow-task-duration-sec",
+        type=float,
+        help="--slow-every: task duration of the slow messages (default: 10)."
+    )
+
+    parser.add_argument(
+        "--cpu-affinity",
+        type=str,
+        choices=AFFINITY_POLICIES,
+        help="Pin each consumer process to cores: compact fills a NUMA node before the next one, scatter "
+             "spreads consumers across nodes, explicit uses --affinity-cores (default: none, Linux only)."
+    )
+
+    parser.add_argument(
+        "--affinity-cores-per-worker",
+        type=int,
+        help="compact and scatter affinity: number of cores each consumer process may run on (default: 1)."
+    )
+
+    parser.add_argument(
+        "--affinity-cores",
+        type=str,
+        nargs="+",
+        metavar="CPULIST",
+        help="explicit affinity: cores of each consumer process in turn, as Linux CPU lists such as 0-3,8."
+    )
+
+    parser.add_argument(
+        "--benchmark-transports",
+        type=str,
+        nargs="*",
+        choices=TRANSPORTS,
+        metavar="TRANSPORT",
+        help=f"Run the same workload over each transport (default: all of {', '.join(TRANSPORTS)}). "
+             "Print throughput and per-message cost in CSV format."
+    )
+
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Serve live metrics in Prometheus text format on http://127.0.0.1:PORT/metrics, 0 for any free port."
+    )
+
+    parser.add_argument(
+        "--metrics-file",
+        type=str,
+        help="Rewrite this file with live metrics in Prometheus text format every --metrics-interval-sec."
+    )
+
+    parser.add_argument(
+        "--metrics-interval-sec",
+        type=float,
+        help="--metrics-file: time between two rewrites (default: 1)."
+    )
+
+    parser.add_argument(
+        "--central-logging",
+        action="store_true",
+        default=None,
+        help="Worker processes send their log records to a single listener in the parent "
+             "rather than each writing to stderr."
+    )
+
+    parser.add_argument(
+        "--log-sample-every",
+        type=int,
+        metavar="N",
+        help="At debug level, log one message in every N on per-message paths (default: 1)."
+    )
+
+    parser.add_argument(
+        "--producer-count",
+        type=int,
+        help="Split the producer into these many shards, each running in its own process (default: 1)."
+    )
+
+    parser.add_argument(
+        "--serializer",
+        type=str,
+        choices=SERIALIZERS,
+        help="How batches are encoded for the transport: pickled as they are, "
+             "or packed into fixed binary records (default: pickle)."
+    )
+
+    parser.add_argument(
+        "--benchmark-serializers",
+        type=str,
+        nargs="*",
+        choices=SERIALIZERS,
+        metavar="SERIALIZER",
+        help=f"Encode and decode the producer's messages with each serializer (default: all of "
+             f"{', '.join(SERIALIZERS)}). Print bytes per message and messages per second in CSV format."
+    )
+
+    parser.add_argument(
+        "--sweep",
+        type=str,
+        metavar="FILE",
+        help="Benchmark every combination of the values listed in this JSON or YAML file, "
+             "a config file in which swept items hold a list of values. Print results in CSV format."
+    )
+
+    parser.add_argument(
+        "--baseline",
+        type=str,
+        metavar="FILE",
+        help="With --sweep: compare throughput against this --json-output of an earlier sweep, "
+             "exit with status 1 on regression."
+    )
+
+    parser.add_argument(
+        "--regression-threshold-pct",
+        type=float,
+        default=5.0,
+        help="With --baseline: throughput drop counted as a regression, in percent (default: 5)."
+    )
+
     parser.add_argument(
         "--config", "-c",
         type=str,
@@ -136,6 +600,23 @@ def main():
         elapsed, _ = duration_s(run_single, config)
         logger.info("Elapsed: %f", elapsed)
 
+    elif args.sweep is not None:
+        # every combination of the swept values, CSV output, compared against a baseline
+        sweep = Sweep.from_file(args.sweep)
+        return run_sweep(sweep, args.json_output, args.baseline, args.regression_threshold_pct)
+
+    elif args.benchmark_transports is not None:
+        # same workload over each transport, CSV output
+        config = Config.from_argparser_args(args)
+        config.log_values()
+        run_transport_benchmark(config, args.benchmark_transports)
+
+    elif args.benchmark_serializers is not None:
+        # encode + decode cost and size of the producer's messages with each serializer, CSV output
+        config = Config.from_argparser_args(args)
+        config.log_values()
+        run_serializer_benchmark(config, args.benchmark_serializers)
+
     elif args.perftest_consumer_count is None:
         # single run with the specified number of consumer processes
         config = Config.from_argparser_args(args)
@@ -147,8 +628,14 @@ def main():
         config = Config.from_argparser_args(args)
         config.log_values()
         consumer_min, consumer_max, consumer_step = args.perftest_consumer_count
-        run_session(config, consumer_min, consumer_max, consumer_step)
+        thread_counts = None
+        if args.perftest_consumer_threads is not None:
+            threads_min, threads_max, threads_step = args.perftest_consumer_threads
+            thread_counts = range(threads_min, threads_max + 1, threads_step)
+        run_session(config, consumer_min, consumer_max, consumer_step, thread_counts, args.json_output)
+
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
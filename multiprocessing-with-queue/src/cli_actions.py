@@ -1,13 +1,64 @@
 """Implementation of actions routed from CLI options in main.py"""
 
+import asyncio
+import json
 import logging
+import multiprocessing
+import os
+import pickle
+import random
 from time import sleep
 
 from src.config import Config
-from src.perf import duration_s
+from src.log import LogSampler
+from src.sweep import Sweep, compare_to_baseline, load_runs
+from src.perf import BenchmarkStats
+from src.perf import LatencyHistogram
+from src.perf import benchmark
 from src.process_manager import MsgEnqueuer, MsgDequeuer
-from src.process_manager import MsgProducer, MsgConsumer
+from src.process_manager import MsgProducer, MsgConsumer, AsyncMsgConsumer
+from src.process_manager import AdaptiveChunking, AutoscalePolicy
+from src.process_manager import DeadlinePolicy
+from src.process_manager import MetricsExporter
 from src.process_manager import ProcessManager
+from src.process_manager import RetryPolicy
+from src.process_manager import SupervisePolicy
+from src.process_manager import LanePolicy
+from src.process_manager import TRANSPORTS, create_transport
+from src.process_manager import create_affinity_policy
+from src.process_manager import create_dispatch_policy
+from src.process_manager import WorkerPool
+from src.process_manager import LatencyStats
+from src.process_manager import Envelope
+from src.process_manager import MsgSchema, SERIALIZERS, create_serializer
+
+# CSV column suffix -> percentile
+LATENCY_PERCENTILES = {"p50": 50, "p90": 90, "p99": 99, "p999": 99.9}
+
+
+class SimpleMsg:
+    """
+    Message of SimpleMsgProducer: a dummy task duration, an optional dummy payload and a priority, 0 the most urgent.
+    """
+
+    __slots__ = ("msg_id", "duration_s", "payload", "priority")
+
+    def __init__(self, msg_id: int, duration_s: float, payload: bytes = b"", priority: int = 0):
+        self.msg_id = msg_id
+        self.duration_s = duration_s
+        self.payload = payload
+        self.priority = priority
+
+    def __reduce__(self):
+        return SimpleMsg, (self.msg_id, self.duration_s, self.payload, self.priority)
+
+    def __repr__(self):
+        return (f"SimpleMsg(msg_id={self.msg_id}, duration_s={self.duration_s}, payload=<{len(self.payload)} bytes>, "
+                f"priority={self.priority})")
+
+
+# layout of SimpleMsg for the struct serializer
+SIMPLE_MSG_SCHEMA = MsgSchema(SimpleMsg, ("msg_id", "duration_s", "priority"), "qdB", tail_field="payload")
 
 
 class SimpleMsgProducer(MsgProducer):
@@ -17,32 +68,65 @@ class SimpleMsgProducer(MsgProducer):
     """
     logger = logging.getLogger("SimpleMsgProducer")
 
-    def __init__(self, msg_count: int, task_duration_s: float):
+    def __init__(self, msg_count: int, task_duration_s: float, payload_size: int = 0, first_msg_id: int = 0,
+                 urgent_every: int = 0, bulk_priority: int = 0, slow_every: int = 0, slow_task_duration_s: float = 0,
+                 log_sample_every: int = 1):
         """
         :param msg_count: how many messages to produce
         :param task_duration_s: dummy task duration (seconds)
+        :param payload_size: size in bytes of a dummy payload added to each message, none if 0
+        :param first_msg_id: msg_id of the first message, the others follow
+        :param urgent_every: messages whose msg_id is a multiple of this get priority 0, none if 0
+        :param bulk_priority: priority of the other messages
+        :param slow_every: messages whose msg_id is a multiple of this take slow_task_duration_s, none if 0
+        :param slow_task_duration_s: dummy task duration of these pathological messages (seconds)
+        :param log_sample_every: debug level only: log the creation of one message in every
         """
         self.logger.debug("n=%d task_duration=%d", msg_count, task_duration_s)
         self._msg_count = msg_count
         self._task_duration_s = task_duration_s
+        self._payload_size = payload_size
+        self._payload = bytes(payload_size)
+        self._first_msg_id = first_msg_id
+        self._urgent_every = urgent_every
+        self._bulk_priority = bulk_priority
+        self._slow_every = slow_every
+        self._slow_task_duration_s = slow_task_duration_s
+        self._log_sample_every = log_sample_every
+        self._log_sampler = LogSampler(self.logger, log_sample_every)
 
     def yield_msgs(self):
         self.logger.debug("start: produce messages")
-        for i in range(self._msg_count):
+        for i in range(self._first_msg_id, self._first_msg_id + self._msg_count):
             yield self.create_msg(i)
         self.logger.debug("end: produce messages")
 
-    def create_msg(self, i: int):
+    def split(self, shard_count: int) -> list:
+        """Consecutive ranges of msg_id, as even as possible"""
+        shards = []
+        first_msg_id = self._first_msg_id
+        for index in range(shard_count):
+            msg_count = self._msg_count // shard_count + (index < self._msg_count % shard_count)
+            shards.append(SimpleMsgProducer(msg_count, self._task_duration_s, self._payload_size, first_msg_id,
+                                            self._urgent_every, self._bulk_priority, self._slow_every,
+                                            self._slow_task_duration_s, self._log_sample_every))
+            first_msg_id += msg_count
+        return shards
+
+    def msg_count(self) -> int:
+        return self._msg_count
+
+    def create_msg(self, i: int) -> SimpleMsg:
         """
         Create a single message
         :param i: message index
-        :return: dict
         """
-        self.logger.debug("Creating message %d", i)
-        return {
-            "duration_s": self._task_duration_s,
-            "msg_id": i,
-        }
+        if self._log_sampler():
+            self.logger.debug("Creating message %d", i)
+        urgent = self._urgent_every and i % self._urgent_every == 0
+        slow = self._slow_every and i % self._slow_every == 0
+        duration_s = self._slow_task_duration_s if slow else self._task_duration_s
+        return SimpleMsg(i, duration_s, self._payload, 0 if urgent else self._bulk_priority)
 
 
 class SimpleMsgConsumer(MsgConsumer):
@@ -51,9 +135,15 @@ class SimpleMsgConsumer(MsgConsumer):
     """
     logger = logging.getLogger("SimpleMsgConsumer")
 
-    def __init__(self):
+    def __init__(self, crash_probability: float = 0.0, log_sample_every: int = 1):
+        """
+        :param crash_probability: failure injection: probability that the process exits abruptly, at each message
+        :param log_sample_every: debug level only: log one message in every
+        """
         self.logger.debug("Constructor")
         self._processed_message_count = 0
+        self._crash_probability = crash_probability
+        self._log_sampler = LogSampler(self.logger, log_sample_every)
 
     @property
     def processed_message_count(self):
@@ -67,28 +157,394 @@ class SimpleMsgConsumer(MsgConsumer):
         """
         Process the specified message.
         """
-        self.logger.debug("Processing %s", msg)
-        duration_s = msg["duration_s"]
+        if self._log_sampler():
+            self.logger.debug("Processing %s", msg)
+        if self._crash_probability and random.random() < self._crash_probability:
+            # no cleanup, like a segfault or an out-of-memory kill would
+            os._exit(1)
+        duration_s = msg.duration_s
         sleep(duration_s)
         self._processed_message_count += 1
 
 
-def run_session(config: Config, consumer_min, consumer_max, consumer_step):
-    logger = logging.getLogger("RunSession")
+class SimpleAsyncMsgConsumer(AsyncMsgConsumer):
+    """
+    Like SimpleMsgConsumer, but waiting without blocking, as I/O-bound consumers would.
+    """
+    logger = logging.getLogger("SimpleAsyncMsgConsumer")
+
+    def __init__(self, log_sample_every: int = 1):
+        """
+        :param log_sample_every: debug level only: log one message in every
+        """
+        self.logger.debug("Constructor")
+        self._processed_message_count = 0
+        self._log_sampler = LogSampler(self.logger, log_sample_every)
+
+    @property
+    def processed_message_count(self):
+        return self._processed_message_count
+
+    async def process_msg(self, msg):
+        """
+        Process the specified message.
+        """
+        if self._log_sampler():
+            self.logger.debug("Processing %s", msg)
+        duration_s = msg.duration_s
+        await asyncio.sleep(duration_s)
+        self._processed_message_count += 1
+
+
+def create_producer(config: Config) -> SimpleMsgProducer:
+    bulk_priority = config.priority_count - 1 if config.urgent_every else 0
+    return SimpleMsgProducer(config.msg_count, config.task_duration_sec, config.payload_size,
+                             urgent_every=config.urgent_every, bulk_priority=bulk_priority,
+                             slow_every=config.slow_every, slow_task_duration_s=config.slow_task_duration_sec,
+                             log_sample_every=config.log_sample_every)
+
+
+def create_consumer(config: Config):
+    if config.async_consumer:
+        return SimpleAsyncMsgConsumer(config.log_sample_every)
+    return SimpleMsgConsumer(config.crash_probability, config.log_sample_every)
+
+
+def run_session(config: Config, consumer_min, consumer_max, consumer_step, thread_counts: range = None,
+                json_output: str = None):
+    """
+    Benchmark each consumer count: config.warmup_runs unmeasured runs, then config.repetitions measured runs.
+    Print one CSV row per consumer count, elapsed being the mean of the measured runs after outlier rejection.
+    :param thread_counts: also sweep consumer_threads, for a grid of processes x threads
+    :param json_output: also write the results, individual samples included, to this JSON file
+    """
+    if thread_counts is None:
+        thread_counts = [config.consumer_threads]
+
+    if config.reuse_workers:
+        run_session_with_pool(config, consumer_min, consumer_max, consumer_step, thread_counts, json_output)
+        return
+
+    report = SessionReport(config)
+    for consumer_threads in thread_counts:
+        config["consumer_threads"] = consumer_threads
+        for consumer_count in range(consumer_min, consumer_max + 1, consumer_step):
+            config["consumer_count"] = consumer_count
+            bench = benchmark(run_single, config, warmup=config.warmup_runs, repeat=config.repetitions,
+                              outlier_k=config.outlier_k)
+            report.add(bench.stats, merge_latency_histograms(bench.results))
+    report.write_json(json_output)
+
+
+def run_session_with_pool(config: Config, consumer_min, consumer_max, consumer_step, thread_counts: range = None,
+                          json_output: str = None):
+    """
+    Like run_session(), but all runs with the same number of threads share a pool of worker processes,
+    resized between runs.
+    Elapsed is the steady-state processing time, warmup_sec the time spent starting or retiring workers.
+    """
+    if consumer_step < 1:
+        raise ValueError(f"consumer_step must be at least 1, got {consumer_step}")
+
+    report = SessionReport(config, extra_headers=["warmup_sec"])
+    for consumer_threads in thread_counts or [config.consumer_threads]:
+        config["consumer_threads"] = consumer_threads
+        proc_mgr = create_process_manager(config)
+        pool = WorkerPool(proc_mgr, create_consumer(config))
+        try:
+            for consumer_count in range(consumer_min, consumer_max + 1, consumer_step):
+                config["consumer_count"] = consumer_count
+                warmup_sec = pool.resize(consumer_count)
+                bench = benchmark(lambda: pool.run(create_producer(config), config.producer_count),
+                                  warmup=config.warmup_runs, repeat=config.repetitions, outlier_k=config.outlier_k)
+                report.add(bench.stats, None, extra_values=[warmup_sec])
+        finally:
+            pool.close()
+            proc_mgr.close()
+    report.write_json(json_output)
+
+
+def run_sweep(sweep: Sweep, json_output: str = None, baseline: str = None, threshold_pct: float = 5.0) -> int:
+    """
+    Benchmark every point of the sweep like run_session() does, then compare throughput against a baseline.
+    :param json_output: write the results to this JSON file, which can serve as a later baseline
+    :param baseline: JSON file written by an earlier sweep
+    :param threshold_pct: throughput drop, in percent, counted as a regression
+    :return: exit code, 1 if any point regressed
+    """
+    logger = logging.getLogger("RunSweep")
+    logger.info("Sweeping %d points over %s", len(sweep), ", ".join(sweep.axes))
+
+    report = SessionReport(sweep.config, extra_headers=["msgs_per_sec"])
+    for config in sweep.points():
+        bench = benchmark(run_single, config, warmup=config.warmup_runs, repeat=config.repetitions,
+                          outlier_k=config.outlier_k)
+        report.add(bench.stats, merge_latency_histograms(bench.results),
+                   extra_values=[config.msg_count / bench.stats.mean])
+    report.write_json(json_output)
+
+    if baseline is None:
+        return 0
+    regressions = compare_to_baseline(report.runs, load_runs(baseline), list(sweep.axes), threshold_pct)
+    errors = [regression for regression in regressions if "error" in regression]
+    if errors:
+        logger.error("%d of %d points could not be compared with the baseline", len(errors), len(sweep))
+    if len(regressions) > len(errors):
+        logger.error("%d of %d points regressed by more than %s%%", len(regressions) - len(errors), len(sweep),
+                     threshold_pct)
+    if regressions:
+        return 1
+    return 0
+
+
+class SessionReport:
+    """Prints a CSV row as each benchmark completes, keeps everything for an optional JSON file"""
+
+    STATS_HEADERS = ["elapsed_median", "elapsed_stddev", "elapsed_ci95_low", "elapsed_ci95_high",
+                     "measured_runs", "outliers"]
+
+    def __init__(self, config: Config, extra_headers: list = None):
+        self._config = config
+        self._extra_headers = extra_headers or []
+        self._runs = []
+        print(config.csv_headers(extra_headers=self.STATS_HEADERS + latency_headers() + self._extra_headers))
+
+    @property
+    def runs(self) -> list:
+        return self._runs
+
+    def add(self, stats: BenchmarkStats, latency_histograms: dict, extra_values: list = None):
+        run_id = len(self._runs) + 1
+        stats_values = [stats.median, stats.stddev, stats.ci95_low, stats.ci95_high, len(stats.kept),
+                        len(stats.rejected)]
+        extra_values = extra_values or []
+        print(self._config.csv_row(stats.mean, run_id=run_id,
+                                   extra_values=stats_values + latency_values(latency_histograms) + extra_values))
+        self._runs.append({
+            "run_id": run_id,
+            "config": self._config.to_dict(),
+            "elapsed": stats.to_dict(),
+            "latency_usec": {
+                metric: dict(zip(LATENCY_PERCENTILES, percentiles_usec(histogram)))
+                for metric, histogram in (latency_histograms or {}).items()
+            },
+            **dict(zip(self._extra_headers, extra_values)),
+        })
+
+    def write_json(self, filename: str):
+        if filename is None:
+            return
+        with open(filename, "w", encoding="utf-8") as json_file:
+            json.dump({"runs": self._runs}, json_file, indent=2)
+
+
+def latency_headers() -> list:
+    return [f"{metric}_{suffix}_usec" for metric in LatencyStats.METRICS for suffix in LATENCY_PERCENTILES]
+
+
+def latency_values(latency_histograms: dict) -> list:
+    """Percentiles in usec, in the order of latency_headers(), empty if latency was not traced"""
+    if latency_histograms is None:
+        return [""] * len(LatencyStats.METRICS) * len(LATENCY_PERCENTILES)
+    return [value for metric in LatencyStats.METRICS for value in percentiles_usec(latency_histograms[metric])]
+
+
+def percentiles_usec(histogram) -> list:
+    """LATENCY_PERCENTILES of the histogram in usec, empty if the histogram is"""
+    return [
+        value_ns / 1000 if value_ns is not None else ""
+        for value_ns in map(histogram.percentile, LATENCY_PERCENTILES.values())
+    ]
 
-    print(config.csv_headers())
-    for consumer_count in range(consumer_min, consumer_max + 1, consumer_step):
-        config["consumer_count"] = consumer_count
-        t_elapsed_sec = duration_s(run_single, config)
-        print(config.csv_row(t_elapsed_sec))
 
+def merge_latency_histograms(runs: list) -> dict:
+    """Merge the latency histograms returned by several run_single() calls, None if latency was not traced"""
+    merged = None
+    for histograms in runs:
+        if histograms is None:
+            continue
+        if merged is None:
+            merged = {metric: LatencyHistogram() for metric in histograms}
+        for metric, histogram in histograms.items():
+            merged[metric].merge(histogram)
+    return merged
+
+
+def run_transport_benchmark(config: Config, transports: list = None):
+    """
+    Run the same workload over each transport like run_session() does: config.warmup_runs unmeasured runs,
+    then config.repetitions measured runs. Print one CSV row per transport: median throughput,
+    which includes starting and stopping the workers, and end-to-end latency percentiles from enqueue
+    to completion over all measured runs, empty if latency is not traced.
+    """
+    latency_header = ",".join(f"end_to_end_{suffix}_usec" for suffix in LATENCY_PERCENTILES)
+    print(f"queue_backend,msg_count,consumer_count,batch_size,elapsed_median,elapsed_stddev,msgs_per_sec,"
+          f"{latency_header}")
+    for transport in transports or TRANSPORTS:
+        config["queue_backend"] = transport
+        bench = benchmark(run_single, config, warmup=config.warmup_runs, repeat=config.repetitions,
+                          outlier_k=config.outlier_k)
+        stats = bench.stats
+        latency_histograms = merge_latency_histograms(bench.results)
+        latencies = (percentiles_usec(latency_histograms["end_to_end"]) if latency_histograms is not None
+                     else [""] * len(LATENCY_PERCENTILES))
+        print(f"{transport},{config.msg_count},{config.consumer_count},{config.batch_size},"
+              f"{stats.median},{stats.stddev},{config.msg_count / stats.median},{','.join(map(str, latencies))}")
+
+
+def run_serializer_benchmark(config: Config, serializers: list = None):
+    """
+    Encode and decode the producer's messages, batch_size at a time, with each serializer.
+    Print the size of a message once pickled for the transport, and the median encode + decode throughput
+    over config repetitions, in CSV format. Messages are pickled and unpickled too, as the transport would.
+    """
+    producer = create_producer(config)
+    batch_size = config.batch_size
+    msgs = [(ProcessManager.MSG_TYPE_USER, Envelope(seq, msg)) for seq, msg in enumerate(producer.yield_msgs())]
+    batches = [msgs[start:start + batch_size] for start in range(0, len(msgs), batch_size)]
+
+    def round_trip(serializer):
+        for batch in batches:
+            serializer.decode(pickle.loads(pickle.dumps(serializer.encode(batch), protocol=pickle.HIGHEST_PROTOCOL)))
+
+    print("serializer,msg_count,batch_size,payload_size,bytes_per_msg,elapsed_median,msgs_per_sec,usec_per_msg")
+    for name in serializers or SERIALIZERS:
+        serializer = create_serializer(name, SIMPLE_MSG_SCHEMA)
+        size = sum(len(pickle.dumps(serializer.encode(batch), protocol=pickle.HIGHEST_PROTOCOL)) for batch in batches)
+        stats = benchmark(round_trip, serializer, warmup=config.warmup_runs, repeat=config.repetitions,
+                          outlier_k=config.outlier_k).stats
+        bytes_per_msg = size / len(msgs) if msgs else 0
+        msgs_per_sec = len(msgs) / stats.median
+        usec_per_msg = stats.median * 1_000_000 / len(msgs) if msgs else 0
+        print(f"{name},{len(msgs)},{batch_size},{config.payload_size},{bytes_per_msg},{stats.median},"
+              f"{msgs_per_sec},{usec_per_msg}")
+
+
+def create_process_manager(config: Config) -> ProcessManager:
+    put_retry = RetryPolicy(
+        max_attempts=config.queue_full_max_attempts,
+        wait_sec=config.queue_full_wait_sec,
+        multiplier=config.retry_backoff_multiplier,
+        max_wait_sec=config.retry_backoff_max_sec,
+        jitter=config.retry_jitter,
+        deadline_sec=config.queue_put_deadline_sec,
+    )
+    get_retry = RetryPolicy(
+        max_attempts=config.queue_empty_max_attempts,
+        wait_sec=config.queue_empty_wait_sec,
+        multiplier=config.retry_backoff_multiplier,
+        max_wait_sec=config.retry_backoff_max_sec,
+        jitter=config.retry_jitter,
+        deadline_sec=config.queue_get_deadline_sec,
+    )
+    enqueuer = MsgEnqueuer(config.queue_put_timeout_sec, retry_policy=put_retry,
+                           log_sample_every=config.log_sample_every)
+    dequeuer = MsgDequeuer(config.queue_get_timeout_sec, retry_policy=get_retry,
+                           log_sample_every=config.log_sample_every)
+
+    ctx = multiprocessing.get_context(config.start_method)
+    dispatch = create_dispatch_policy(config.dispatch_policy, config.dispatch_key)
+    lane_policy = None
+    if config.queue_backend == "priority":
+        lane_policy = LanePolicy(config.priority_count, config.lane_mode, config.lane_weights, config.lane_aging_sec)
+    transport = create_transport(config.queue_backend, config.queue_max_size, config.shm_slot_size, dispatch, ctx,
+                                 lane_policy)
+
+    autoscale = None
+    if config.autoscale:
+        autoscale = AutoscalePolicy(
+            min_workers=config.autoscale_min,
+            max_workers=config.autoscale_max or max(config.autoscale_min, os.cpu_count()),
+            interval_sec=config.autoscale_interval_sec,
+            high_utilization=config.autoscale_high_utilization,
+            low_utilization=config.autoscale_low_utilization,
+            hysteresis=config.autoscale_hysteresis,
+        )
+
+    deadlines = None
+    if config.msg_expire_sec is not None or config.msg_timeout_sec is not None:
+        deadlines = DeadlinePolicy(config.msg_expire_sec, config.msg_timeout_sec, config.timeout_kill_grace_sec)
+
+    metrics = None
+    if config.metrics_port is not None or config.metrics_file is not None:
+        metrics = MetricsExporter(config.metrics_port, stats_file=config.metrics_file,
+                                  interval_sec=config.metrics_interval_sec)
+
+    chunking = None
+    if config.adaptive_chunking:
+        chunking = AdaptiveChunking(
+            min_chunk=config.chunk_min,
+            max_chunk=config.chunk_max,
+            target_chunk_sec=config.chunk_target_sec,
+            guided_factor=config.chunk_guided_factor,
+        )
+
+    return ProcessManager(
+        enqueuer,
+        dequeuer,
+        config.queue_max_size,
+        batch_size=config.batch_size,
+        batch_linger_sec=config.batch_linger_sec,
+        transport=transport,
+        start_method=config.start_method,
+        forkserver_preload=config.forkserver_preload,
+        async_max_in_flight=config.async_max_in_flight,
+        consumer_threads=config.consumer_threads,
+        autoscale=autoscale,
+        wake_on_state_change=config.wake_on_state_change,
+        trace_latency=config.trace_latency,
+        large_payload_threshold=config.large_payload_threshold,
+        serializer=create_serializer(config.serializer, SIMPLE_MSG_SCHEMA),
+        central_logging=config.central_logging,
+        log_sample_every=config.log_sample_every,
+        chunking=chunking,
+        affinity=create_affinity_policy(config.cpu_affinity, config.affinity_cores_per_worker, config.affinity_cores),
+        supervise=SupervisePolicy(max_redeliveries=config.max_redeliveries) if config.supervise else None,
+        deadlines=deadlines,
+        metrics=metrics,
+    )
+
+
+def run_single(config: Config) -> dict:
+    """
+    :return: latency histograms of the run, None if latency was not traced
+    """
+    producer = create_producer(config)
+    consumer = create_consumer(config)
 
-def run_single(config: Config):
-    producer = SimpleMsgProducer(config.msg_count, config.task_duration_sec)
-    consumer = SimpleMsgConsumer()
+    proc_mgr = create_process_manager(config)
+    try:
+        proc_mgr.process(producer, consumer, config.consumer_count, producer_count=config.producer_count)
+    finally:
+        proc_mgr.close()
 
-    enqueuer = MsgEnqueuer(config.queue_put_timeout_sec, config.queue_full_max_attempts, config.queue_full_wait_sec)
-    dequeuer = MsgDequeuer(config.queue_get_timeout_sec, config.queue_empty_max_attempts, config.queue_empty_wait_sec)
+    logger = logging.getLogger("RunSingle")
+    for worker_index, latency_ns in enumerate(proc_mgr.startup_latencies_ns):
+        if latency_ns is not None:
+            logger.info("Worker %d startup: %.3f ms", worker_index, latency_ns / 1_000_000)
+    if config.cpu_affinity != "none":
+        for worker_index, cpu in enumerate(proc_mgr.worker_cpus):
+            if cpu is not None:
+                logger.info("Worker %d on CPU %d", worker_index, cpu)
+    logger.info("Shutdown: %.3f ms", proc_mgr.shutdown_sec * 1000)
+    if proc_mgr.supervisor_stats is not None:
+        logger.info("Supervisor: %s", proc_mgr.supervisor_stats)
+    if proc_mgr.deadline_stats is not None:
+        logger.info("Deadlines: %s", proc_mgr.deadline_stats)
 
-    proc_mgr = ProcessManager(enqueuer, dequeuer, config.queue_max_size)
-    proc_mgr.process(producer, consumer, config.consumer_count)
+    latency_histograms = proc_mgr.latency_histograms
+    if latency_histograms is not None:
+        for metric, histogram in latency_histograms.items():
+            percentiles = " ".join(
+                f"{suffix}={value_usec}" for suffix, value_usec in zip(LATENCY_PERCENTILES, percentiles_usec(histogram))
+            )
+            logger.info("Latency %s (usec, %d msgs): %s", metric, histogram.count, percentiles)
+    by_priority = proc_mgr.latency_histograms_by_priority
+    if by_priority is not None and len(by_priority) > 1:
+        for priority, histograms in enumerate(by_priority):
+            histogram = histograms["end_to_end"]
+            percentiles = " ".join(
+                f"{suffix}={value_usec}" for suffix, value_usec in zip(LATENCY_PERCENTILES, percentiles_usec(histogram))
+            )
+            logger.info("Latency end_to_end priority %d (usec, %d msgs): %s", priority, histogram.count, percentiles)
+    return latency_histograms
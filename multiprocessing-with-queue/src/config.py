@@ -2,6 +2,7 @@ import logging
 
 from box import Box
 from box import BoxError
+from box import BoxKeyError
 from json import JSONDecodeError
 
 class Config(Box):
@@ -20,11 +21,90 @@ class Config(Box):
         "queue_empty_wait_sec",
     ]
 
+    # Items which can be omitted from config files and command line, with their default value
+    OPTIONAL_CONFIG_ITEMS = {
+        "batch_size": 1,
+        "batch_linger_sec": 0,
+        "adaptive_chunking": False,
+        "chunk_min": 1,
+        "chunk_max": 1024,
+        "chunk_target_sec": 0.05,
+        "chunk_guided_factor": 2.0,
+        "queue_backend": "queue",
+        "shm_slot_size": 4096,
+        "dispatch_policy": "round_robin",
+        "dispatch_key": "msg_id",
+        "priority_count": 2,
+        "lane_mode": "strict",
+        "lane_weights": None,
+        "lane_aging_sec": 1.0,
+        "urgent_every": 0,
+        "reuse_workers": False,
+        "start_method": None,
+        "forkserver_preload": None,
+        "async_consumer": False,
+        "async_max_in_flight": 64,
+        "consumer_threads": 1,
+        "cpu_affinity": "none",
+        "affinity_cores_per_worker": 1,
+        "affinity_cores": None,
+        "autoscale": False,
+        "autoscale_min": 1,
+        "autoscale_max": None,
+        "autoscale_interval_sec": 0.5,
+        "autoscale_high_utilization": 0.8,
+        "autoscale_low_utilization": 0.3,
+        "autoscale_hysteresis": 3,
+        "retry_backoff_multiplier": 1.0,
+        "retry_backoff_max_sec": None,
+        "retry_jitter": 0.0,
+        "queue_put_deadline_sec": None,
+        "queue_get_deadline_sec": None,
+        "wake_on_state_change": False,
+        "trace_latency": True,
+        "payload_size": 0,
+        "large_payload_threshold": None,
+        "serializer": "pickle",
+        "producer_count": 1,
+        "supervise": False,
+        "max_redeliveries": 3,
+        "crash_probability": 0.0,
+        "msg_expire_sec": None,
+        "msg_timeout_sec": None,
+        "timeout_kill_grace_sec": 1.0,
+        "slow_every": 0,
+        "slow_task_duration_sec": 10.0,
+        "metrics_port": None,
+        "metrics_file": None,
+        "metrics_interval_sec": 1.0,
+        "central_logging": False,
+        "log_sample_every": 1,
+        "warmup_runs": 0,
+        "repetitions": 1,
+        "outlier_k": 1.5,
+    }
+
+    def __getitem__(self, item, _ignore_default=False):
+        try:
+            return super().__getitem__(item, _ignore_default)
+        except BoxKeyError:
+            if item in self.OPTIONAL_CONFIG_ITEMS:
+                return self.OPTIONAL_CONFIG_ITEMS[item]
+            raise
+
+    @classmethod
+    def all_items(cls) -> list:
+        return cls.CONFIG_ITEMS + list(cls.OPTIONAL_CONFIG_ITEMS)
+
     @classmethod
     def from_argparser_args(cls, args):
         obj = Config()
         for item in cls.CONFIG_ITEMS:
             obj[item] = eval(f"args.{item}")
+        for item in cls.OPTIONAL_CONFIG_ITEMS:
+            value = getattr(args, item, None)
+            if value is not None:
+                obj[item] = value
         return obj
 
     @classmethod
@@ -44,19 +124,31 @@ class Config(Box):
         raise ValueError("Unsupported or unrecognized file format.")
 
 
+    def to_dict(self) -> dict:
+        """All items, defaults included"""
+        return {item: self[item] for item in self.all_items()}
+
     def log_values(self):
-        for key in self.CONFIG_ITEMS:
+        for key in self.all_items():
             self.logger.info("%s = %s", key, self[key])
 
-    def csv_headers(self) -> str:
-        csv_headers = self.CONFIG_ITEMS.copy()
+    def csv_headers(self, extra_headers: list = None) -> str:
+        csv_headers = self.all_items()
         csv_headers.insert(0, "run_id")
         csv_headers.append("elapsed")
+        csv_headers.extend(extra_headers or [])
         return ",".join(csv_headers)
 
-    def csv_row(self, elapsed_sec: float):
-        csv_row = [self[item] for item in self.CONFIG_ITEMS]
-        csv_row.insert(0, 1)
+    @staticmethod
+    def _csv_value(value):
+        if isinstance(value, (list, tuple)):
+            return ";".join(str(item) for item in value)
+        return value
+
+    def csv_row(self, elapsed_sec: float, extra_values: list = None, run_id: int = 1):
+        csv_row = [self._csv_value(self[item]) for item in self.all_items()]
+        csv_row.insert(0, run_id)
         csv_row.append(elapsed_sec)
+        csv_row.extend(extra_values or [])
         csv_row_str = [str(item) for item in csv_row]
         return ",".join(csv_row_str)
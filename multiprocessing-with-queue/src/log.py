@@ -1,7 +1,9 @@
 """Opinionated logging configuration"""
 
 import logging
+import logging.handlers
 import sys
+from multiprocessing.context import BaseContext
 
 
 def log_setup(log_level):
@@ -19,3 +21,66 @@ def log_setup(log_level):
     formatter = logging.Formatter('%(asctime)s [%(levelname)s] - %(name)s(%(process)d) - %(message)s')
     log_handler.setFormatter(formatter)
     root_logger.addHandler(log_handler)
+
+
+class LogQueue:
+    """
+    Centralized logging: processes started with multiprocessing send their log records through a queue
+    to a single listener thread in the parent, which writes them with the parent's own handlers.
+    Workers never wait on stderr, and lines from several processes never interleave.
+    """
+
+    def __init__(self, ctx: BaseContext):
+        self._queue = ctx.Queue()
+        self._listener = None
+
+    def start(self):
+        """Parent side: forward records to the handlers of the root logger, as configured by log_setup()"""
+        self._listener = logging.handlers.QueueListener(self._queue, *logging.getLogger().handlers,
+                                                        respect_handler_level=True)
+        self._listener.start()
+
+    def stop(self):
+        """Parent side: write the pending records, then stop the listener"""
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+    def worker_setup(self, log_level):
+        """
+        Child process side, instead of log_setup(): replace handlers, inherited with fork, by the queue.
+        """
+        root_logger = logging.getLogger()
+        for handler in list(root_logger.handlers):
+            root_logger.removeHandler(handler)
+        root_logger.addHandler(logging.handlers.QueueHandler(self._queue))
+        root_logger.setLevel(log_level)
+
+    def __getstate__(self):
+        # child processes only need the queue, the listener thread stays in the parent
+        state = self.__dict__.copy()
+        state["_listener"] = None
+        return state
+
+
+class LogSampler:
+    """
+    Sampling of per-message debug lines: call it before logging such a line.
+    The level is checked on each call, Logger.isEnabledFor() caching its answer until the level changes.
+    """
+
+    def __init__(self, logger: logging.Logger, every: int = 1):
+        """
+        :param every: let one line in every through
+        """
+        if every < 1:
+            raise ValueError(f"every must be at least 1, got {every}")
+        self._logger = logger
+        self._every = every
+        self._count = 0
+
+    def __call__(self) -> bool:
+        if not self._logger.isEnabledFor(logging.DEBUG):
+            return False
+        self._count += 1
+        return self._count % self._every == 0
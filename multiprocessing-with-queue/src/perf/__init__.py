@@ -1,2 +1,4 @@
 from .duration_ns import duration_ns
 from .duration_ns import duration_s
+from .latency_histogram import LatencyHistogram
+from .benchmark import BenchmarkResult, BenchmarkStats, benchmark, reject_outliers
@@ -0,0 +1,103 @@
+import math
+import statistics
+
+from .duration_ns import duration_s
+
+# two-sided 95% Student t critical values by degrees of freedom, normal approximation beyond
+_T_95 = [
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+]
+
+
+def t_critical_95(degrees_of_freedom: int) -> float:
+    if degrees_of_freedom < 1:
+        raise ValueError(f"degrees_of_freedom must be at least 1, got {degrees_of_freedom}")
+    if degrees_of_freedom <= len(_T_95):
+        return _T_95[degrees_of_freedom - 1]
+    return 1.960
+
+
+def reject_outliers(samples: list, k: float = 1.5) -> tuple:
+    """
+    Tukey's fences: drop samples further than k interquartile ranges from the first or third quartile.
+    :return: kept samples, rejected samples. Fewer than 4 samples are all kept.
+    """
+    if len(samples) < 4:
+        return list(samples), []
+    q1, _, q3 = statistics.quantiles(samples, n=4)
+    low, high = q1 - k * (q3 - q1), q3 + k * (q3 - q1)
+    kept = [sample for sample in samples if low <= sample <= high]
+    rejected = [sample for sample in samples if not low <= sample <= high]
+    return kept, rejected
+
+
+class BenchmarkStats:
+    """Summary of repeated measurements, after outlier rejection"""
+
+    def __init__(self, samples: list, outlier_k: float = 1.5):
+        """
+        :param samples: measurements, in seconds
+        :param outlier_k: Tukey's fences factor, None to keep every sample
+        """
+        if not samples:
+            raise ValueError("At least one sample is needed")
+        self.samples = list(samples)
+        if outlier_k is None:
+            self.kept, self.rejected = list(samples), []
+        else:
+            self.kept, self.rejected = reject_outliers(samples, outlier_k)
+
+        n = len(self.kept)
+        self.mean = statistics.fmean(self.kept)
+        self.median = statistics.median(self.kept)
+        self.stddev = statistics.stdev(self.kept) if n > 1 else 0.0
+        self.min = min(self.kept)
+        self.max = max(self.kept)
+        # 95% confidence interval of the mean, None from a single sample
+        self.ci95_low = self.ci95_high = None
+        if n > 1:
+            half_width = t_critical_95(n - 1) * self.stddev / math.sqrt(n)
+            self.ci95_low = self.mean - half_width
+            self.ci95_high = self.mean + half_width
+
+    def to_dict(self) -> dict:
+        return {
+            "n": len(self.kept),
+            "outliers": len(self.rejected),
+            "mean": self.mean,
+            "median": self.median,
+            "stddev": self.stddev,
+            "min": self.min,
+            "max": self.max,
+            "ci95_low": self.ci95_low,
+            "ci95_high": self.ci95_high,
+            "samples": self.samples,
+        }
+
+
+class BenchmarkResult:
+    """Timings of a benchmark, with the value returned by each measured call"""
+
+    def __init__(self, stats: BenchmarkStats, results: list):
+        self.stats = stats
+        self.results = results
+
+
+def benchmark(func, *args, warmup: int = 0, repeat: int = 1, outlier_k: float = 1.5, **kwargs) -> BenchmarkResult:
+    """
+    Call func warmup times without measuring, then repeat times measuring each call with duration_s().
+    :param outlier_k: Tukey's fences factor, None to keep every sample
+    """
+    if repeat < 1:
+        raise ValueError(f"repeat must be at least 1, got {repeat}")
+    for _ in range(warmup):
+        func(*args, **kwargs)
+    samples = []
+    results = []
+    for _ in range(repeat):
+        elapsed, result = duration_s(func, *args, **kwargs)
+        samples.append(elapsed)
+        results.append(result)
+    return BenchmarkResult(BenchmarkStats(samples, outlier_k), results)
@@ -0,0 +1,73 @@
+class LatencyHistogram:
+    """
+    Fixed-size log-linear histogram of durations in nanoseconds, in the style of HdrHistogram.
+
+    Values below 2 ** SUB_BUCKET_BITS are counted exactly. Above, each power of 2 is split into
+    2 ** (SUB_BUCKET_BITS - 1) buckets, which bounds the relative error to 1 / 2 ** (SUB_BUCKET_BITS - 1).
+    Values of 2 ** MAX_VALUE_BITS ns (about 18 minutes) and above are counted in the last bucket.
+    """
+
+    SUB_BUCKET_BITS = 7
+    MAX_VALUE_BITS = 40
+
+    _SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+    _HALF_SUB_BUCKET_COUNT = _SUB_BUCKET_COUNT >> 1
+    BUCKET_COUNT = _SUB_BUCKET_COUNT + (MAX_VALUE_BITS - SUB_BUCKET_BITS) * _HALF_SUB_BUCKET_COUNT
+
+    def __init__(self, counts: list = None):
+        """
+        :param counts: BUCKET_COUNT bucket counts, as returned by counts, for an empty histogram if None
+        """
+        self._counts = list(counts) if counts is not None else [0] * self.BUCKET_COUNT
+        self._count = sum(self._counts)
+
+    @property
+    def counts(self) -> list:
+        return self._counts
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @classmethod
+    def bucket_index(cls, value_ns: int) -> int:
+        if value_ns < cls._SUB_BUCKET_COUNT:
+            return max(0, value_ns)
+        shift = value_ns.bit_length() - cls.SUB_BUCKET_BITS
+        index = cls._SUB_BUCKET_COUNT + (shift - 1) * cls._HALF_SUB_BUCKET_COUNT \
+            + (value_ns >> shift) - cls._HALF_SUB_BUCKET_COUNT
+        return min(index, cls.BUCKET_COUNT - 1)
+
+    @classmethod
+    def bucket_value(cls, index: int) -> int:
+        """Middle of the range of values counted in the specified bucket"""
+        if index < cls._SUB_BUCKET_COUNT:
+            return index
+        shift, sub_bucket = divmod(index - cls._SUB_BUCKET_COUNT, cls._HALF_SUB_BUCKET_COUNT)
+        shift += 1
+        return ((sub_bucket + cls._HALF_SUB_BUCKET_COUNT) << shift) + (1 << (shift - 1))
+
+    def record(self, value_ns: int):
+        self._counts[self.bucket_index(value_ns)] += 1
+        self._count += 1
+
+    def merge(self, other: "LatencyHistogram"):
+        for index, count in enumerate(other.counts):
+            if count:
+                self._counts[index] += count
+        self._count += other.count
+
+    def percentile(self, percent: float) -> int:
+        """:return: value below which percent % of the recorded values fall, in ns, None if empty"""
+        if not self._count:
+            return None
+        rank = max(1, round(self._count * percent / 100))
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen >= rank:
+                return self.bucket_value(index)
+        return self.bucket_value(self.BUCKET_COUNT - 1)
+
+    def percentiles(self, percents: tuple = (50, 90, 99, 99.9)) -> dict:
+        return {percent: self.percentile(percent) for percent in percents}
@@ -1,4 +1,20 @@
-from .interfaces import MsgProducer, MsgConsumer
+from .affinity import AffinityPolicy, AFFINITY_POLICIES, create_affinity_policy
+from .autoscaler import AutoscalePolicy, AutoscaleSample
+from .chunking import AdaptiveChunking
+from .deadlines import DeadlinePolicy, DeadlineStats, MsgTimeout
+from .dispatch import DispatchPolicy, DISPATCH_POLICIES, create_dispatch_policy
+from .envelope import Envelope
+from .interfaces import MsgProducer, MsgConsumer, AsyncMsgConsumer
+from .lanes import LanePolicy, LANE_MODES
+from .latency_stats import LatencyStats
+from .metrics import MetricsExporter
 from .msg_dequeuer import MsgDequeuer
 from .msg_enqueuer import MsgEnqueuer
 from .process_manager import ProcessManager
+from .retry_policy import RetryPolicy, QueueNotifier
+from .serializers import MsgSchema, Serializer, SERIALIZERS, create_serializer
+from .shm_payloads import ShmPayloadStore
+from .supervisor import SupervisePolicy, SupervisorStats
+from .transports import Transport, TRANSPORTS, create_transport
+from .worker_pool import WorkerPool
+from .worker_stats import ProducerStats, WorkerStats
@@ -0,0 +1,137 @@
+"""
+Policies pinning each worker process to a set of cores, Linux only.
+"""
+import glob
+import os
+import re
+
+
+def parse_cpu_list(cpu_list: str) -> list:
+    """
+    :param cpu_list: Linux cpulist format, as in /sys/devices/system/node/node0/cpulist: "0-3,8,10-11"
+    :return: sorted list of CPU numbers
+    """
+    cpus = set()
+    for part in cpu_list.strip().split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return sorted(cpus)
+
+
+def numa_nodes() -> list:
+    """
+    :return: for each NUMA node, the CPUs of that node this process may run on.
+        A single node holding every allowed CPU if the platform does not tell.
+    """
+    allowed = os.sched_getaffinity(0)
+    nodes = []
+    paths = glob.glob("/sys/devices/system/node/node[0-9]*/cpulist")
+    for path in sorted(paths, key=lambda path: int(re.search(r"node(\d+)", path).group(1))):
+        with open(path, encoding="ascii") as cpulist:
+            cpus = [cpu for cpu in parse_cpu_list(cpulist.read()) if cpu in allowed]
+        if cpus:
+            nodes.append(cpus)
+    return nodes or [sorted(allowed)]
+
+
+def current_cpu() -> int:
+    """:return: CPU the calling process last ran on, None if the platform does not tell"""
+    try:
+        with open("/proc/self/stat", encoding="ascii") as stat:
+            # the command name may hold spaces, fields are counted from the closing parenthesis
+            fields = stat.read().rpartition(")")[2].split()
+    except OSError:
+        return None
+    # field 39 of proc(5), "processor"
+    return int(fields[36])
+
+
+class AffinityPolicy:
+    """
+    Affinity policy interface: which cores worker i may run on.
+    Built in the parent process, so the topology is read once, then pickled to the workers.
+    """
+
+    def __init__(self, nodes: list = None):
+        """:param nodes: CPUs of each NUMA node, defaults to the topology of this machine, see numa_nodes()"""
+        if not hasattr(os, "sched_setaffinity"):
+            raise ValueError("CPU affinity requires os.sched_setaffinity(), not available on this platform")
+        self._nodes = nodes if nodes is not None else numa_nodes()
+
+    def cores(self, worker_index: int) -> list:
+        raise NotImplementedError()
+
+    def apply(self, worker_index: int) -> list:
+        """Worker side: pin the calling process, :return: its cores"""
+        cores = self.cores(worker_index)
+        os.sched_setaffinity(0, cores)
+        return cores
+
+
+class CompactAffinity(AffinityPolicy):
+    """Consecutive workers on neighbouring cores, filling a NUMA node before using the next one"""
+
+    def __init__(self, cores_per_worker: int = 1, nodes: list = None):
+        super().__init__(nodes)
+        if cores_per_worker < 1:
+            raise ValueError(f"cores_per_worker must be at least 1, got {cores_per_worker}")
+        self._cores_per_worker = cores_per_worker
+        self._cpus = [cpu for node in self._nodes for cpu in node]
+
+    def cores(self, worker_index: int) -> list:
+        start = worker_index * self._cores_per_worker
+        return [self._cpus[(start + offset) % len(self._cpus)] for offset in range(self._cores_per_worker)]
+
+
+class ScatterAffinity(AffinityPolicy):
+    """Consecutive workers on different NUMA nodes in turn, spreading memory bandwidth and caches"""
+
+    def __init__(self, cores_per_worker: int = 1, nodes: list = None):
+        super().__init__(nodes)
+        if cores_per_worker < 1:
+            raise ValueError(f"cores_per_worker must be at least 1, got {cores_per_worker}")
+        self._cores_per_worker = cores_per_worker
+
+    def cores(self, worker_index: int) -> list:
+        node = self._nodes[worker_index % len(self._nodes)]
+        start = (worker_index // len(self._nodes)) * self._cores_per_worker
+        return [node[(start + offset) % len(node)] for offset in range(self._cores_per_worker)]
+
+
+class ExplicitAffinity(AffinityPolicy):
+    """Cores given for each worker, reused in turn when there are more workers than core lists"""
+
+    def __init__(self, worker_cores: list):
+        """:param worker_cores: for each worker, a list of CPU numbers or a cpulist string, see parse_cpu_list()"""
+        super().__init__(nodes=[])
+        if not worker_cores:
+            raise ValueError("Explicit affinity needs at least one core list")
+        self._worker_cores = [
+            parse_cpu_list(cores) if isinstance(cores, str) else sorted(set(cores)) for cores in worker_cores
+        ]
+
+    def cores(self, worker_index: int) -> list:
+        return self._worker_cores[worker_index % len(self._worker_cores)]
+
+
+AFFINITY_POLICIES = ["none", "compact", "scatter", "explicit"]
+
+
+def create_affinity_policy(name: str, cores_per_worker: int = 1, worker_cores: list = None) -> AffinityPolicy:
+    """
+    :param name: one of AFFINITY_POLICIES
+    :param cores_per_worker: compact and scatter only: number of cores each worker may run on
+    :param worker_cores: explicit only: cores of each worker, see ExplicitAffinity
+    :return: None for "none", workers then run wherever the scheduler puts them
+    """
+    if name == "none":
+        return None
+    if name == "compact":
+        return CompactAffinity(cores_per_worker)
+    if name == "scatter":
+        return ScatterAffinity(cores_per_worker)
+    if name == "explicit":
+        return ExplicitAffinity(worker_cores)
+    raise ValueError(f"Unexpected affinity policy {name}")
@@ -0,0 +1,123 @@
+"""
+Adds or retires worker processes while ProcessManager.process() runs, following the load.
+"""
+import logging
+import threading
+from time import perf_counter_ns
+
+
+class AutoscaleSample:
+    """Load observed over one sampling interval"""
+
+    def __init__(self, worker_count: int, queue_depth: int, producer_blocked_ratio: float, utilization: float):
+        """
+        :param worker_count: live workers
+        :param queue_depth: batches waiting in the queue, None if the platform cannot tell
+        :param producer_blocked_ratio: fraction of the interval the producer spent waiting in put()
+        :param utilization: fraction of the interval workers spent processing messages, averaged over workers
+        """
+        self.worker_count = worker_count
+        self.queue_depth = queue_depth
+        self.producer_blocked_ratio = producer_blocked_ratio
+        self.utilization = utilization
+
+    def __repr__(self):
+        return (f"workers={self.worker_count} queue_depth={self.queue_depth} "
+                f"producer_blocked={self.producer_blocked_ratio:.2f} utilization={self.utilization:.2f}")
+
+
+class AutoscalePolicy:
+    """
+    Scale up when workers are busy and work is backing up, scale down when workers are idle.
+    A decision needs `hysteresis` consecutive samples agreeing, so short bursts do not cause flapping.
+    """
+
+    def __init__(self, min_workers: int = 1, max_workers: int = 4, interval_sec: float = 0.5,
+                 high_utilization: float = 0.8, low_utilization: float = 0.3, hysteresis: int = 3):
+        if not 1 <= min_workers <= max_workers:
+            raise ValueError(f"Expected 1 <= min_workers <= max_workers, got {min_workers} and {max_workers}")
+        if low_utilization >= high_utilization:
+            raise ValueError("low_utilization must be lower than high_utilization")
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.interval_sec = interval_sec
+        self.high_utilization = high_utilization
+        self.low_utilization = low_utilization
+        self.hysteresis = hysteresis
+        self._up_streak = 0
+        self._down_streak = 0
+
+    def clamp(self, worker_count: int) -> int:
+        return max(self.min_workers, min(self.max_workers, worker_count))
+
+    def decide(self, sample: AutoscaleSample) -> int:
+        """
+        :return: +1 to add a worker, -1 to retire one, 0 to keep things as they are
+        """
+        backlog = sample.producer_blocked_ratio > 0.5 or bool(sample.queue_depth)
+        under_pressure = sample.utilization >= self.high_utilization and backlog
+        idle = sample.utilization <= self.low_utilization and not backlog
+
+        self._up_streak = self._up_streak + 1 if under_pressure else 0
+        self._down_streak = self._down_streak + 1 if idle else 0
+
+        if self._up_streak >= self.hysteresis and sample.worker_count < self.max_workers:
+            self._up_streak = 0
+            return 1
+        if self._down_streak >= self.hysteresis and sample.worker_count > self.min_workers:
+            self._down_streak = 0
+            return -1
+        return 0
+
+
+class Autoscaler(threading.Thread):
+    """Samples the load of a ProcessManager run at regular intervals and applies the policy decisions"""
+
+    logger = logging.getLogger("Autoscaler")
+
+    def __init__(self, proc_mgr, consumer, policy: AutoscalePolicy):
+        super().__init__(name="Autoscaler", daemon=True)
+        self._proc_mgr = proc_mgr
+        self._consumer = consumer
+        self._policy = policy
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def run(self):
+        # pylint: disable=protected-access
+        stats = self._proc_mgr._worker_stats
+        enqueuer = self._proc_mgr._enqueuer
+        t_last = perf_counter_ns()
+        busy_last = [stats.get(slot, stats.BUSY_NS) for slot in range(stats.slot_count)]
+        wait_last = enqueuer.wait_ns
+
+        while not self._stop_event.wait(self._policy.interval_sec):
+            t_now = perf_counter_ns()
+            interval_ns = max(1, t_now - t_last)
+            busy_now = [stats.get(slot, stats.BUSY_NS) for slot in range(stats.slot_count)]
+            wait_now = enqueuer.wait_ns
+
+            live_slots = self._proc_mgr._live_worker_slots()
+            utilization = sum(busy_now[slot] - busy_last[slot] for slot in live_slots) / interval_ns
+            # busy and wait time are only credited once a batch or a put completes, possibly spanning
+            # several intervals: the interval which gets the credit may exceed 1
+            sample = AutoscaleSample(
+                worker_count=len(live_slots),
+                queue_depth=self._proc_mgr._queue_depth(),
+                producer_blocked_ratio=min(1.0, (wait_now - wait_last) / interval_ns),
+                utilization=min(1.0, utilization / max(1, len(live_slots))),
+            )
+            t_last, busy_last, wait_last = t_now, busy_now, wait_now
+
+            decision = self._policy.decide(sample)
+            if decision > 0:
+                self.logger.info("Scaling up: %s", sample)
+                self._proc_mgr._add_worker(self._consumer)
+            elif decision < 0:
+                self.logger.info("Scaling down: %s", sample)
+                self._proc_mgr._retire_worker()
+            else:
+                self.logger.debug("Keeping: %s", sample)
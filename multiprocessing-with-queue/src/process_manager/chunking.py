@@ -0,0 +1,46 @@
+"""
+Sizes the batches sent by producers from the observed service time, like guided scheduling.
+"""
+import math
+
+
+class AdaptiveChunking:
+    """
+    Each chunk is the smaller of two bounds, kept between min_chunk and max_chunk:
+
+    - guided: remaining messages / (guided_factor * workers), so chunks start large and shrink
+      as the producer nears its end, leaving no long chunk to finish once the others are done;
+    - service time: about target_chunk_sec of work, so short tasks travel in large chunks
+      which amortize the queue overhead, and long tasks in small ones.
+
+    Until a service time is observed, a producer which cannot tell its message count sends min_chunk.
+    """
+
+    def __init__(self, min_chunk: int = 1, max_chunk: int = 1024, target_chunk_sec: float = 0.05,
+                 guided_factor: float = 2.0):
+        if not 1 <= min_chunk <= max_chunk:
+            raise ValueError(f"Expected 1 <= min_chunk <= max_chunk, got {min_chunk} and {max_chunk}")
+        if target_chunk_sec <= 0:
+            raise ValueError(f"target_chunk_sec must be positive, got {target_chunk_sec}")
+        if guided_factor <= 0:
+            raise ValueError(f"guided_factor must be positive, got {guided_factor}")
+        self.min_chunk = min_chunk
+        self.max_chunk = max_chunk
+        self.target_chunk_sec = target_chunk_sec
+        self.guided_factor = guided_factor
+
+    def next_size(self, remaining: int, worker_count: int, service_ns: float) -> int:
+        """
+        :param remaining: messages the producer has yet to send, None if it cannot tell
+        :param worker_count: workers sharing the messages
+        :param service_ns: mean time to process a message, None until observed
+        :return: number of messages in the next chunk
+        """
+        size = self.max_chunk
+        if remaining is not None:
+            size = min(size, math.ceil(remaining / (self.guided_factor * max(worker_count, 1))))
+        if service_ns:
+            size = min(size, int(self.target_chunk_sec * 1e9 / service_ns))
+        elif remaining is None:
+            size = self.min_chunk
+        return max(self.min_chunk, size)
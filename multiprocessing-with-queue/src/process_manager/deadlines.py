@@ -0,0 +1,100 @@
+"""
+Per-message deadlines: messages which waited too long are skipped, runaway process_msg() calls are interrupted.
+"""
+import signal
+from contextlib import contextmanager
+
+
+class MsgTimeout(BaseException):
+    """
+    Raised inside a process_msg() call running past DeadlinePolicy.timeout_sec.
+    Not an Exception, so that consumers catching Exception do not swallow it.
+    """
+
+
+class DeadlinePolicy:
+    """
+    How long a message may wait and run.
+
+    A message which is not started within expire_sec of being produced is skipped: its result would come too late.
+    A message can carry its own expiry, in seconds, in its deadline_field: msg[deadline_field] for dict messages,
+    the attribute otherwise.
+
+    A process_msg() call running for longer than timeout_sec is interrupted by raising MsgTimeout in the worker,
+    or by cancelling it for an AsyncMsgConsumer. A call which still has not returned kill_grace_sec later,
+    stuck in native code for instance, gets its worker killed and replaced by the Supervisor, if supervised.
+    Either way the message is given up on, not redelivered.
+    """
+
+    def __init__(self, expire_sec: float = None, timeout_sec: float = None, kill_grace_sec: float = 1.0,
+                 deadline_field: str = "deadline_sec"):
+        """
+        :param expire_sec: skip messages not started within this time, None to only skip messages carrying an expiry
+        :param timeout_sec: interrupt process_msg() calls running longer, None to let them run
+        :param kill_grace_sec: supervised runs: kill workers still running a message this long after timeout_sec
+        :param deadline_field: field of a message holding its own expiry, overriding expire_sec
+        """
+        for name, value in (("expire_sec", expire_sec), ("timeout_sec", timeout_sec)):
+            if value is not None and value <= 0:
+                raise ValueError(f"{name} must be positive, got {value}")
+        if kill_grace_sec < 0:
+            raise ValueError(f"kill_grace_sec must be at least 0, got {kill_grace_sec}")
+        self.expire_sec = expire_sec
+        self.timeout_sec = timeout_sec
+        self.kill_grace_sec = kill_grace_sec
+        self.deadline_field = deadline_field
+
+    @property
+    def kill_after_ns(self) -> int:
+        """Supervised runs: running time after which a worker is killed, None if never"""
+        if self.timeout_sec is None:
+            return None
+        return int((self.timeout_sec + self.kill_grace_sec) * 1e9)
+
+    def expired(self, msg, enqueue_ns: int, now_ns: int) -> bool:
+        """
+        :param enqueue_ns: perf_counter_ns() when the producer yielded the message
+        :param now_ns: perf_counter_ns() when the message would start
+        """
+        if isinstance(msg, dict):
+            expire_sec = msg.get(self.deadline_field)
+        else:
+            expire_sec = getattr(msg, self.deadline_field, None)
+        if expire_sec is None:
+            expire_sec = self.expire_sec
+            if expire_sec is None:
+                return False
+        return now_ns - enqueue_ns > expire_sec * 1e9
+
+
+class DeadlineStats:
+    """What deadlines cost during a run"""
+
+    def __init__(self, expired: int = 0, timed_out: int = 0, killed: int = 0, wasted_ns: int = 0):
+        self.expired = expired  # messages skipped at dequeue
+        self.timed_out = timed_out  # messages given up on while processing, killed included
+        self.killed = killed  # workers killed and replaced because a message would not yield
+        self.wasted_ns = wasted_ns  # time spent processing messages which then timed out
+
+    def __repr__(self):
+        return (f"expired={self.expired} timed_out={self.timed_out} killed={self.killed} "
+                f"wasted_sec={self.wasted_ns / 1e9:.3f}")
+
+
+def _raise_timeout(_signum, _frame):
+    raise MsgTimeout()
+
+
+def install_alarm():
+    """Worker side, main thread only: let interrupt_after() interrupt the calling thread"""
+    signal.signal(signal.SIGALRM, _raise_timeout)
+
+
+@contextmanager
+def interrupt_after(timeout_sec: float):
+    """Raise MsgTimeout in the block once it has run for timeout_sec, see install_alarm()"""
+    signal.setitimer(signal.ITIMER_REAL, timeout_sec)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
@@ -0,0 +1,90 @@
+"""
+Policies choosing which worker channel a message is put on, for transports with one channel per worker.
+"""
+import zlib
+
+
+class DispatchPolicy:
+    """
+    Dispatch policy interface.
+
+    routed[i] counts the messages sent to worker i, completed[i] the messages worker i reported as processed:
+    the difference is the work outstanding on that worker.
+    """
+
+    def open(self, channel_count: int, completed):
+        """
+        :param channel_count: number of worker channels
+        :param completed: shared array of messages processed by each worker
+        """
+        self._channel_count = channel_count
+        self._completed = completed
+        self._routed = [0] * channel_count
+
+    def outstanding(self, index: int) -> int:
+        return self._routed[index] - self._completed[index]
+
+    def route(self, msg) -> int:
+        index = self._choose(msg)
+        self._routed[index] += 1
+        return index
+
+    def _choose(self, msg) -> int:
+        raise NotImplementedError()
+
+
+class RoundRobinDispatch(DispatchPolicy):
+    """Each worker in turn"""
+
+    def open(self, channel_count: int, completed):
+        super().open(channel_count, completed)
+        self._next_index = 0
+
+    def _choose(self, msg) -> int:
+        index = self._next_index
+        self._next_index = (index + 1) % self._channel_count
+        return index
+
+
+class LeastLoadedDispatch(DispatchPolicy):
+    """The worker with the fewest messages routed to it and not processed yet"""
+
+    def _choose(self, msg) -> int:
+        return min(range(self._channel_count), key=self.outstanding)
+
+
+class KeyHashDispatch(DispatchPolicy):
+    """
+    Messages with the same key always go to the same worker.
+    The key is msg[key] for dict messages, the key attribute for messages having one, the message itself otherwise.
+    """
+
+    def __init__(self, key: str = "msg_id"):
+        self._key = key
+
+    def _choose(self, msg) -> int:
+        if isinstance(msg, dict):
+            key = msg[self._key]
+        else:
+            key = getattr(msg, self._key, msg)
+        if isinstance(key, int):
+            return key % self._channel_count
+        # stable across processes and runs, unlike hash()
+        return zlib.crc32(str(key).encode()) % self._channel_count
+
+
+DISPATCH_POLICIES = ["round_robin", "least_loaded", "key_hash"]
+
+
+def create_dispatch_policy(name: str, key: str = "msg_id") -> DispatchPolicy:
+    """
+    :param name: one of DISPATCH_POLICIES
+    :param key: key_hash only: name of the message field to hash
+    """
+    if name == "round_robin":
+        return RoundRobinDispatch()
+    if name == "least_loaded":
+        return LeastLoadedDispatch()
+    if name == "key_hash":
+        return KeyHashDispatch(key)
+    raise ValueError(f"Unexpected dispatch policy {name}")
@@ -0,0 +1,25 @@
+class Envelope:
+    """
+    A user message together with the bookkeeping ProcessManager needs to track it across processes.
+    """
+
+    __slots__ = ("seq", "msg", "enqueue_ns", "priority")
+
+    def __init__(self, seq: int, msg, enqueue_ns: int = 0, priority: int = 0):
+        """
+        :param seq: submission order of the message, unique within a run
+        :param msg: user message, as yielded by the producer
+        :param enqueue_ns: perf_counter_ns() when the producer yielded the message, 0 if not traced
+        :param priority: lane of the message with a PriorityTransport, 0 otherwise
+        """
+        self.seq = seq
+        self.msg = msg
+        self.enqueue_ns = enqueue_ns
+        self.priority = priority
+
+    def __reduce__(self):
+        # cheaper to pickle than the default protocol for __slots__ classes
+        return Envelope, (self.seq, self.msg, self.enqueue_ns, self.priority)
+
+    def __repr__(self):
+        return f"Envelope(seq={self.seq}, msg={self.msg!r}, enqueue_ns={self.enqueue_ns}, priority={self.priority})"
@@ -5,10 +5,38 @@ class MsgProducer:
         """Yield all messages"""
         raise NotImplementedError()
 
+    def split(self, shard_count: int) -> list:
+        """
+        Optional, to run several producer processes from a single producer.
+        :return: shard_count producers which together yield the messages of this one
+        """
+        raise NotImplementedError()
+
+    def msg_count(self) -> int:
+        """Optional, lets adaptive chunking shrink chunks near the end: number of messages yield_msgs() yields"""
+        return None
+
 
 class MsgConsumer:
     """Message Consumer interface"""
 
     def process_msg(self, msg):
-        """Process a single message"""
+        """
+        Process a single message
+        :return: result, yielded by ProcessManager.process_iter()
+        """
+        raise NotImplementedError()
+
+
+class AsyncMsgConsumer:
+    """
+    Message Consumer interface for I/O-bound work:
+    each worker process runs an event loop with several messages in flight.
+    """
+
+    async def process_msg(self, msg):
+        """
+        Process a single message
+        :return: result, yielded by ProcessManager.process_iter()
+        """
         raise NotImplementedError()
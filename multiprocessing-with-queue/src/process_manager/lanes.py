@@ -0,0 +1,82 @@
+"""
+Order in which a worker tries the lanes of a PriorityTransport, lane 0 holding the most urgent messages.
+"""
+
+
+class LanePolicy:
+    """
+    strict: always the most urgent lane holding messages.
+    weighted: lanes holding messages are served in proportion to their weight, in a smooth round-robin.
+
+    Either way a lane holding messages which the worker has not served for aging_sec goes first,
+    so less urgent messages are not starved: each worker serves every lane at least once per aging_sec.
+    """
+
+    def __init__(self, priority_count: int = 2, mode: str = "strict", weights: list = None,
+                 aging_sec: float = 1.0):
+        """
+        :param priority_count: number of lanes
+        :param mode: one of LANE_MODES
+        :param weights: weighted only: weight of each lane, halving from lane to lane by default
+        :param aging_sec: serve a lane left waiting this long first, 0 to disable aging
+        """
+        if priority_count < 1:
+            raise ValueError(f"priority_count must be at least 1, got {priority_count}")
+        if mode not in LANE_MODES:
+            raise ValueError(f"Unexpected lane mode {mode}")
+        if weights is None:
+            weights = [1 << (priority_count - 1 - lane) for lane in range(priority_count)]
+        if len(weights) != priority_count or min(weights) <= 0:
+            raise ValueError(f"Expected {priority_count} positive weights, got {weights}")
+        self.priority_count = priority_count
+        self.mode = mode
+        self.weights = list(weights)
+        self.aging_sec = aging_sec
+
+    def scheduler(self) -> "LaneScheduler":
+        """Worker side: the scheduler state of a single worker"""
+        return LaneScheduler(self)
+
+
+class LaneScheduler:
+    """
+    Per-worker state of a LanePolicy. The worker tries lanes in order(), then reports the lane it got
+    messages from with served(), and the lanes it found empty with empty().
+    """
+
+    def __init__(self, policy: LanePolicy):
+        self._policy = policy
+        self._lanes = range(policy.priority_count)
+        self._last_served = None
+        # smooth weighted round-robin: the lane with the highest credit goes first
+        self._credits = [0] * policy.priority_count
+        self._total_weight = sum(policy.weights)
+
+    def order(self, now: float) -> list:
+        """:return: lane indexes, the first one to try first"""
+        if self._last_served is None:
+            self._last_served = [now] * self._policy.priority_count
+        if self._policy.mode == "strict":
+            order = list(self._lanes)
+        else:
+            for lane, weight in enumerate(self._policy.weights):
+                self._credits[lane] += weight
+            order = sorted(self._lanes, key=lambda lane: -self._credits[lane])
+        aging_sec = self._policy.aging_sec
+        if aging_sec:
+            overdue = [lane for lane in self._lanes if now - self._last_served[lane] >= aging_sec]
+            if overdue:
+                order = overdue + [lane for lane in order if lane not in overdue]
+        return order
+
+    def served(self, lane: int, now: float):
+        self._last_served[lane] = now
+        self._credits[lane] -= self._total_weight
+
+    def empty(self, lane: int, now: float):
+        """An empty lane is not waiting, and builds up no credit"""
+        self._last_served[lane] = now
+        self._credits[lane] = 0
+
+
+LANE_MODES = ["strict", "weighted"]
@@ -0,0 +1,82 @@
+"""
+Per-message latency histograms, recorded by each worker and merged by the parent process.
+"""
+from multiprocessing.context import BaseContext
+
+from src.perf import LatencyHistogram
+
+
+class LatencyRecorder:
+    """
+    Worker side: histograms kept in the worker's own memory while it runs, published once when it exits.
+    One set of histograms per message priority.
+    """
+
+    def __init__(self, priority_count: int = 1):
+        self.histograms = [[LatencyHistogram() for _ in LatencyStats.METRICS] for _ in range(priority_count)]
+
+    def record(self, enqueue_ns: int, dequeue_ns: int, start_ns: int, end_ns: int, priority: int = 0):
+        """
+        :param enqueue_ns: when the producer yielded the message
+        :param dequeue_ns: when the worker got the batch holding the message
+        :param start_ns: when the consumer started processing the message
+        :param end_ns: when the consumer was done with it
+        :param priority: priority lane of the message, see Envelope.priority
+        """
+        queue_wait, service, end_to_end = self.histograms[priority]
+        queue_wait.record(dequeue_ns - enqueue_ns)
+        service.record(end_ns - start_ns)
+        end_to_end.record(end_ns - enqueue_ns)
+
+
+class LatencyStats:
+    """
+    One set of histograms per worker slot and message priority, in shared memory.
+
+    Workers add their histograms to their own slot when they exit, so no lock is needed.
+    All timestamps come from perf_counter_ns(), which is system-wide on Linux.
+    """
+
+    # queue_wait: from the producer to a worker, batching included
+    # service: spent in consumer.process_msg()
+    # end_to_end: from the producer to the end of processing
+    METRICS = ("queue_wait", "service", "end_to_end")
+
+    def __init__(self, ctx: BaseContext, slot_count: int, priority_count: int = 1):
+        self._priority_size = len(self.METRICS) * LatencyHistogram.BUCKET_COUNT
+        self._slot_size = priority_count * self._priority_size
+        self._counts = ctx.Array("q", slot_count * self._slot_size, lock=False)
+        self._slot_count = slot_count
+        self._priority_count = priority_count
+
+    def publish(self, slot: int, recorder: LatencyRecorder):
+        """Worker side: add the recorder histograms to the specified slot"""
+        for priority, histograms in enumerate(recorder.histograms):
+            for metric_index, histogram in enumerate(histograms):
+                base = self._base(slot, priority, metric_index)
+                for index, count in enumerate(histogram.counts):
+                    if count:
+                        self._counts[base + index] += count
+
+    def merged(self) -> dict:
+        """Parent side: metric name -> LatencyHistogram of all slots and priorities"""
+        return self._merge(range(self._priority_count))
+
+    def merged_by_priority(self) -> list:
+        """Parent side: for each priority, metric name -> LatencyHistogram of all slots"""
+        return [self._merge([priority]) for priority in range(self._priority_count)]
+
+    def _merge(self, priorities) -> dict:
+        bucket_count = LatencyHistogram.BUCKET_COUNT
+        histograms = {}
+        for metric_index, metric in enumerate(self.METRICS):
+            histogram = LatencyHistogram()
+            for slot in range(self._slot_count):
+                for priority in priorities:
+                    base = self._base(slot, priority, metric_index)
+                    histogram.merge(LatencyHistogram(self._counts[base:base + bucket_count]))
+            histograms[metric] = histogram
+        return histograms
+
+    def _base(self, slot: int, priority: int, metric_index: int) -> int:
+        return slot * self._slot_size + priority * self._priority_size + metric_index * LatencyHistogram.BUCKET_COUNT
@@ -0,0 +1,189 @@
+"""
+Live metrics of a ProcessManager, in Prometheus text format, read from the shared memory counters of its runs.
+"""
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter_ns
+
+from .worker_stats import ProducerStats, WorkerStats
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MetricsExporter:
+    """
+    Publishes the metrics of the running ProcessManager on a local HTTP endpoint, GET /metrics,
+    and/or by rewriting a stats file every interval_sec.
+
+    Workers and producers only add to their own slot of shared memory counters, see WorkerStats and ProducerStats:
+    everything else happens in this process, when the metrics are read. Counters restart from 0 with each run.
+    """
+
+    logger = logging.getLogger("MetricsExporter")
+
+    def __init__(self, port: int = None, host: str = "127.0.0.1", stats_file: str = None, interval_sec: float = 1.0):
+        """
+        :param port: serve metrics on this port, 0 for any free port, None for no HTTP endpoint
+        :param host: address to listen on, local only by default
+        :param stats_file: rewrite this file with the metrics every interval_sec, None for no file
+        :param interval_sec: stats_file only: time between two rewrites
+        """
+        if port is None and stats_file is None:
+            raise ValueError("Expected a port, a stats file or both")
+        if interval_sec <= 0:
+            raise ValueError(f"interval_sec must be positive, got {interval_sec}")
+        self._port = port
+        self._host = host
+        self._stats_file = stats_file
+        self._interval_sec = interval_sec
+        self._proc_mgr = None
+        self._server = None
+        self._threads = []
+        self._stop_event = threading.Event()
+
+    @property
+    def address(self) -> tuple:
+        """(host, port) the HTTP endpoint listens on, None if not serving"""
+        if self._server is None:
+            return None
+        return self._server.server_address[:2]
+
+    def start(self, proc_mgr):
+        """Called by the ProcessManager"""
+        self._proc_mgr = proc_mgr
+        self._stop_event.clear()
+        if self._port is not None:
+            self._server = ThreadingHTTPServer((self._host, self._port), _handler(self))
+            self._server.daemon_threads = True
+            self._threads.append(threading.Thread(target=self._server.serve_forever, name="MetricsServer",
+                                                  daemon=True))
+            self.logger.info("Serving metrics on http://%s:%d/metrics", *self.address)
+        if self._stats_file is not None:
+            self._threads.append(threading.Thread(target=self._write_periodically, name="MetricsFile", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """Called by ProcessManager.close(): the stats file is rewritten a last time"""
+        self._stop_event.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def render(self) -> str:
+        """:return: current metrics in Prometheus text format"""
+        lines = []
+        for name, metric_type, help_text, samples in self._collect():
+            lines.append(f"# HELP process_manager_{name} {help_text}")
+            lines.append(f"# TYPE process_manager_{name} {metric_type}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{label}"' for key, label in labels.items())
+                lines.append(f"process_manager_{name}{{{label_text}}} {value}" if label_text
+                             else f"process_manager_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def _collect(self) -> list:
+        """:return: (name, type, help, [(labels, value)]) of each metric"""
+        # pylint: disable=protected-access
+        proc_mgr = self._proc_mgr
+        metrics = []
+        producer_stats = proc_mgr._producer_stats
+        if producer_stats is not None:
+            metrics += [
+                ("msgs_enqueued_total", "counter", "User messages put on the transport, per producer",
+                 _per_slot(producer_stats, "producer", ProducerStats.ENQUEUED)),
+                ("producer_blocked_seconds_total", "counter", "Time producers spent in put(), per producer",
+                 _per_slot(producer_stats, "producer", ProducerStats.WAIT_NS, 1e-9)),
+                ("put_retries_total", "counter", "put() attempts which timed out, per producer",
+                 _per_slot(producer_stats, "producer", ProducerStats.RETRIES)),
+            ]
+        worker_stats = proc_mgr._worker_stats
+        if worker_stats is not None:
+            metrics += [
+                ("msgs_processed_total", "counter", "Messages processed, per worker",
+                 _per_slot(worker_stats, "worker", WorkerStats.PROCESSED)),
+                ("worker_busy_seconds_total", "counter", "Time spent processing messages, per worker",
+                 _per_slot(worker_stats, "worker", WorkerStats.BUSY_NS, 1e-9)),
+                ("worker_idle_seconds_total", "counter", "Time spent waiting in get(), per worker",
+                 _per_slot(worker_stats, "worker", WorkerStats.WAIT_NS, 1e-9)),
+                ("worker_busy_ratio", "gauge", "Busy time over time since the worker started, per worker",
+                 _busy_ratios(worker_stats)),
+                ("get_retries_total", "counter", "get() attempts which timed out, per worker",
+                 _per_slot(worker_stats, "worker", WorkerStats.RETRIES)),
+                ("msgs_expired_total", "counter", "Messages skipped because they expired, per worker",
+                 _per_slot(worker_stats, "worker", WorkerStats.EXPIRED)),
+                ("msgs_timed_out_total", "counter", "Messages interrupted because they ran too long, per worker",
+                 _per_slot(worker_stats, "worker", WorkerStats.TIMED_OUT)),
+                ("workers", "gauge", "Live workers", [({}, len(proc_mgr._live_worker_slots()))]),
+            ]
+        metrics.append(("queue_depth", "gauge", "Batches waiting in each channel of the transport",
+                        _queue_depths(proc_mgr._transport)))
+        return metrics
+
+    def _write_periodically(self):
+        while not self._stop_event.wait(self._interval_sec):
+            self._write_file()
+        self._write_file()
+
+    def _write_file(self):
+        # readers never see a partial file
+        tmp_file = f"{self._stats_file}.tmp"
+        try:
+            with open(tmp_file, "w", encoding="utf-8") as stats_file:
+                stats_file.write(self.render())
+            os.replace(tmp_file, self._stats_file)
+        except OSError:
+            self.logger.exception("Cannot write %s", self._stats_file)
+
+
+def _per_slot(stats, label: str, field: int, scale: float = 1) -> list:
+    return [({label: slot}, stats.get(slot, field) * scale) for slot in range(stats.slot_count)]
+
+
+def _busy_ratios(worker_stats: WorkerStats) -> list:
+    now_ns = perf_counter_ns()
+    samples = []
+    for slot in range(worker_stats.slot_count):
+        first_get_ns = worker_stats.get(slot, WorkerStats.FIRST_GET_NS)
+        if first_get_ns and now_ns > first_get_ns:
+            ratio = worker_stats.get(slot, WorkerStats.BUSY_NS) / (now_ns - first_get_ns)
+            samples.append(({"worker": slot}, min(ratio, 1.0)))
+    return samples
+
+
+def _queue_depths(transport) -> list:
+    samples = []
+    for index in range(transport.channel_count):
+        try:
+            samples.append(({"channel": index}, transport.channel(index).qsize()))
+        except (AttributeError, NotImplementedError, OSError):
+            # pipes, and queues on platforms without sem_getvalue(), cannot tell
+            pass
+    return samples
+
+
+def _handler(exporter: MetricsExporter):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        """GET /metrics"""
+
+        def do_GET(self):  # pylint: disable=invalid-name
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = exporter.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            exporter.logger.debug(format, *args)
+
+    return MetricsHandler
@@ -2,24 +2,64 @@ import logging
 from multiprocessing import Queue
 
 from .msg_processor import MsgProcessor
+from .retry_policy import RetryPolicy
 
 
 class MsgDequeuer(MsgProcessor):
     logger = logging.getLogger("MsgDequeuer")
 
-    def __init__(self, timeout: float = 0, max_attempts: int = 1, wait_between_attempts: float = 0):
+    def __init__(self, timeout: float = 0, max_attempts: int = 1, wait_between_attempts: float = 0,
+                 retry_policy: RetryPolicy = None, log_sample_every: int = 1):
         """
         :param timeout: queue.get(): how long to wait before timing out
         :param max_attempts: how many times to retry on timeout
         :param wait_between_attempts: before trying another get() after timeout, wait these many seconds
+        :param retry_policy: backoff, jitter and deadline between attempts, see MsgProcessor
+        :param log_sample_every: debug level only: log one get() in every
         """
-        super().__init__(timeout, max_attempts, wait_between_attempts)
+        super().__init__(timeout, max_attempts, wait_between_attempts, retry_policy, log_sample_every)
 
-    def _process(self, msg_queue):
-        self.logger.debug("Trying to dequeue message")
-        msg_type, msg = msg_queue.get(block=True, timeout=self.timeout)
-        self.logger.debug("Dequeued %s %s", msg_type, msg)
+    def _process(self, msg_queue, timeout: float):
+        log = self._log_sampler()
+        if log:
+            self.logger.debug("Trying to dequeue message")
+        msg_type, msg = msg_queue.get(block=True, timeout=timeout)
+        if log:
+            self.logger.debug("Dequeued %s %s", msg_type, msg)
         return msg_type, msg
 
+    def _process_many(self, msg_queue, timeout: float):
+        log = self._log_sampler()
+        if log:
+            self.logger.debug("Trying to dequeue batch")
+        item = msg_queue.get(block=True, timeout=timeout)
+        if log:
+            self.logger.debug("Dequeued batch")
+        return item
+
     def get(self, msg_queue: Queue) -> (str, str):
-        return self._run_with_retry(self._process, msg_queue)
+        return self._run_with_retry(self._process, msg_queue, with_timeout=True)
+
+    def get_many(self, msg_queue: Queue) -> list:
+        """
+        Get a batch of messages put on the queue by MsgEnqueuer.put_many().
+        :return: list of (msg_type, msg) tuples,
+            a LeasedBatch if the batch came through shared memory: see ShmPayloadStore
+        """
+        return self._decode(self._run_with_retry(self._process_many, msg_queue, with_timeout=True))
+
+    def get_many_nowait(self, msg_queue: Queue) -> list:
+        """
+        Like get_many(), but raise queue.Empty straight away if no batch is available.
+        """
+        item = msg_queue.get(block=False)
+        if self._notify is not None:
+            self._notify.notify()
+        return self._decode(item)
+
+    def _decode(self, item) -> list:
+        if self._payload_store is not None:
+            item = self._payload_store.unpack(item)
+        if self._serializer is not None:
+            item = self._serializer.decode(item)
+        return item
@@ -2,23 +2,51 @@ import logging
 from multiprocessing import Queue
 
 from .msg_processor import MsgProcessor
+from .retry_policy import RetryPolicy
 
 
 class MsgEnqueuer(MsgProcessor):
     logger = logging.getLogger("MsgEnqueuer")
 
-    def __init__(self, timeout: float = 0, max_attempts: int = 1, wait_between_attempts: float = 0):
+    def __init__(self, timeout: float = 0, max_attempts: int = 1, wait_between_attempts: float = 0,
+                 retry_policy: RetryPolicy = None, log_sample_every: int = 1):
         """
         :param timeout: queue.put(): how long to wait before timing out
         :param max_attempts: how many times to retry on timeout
         :param wait_between_attempts: before trying another put() after timeout, wait these many seconds
+        :param retry_policy: backoff, jitter and deadline between attempts, see MsgProcessor
+        :param log_sample_every: debug level only: log one put() in every
         """
-        super().__init__(timeout, max_attempts, wait_between_attempts)
+        super().__init__(timeout, max_attempts, wait_between_attempts, retry_policy, log_sample_every)
 
-    def _process(self, msg_queue, msg_type, msg):
-        self.logger.debug("Trying to enqueue %s %s", msg_type, msg)
-        msg_queue.put((msg_type, msg), block=True, timeout=self.timeout)
-        self.logger.debug("Enqueued %s %s", msg_type, msg)
+    def _process(self, msg_queue, msg_type, msg, timeout: float):
+        log = self._log_sampler()
+        if log:
+            self.logger.debug("Trying to enqueue %s %s", msg_type, msg)
+        msg_queue.put((msg_type, msg), block=True, timeout=timeout)
+        if log:
+            self.logger.debug("Enqueued %s %s", msg_type, msg)
+
+    def _process_many(self, msg_queue, item, msg_count: int, timeout: float):
+        log = self._log_sampler()
+        if log:
+            self.logger.debug("Trying to enqueue batch of %d messages", msg_count)
+        msg_queue.put(item, block=True, timeout=timeout)
+        if log:
+            self.logger.debug("Enqueued batch of %d messages", msg_count)
 
     def put(self, msg_queue: Queue, msg_type: str, msg: str):
-        return self._run_with_retry(self._process, msg_queue, msg_type, msg)
+        return self._run_with_retry(self._process, msg_queue, msg_type, msg, with_timeout=True)
+
+    def put_many(self, msg_queue: Queue, msgs: list):
+        """
+        Put a batch of messages on the queue as a single queue item.
+        :param msg_queue: destination queue, must be read with MsgDequeuer.get_many()
+        :param msgs: list of (msg_type, msg) tuples
+        """
+        item = msgs
+        if self._serializer is not None:
+            item = self._serializer.encode(item)
+        if self._payload_store is not None:
+            item = self._payload_store.pack(item)
+        return self._run_with_retry(self._process_many, msg_queue, item, len(msgs), with_timeout=True)
@@ -1,20 +1,39 @@
 import logging
 import queue
 import time
+from time import perf_counter_ns
+
+from src.log import LogSampler
+from .retry_policy import QueueNotifier, RetryPolicy
+from .serializers import Serializer
+from .shm_payloads import ShmPayloadStore
 
 
 class MsgProcessor:
     logger = logging.getLogger()
 
-    def __init__(self, timeout: float = 0, max_attempts: int = 1, wait_between_attempts: float = 0):
+    def __init__(self, timeout: float = 0, max_attempts: int = 1, wait_between_attempts: float = 0,
+                 retry_policy: RetryPolicy = None, log_sample_every: int = 1):
         """
         :param timeout: how long to wait before timing out
         :param max_attempts: how many times to retry on timeout
         :param wait_between_attempts: before trying another put() after timeout, wait these many seconds
+        :param retry_policy: backoff, jitter and deadline between attempts, overrides max_attempts and
+            wait_between_attempts. Defaults to a fixed wait_between_attempts, max_attempts times.
+        :param log_sample_every: debug level only: log one put() or get() in every
         """
         self._timeout = timeout
-        self._max_attempts = max_attempts
-        self._wait_between_attempts = wait_between_attempts
+        self._retry_policy = retry_policy if retry_policy is not None else RetryPolicy(
+            max_attempts=max_attempts, wait_sec=wait_between_attempts, multiplier=1.0)
+        self._wake_on = None
+        self._notify = None
+        self._payload_store = None
+        self._serializer = None
+        self._wait_ns = 0
+        self._timeout_count = 0
+        self._stats = None
+        self._stats_slot = 0
+        self._log_sampler = LogSampler(self.logger, log_sample_every)
 
     @property
     def timeout(self):
@@ -22,33 +41,90 @@ class MsgProcessor:
 
     @property
     def max_attempts(self):
-        return self._max_attempts
+        return self._retry_policy.max_attempts
 
     @property
     def wait_between_attempts(self):
-        return self._wait_between_attempts
+        return self._retry_policy.wait_sec
 
-    def _run_with_retry(self, func, *args, **kwargs):
-        attempts: int = 0
+    @property
+    def retry_policy(self) -> RetryPolicy:
+        return self._retry_policy
 
-        while attempts < self.max_attempts:
-            try:
-                attempts += 1
-                return func(*args, **kwargs)
-            except TimeoutError as ex:
-                self.logger.error("TimeoutError: %s Attempts: %d", ex, attempts)
-                if attempts >= self.max_attempts:
-                    raise
+    @property
+    def wait_ns(self) -> int:
+        """Total time spent in put() or get() calls, retries included, in this process"""
+        return self._wait_ns
 
-            except queue.Full as ex:
-                self.logger.error("Queue Full: %s Attempts: %d", ex, attempts)
-                if attempts >= self.max_attempts:
-                    raise
+    @property
+    def timeout_count(self) -> int:
+        """Number of put() or get() calls which timed out, in this process"""
+        return self._timeout_count
+
+    def attach_notifiers(self, wake_on: QueueNotifier, notify: QueueNotifier):
+        """
+        Wait on wake_on rather than sleep between attempts, so the next attempt starts as soon as the queue
+        changes state. Signal notify after each successful call, to wake up the other side.
+        """
+        self._wake_on = wake_on
+        self._notify = notify
 
-            except queue.Empty as ex:
-                self.logger.error("Queue Empty: %s Attempts: %d", ex, attempts)
-                if attempts >= self.max_attempts:
+    def publish_to(self, stats, slot: int):
+        """
+        Also add the time spent in calls and the timed out attempts of this process to shared memory counters,
+        so other processes can read them while this one runs.
+        :param stats: WorkerStats or ProducerStats, None to stop publishing
+        :param slot: slot of the calling process in stats
+        """
+        self._stats = stats
+        self._stats_slot = slot
+
+    def attach_payload_store(self, payload_store: ShmPayloadStore):
+        """Move large payloads of batches through shared memory rather than through the queue"""
+        self._payload_store = payload_store
+
+    def attach_serializer(self, serializer: Serializer):
+        """Encode batches with serializer rather than let the queue pickle them as they are"""
+        self._serializer = serializer
+
+    def _run_with_retry(self, func, *args, with_timeout: bool = False, **kwargs):
+        """
+        :param with_timeout: pass the timeout of each attempt to func as its timeout keyword argument,
+            shortened to end by the deadline of the retry policy
+        """
+        t_start = perf_counter_ns()
+        try:
+            result = self._run_attempts(func, args, kwargs, with_timeout)
+        finally:
+            wait_ns = perf_counter_ns() - t_start
+            self._wait_ns += wait_ns
+            if self._stats is not None:
+                self._stats.add(self._stats_slot, self._stats.WAIT_NS, wait_ns)
+        if self._notify is not None:
+            self._notify.notify()
+        return result
+
+    def _run_attempts(self, func, args: tuple, kwargs: dict, with_timeout: bool):
+        budget = self._retry_policy.start()
+
+        while True:
+            try:
+                budget.attempts += 1
+                if with_timeout:
+                    kwargs["timeout"] = budget.limit(self.timeout)
+                return func(*args, **kwargs)
+            except (TimeoutError, queue.Full, queue.Empty) as ex:
+                self._timeout_count += 1
+                if self._stats is not None:
+                    self._stats.add(self._stats_slot, self._stats.RETRIES, 1)
+                if budget.exhausted():
+                    self.logger.error("%s: giving up after %d attempts", type(ex).__name__, budget.attempts)
                     raise
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug("%s: %s Attempts: %d", type(ex).__name__, ex, budget.attempts)
 
-            if attempts < self.max_attempts:
-                time.sleep(self.wait_between_attempts)
+            wait_sec = budget.next_wait()
+            if self._wake_on is not None:
+                self._wake_on.wait(wait_sec)
+            else:
+                time.sleep(wait_sec)
@@ -0,0 +1,8 @@
+"""
+Message type codes travelling with each message. Integers pickle and compare cheaper than strings.
+"""
+
+MSG_TYPE_USER: int = 0
+MSG_TYPE_QUIT: int = 1
+MSG_TYPE_END_RUN: int = 2
+MSG_TYPE_RETIRE: int = 3
@@ -1,13 +1,34 @@
 """
 Connects a message source and a number of message sinks through a queue.
 """
+import asyncio
 import logging
-from multiprocessing import Queue, Process
+import multiprocessing
+import queue
+import threading
+from contextlib import nullcontext
+from multiprocessing import Queue
+from multiprocessing.context import BaseContext
+from time import perf_counter, perf_counter_ns
 
-from src.log import log_setup
-from .interfaces import MsgProducer, MsgConsumer
+from src.log import LogQueue, LogSampler, log_setup
+from . import msg_types
+from .affinity import AffinityPolicy, current_cpu
+from .autoscaler import Autoscaler, AutoscalePolicy
+from .chunking import AdaptiveChunking
+from .deadlines import DeadlinePolicy, DeadlineStats, MsgTimeout, install_alarm, interrupt_after
+from .envelope import Envelope
+from .latency_stats import LatencyRecorder, LatencyStats
+from .metrics import MetricsExporter
+from .interfaces import AsyncMsgConsumer, MsgProducer, MsgConsumer
 from .msg_dequeuer import MsgDequeuer
 from .msg_enqueuer import MsgEnqueuer
+from .retry_policy import QueueNotifier
+from .serializers import Serializer
+from .shm_payloads import PayloadLease, ShmPayloadStore
+from .supervisor import AckLog, InFlightLedger, SupervisePolicy, Supervisor, SupervisorStats
+from .transports import QueueTransport, Transport
+from .worker_stats import ProducerStats, WorkerStats
 
 
 class ProcessManager:
@@ -15,69 +36,1192 @@ class ProcessManager:
     Connects a message source and a number of message sinks through a queue.
     """
 
-    MSG_TYPE_USER: str = "USER"
-    MSG_TYPE_QUIT: str = "QUIT"
+    MSG_TYPE_USER: int = msg_types.MSG_TYPE_USER
+    MSG_TYPE_QUIT: int = msg_types.MSG_TYPE_QUIT
+    MSG_TYPE_END_RUN: int = msg_types.MSG_TYPE_END_RUN
+    MSG_TYPE_RETIRE: int = msg_types.MSG_TYPE_RETIRE
+
+    SHUTDOWN_DRAIN: str = "drain"
+    SHUTDOWN_ABORT: str = "abort"
 
     logger = logging.getLogger("ProcessManager")
 
-    def __init__(self, enqueuer: MsgEnqueuer, dequeuer: MsgDequeuer, queue_max_size: int = 2):
-        self._q = Queue(queue_max_size)
+    def __init__(self, enqueuer: MsgEnqueuer, dequeuer: MsgDequeuer, queue_max_size: int = 2,
+                 batch_size: int = 1, batch_linger_sec: float = 0, transport: Transport = None,
+                 result_batch_size: int = 16, result_linger_sec: float = 0.01,
+                 start_method: str = None, forkserver_preload: list = None, async_max_in_flight: int = 64,
+                 consumer_threads: int = 1, autoscale: AutoscalePolicy = None, wake_on_state_change: bool = False,
+                 trace_latency: bool = False, large_payload_threshold: int = None, serializer: Serializer = None,
+                 central_logging: bool = False, log_sample_every: int = 1, chunking: AdaptiveChunking = None,
+                 affinity: AffinityPolicy = None, supervise: SupervisePolicy = None, deadlines: DeadlinePolicy = None,
+                 metrics: MetricsExporter = None):
+        """
+        :param enqueuer: puts messages on the queue
+        :param dequeuer: gets messages from the queue
+        :param queue_max_size: maximum number of batches the queue can hold at any given time
+        :param batch_size: maximum number of messages travelling together as a single queue item
+        :param batch_linger_sec: flush a partial batch once its oldest message is this old (0: wait for a full batch)
+        :param transport: how messages reach the workers, defaults to a multiprocessing.Queue of queue_max_size
+        :param result_batch_size: process_iter() only: number of results a worker sends back as a single queue item
+        :param result_linger_sec: process_iter() only: send back partial result batches once they are this old
+        :param start_method: "fork", "spawn" or "forkserver", platform default if None.
+            A transport passed in must be created with the same context, see create_transport().
+        :param forkserver_preload: forkserver only: modules the fork server imports once, before forking workers
+        :param async_max_in_flight: AsyncMsgConsumer only: messages processed concurrently by each worker
+        :param consumer_threads: MsgConsumer only: threads processing messages in each worker,
+            sharing the consumer object, which must then be thread-safe
+        :param autoscale: process() only: add or retire workers during the run, following the load.
+            Requires a transport with a shared channel.
+        :param wake_on_state_change: between two attempts, a producer blocked on a full queue resumes as soon as
+            a worker gets a batch, and a worker blocked on an empty queue as soon as the producer puts one,
+            rather than when the wait of their retry policy is over
+        :param trace_latency: timestamp each message, see latency_histograms
+        :param large_payload_threshold: bytes and other buffers of at least this size travel through shared memory
+            rather than through the transport, see ShmPayloadStore. None to pickle everything into the transport.
+        :param serializer: how batches are encoded for the transport, see create_serializer().
+            Defaults to the transport pickling them as they are.
+        :param central_logging: workers and producer processes send their log records to a listener thread
+            in this process rather than each writing to stderr, see LogQueue. Stopped by close().
+        :param log_sample_every: debug level only: workers log one message in every
+        :param chunking: size batches from the observed service time and the messages left, see AdaptiveChunking.
+            batch_size is then ignored.
+        :param affinity: pin each worker to the cores chosen by this policy, see create_affinity_policy().
+            None to let the scheduler move workers around.
+        :param supervise: process() only: replace workers which die and redeliver the messages they did not
+            process, see Supervisor. Requires a single producer and a MsgConsumer with a single thread,
+            cannot be combined with autoscale.
+        :param deadlines: skip messages which waited too long and interrupt those which run too long,
+            see DeadlinePolicy and deadline_stats. Workers overrunning timeouts are only killed when supervised.
+            Interrupting a MsgConsumer relies on SIGALRM, timeouts cannot be combined with consumer_threads.
+        :param metrics: publish live metrics of the runs, started right away and stopped by close().
+            Producers and workers then also count their put() and get() time and retries in shared memory.
+        """
+        if batch_size < 1:
+            raise ValueError(f"batch_size must be at least 1, got {batch_size}")
+        if consumer_threads < 1:
+            raise ValueError(f"consumer_threads must be at least 1, got {consumer_threads}")
+        if supervise is not None and (autoscale is not None or consumer_threads > 1):
+            raise ValueError("supervise cannot be combined with autoscale or consumer_threads")
+        if deadlines is not None and deadlines.timeout_sec is not None and consumer_threads > 1:
+            raise ValueError("Message timeouts cannot be combined with consumer_threads")
+        self._ctx = multiprocessing.get_context(start_method)
+        if forkserver_preload and self._ctx.get_start_method() == "forkserver":
+            self._ctx.set_forkserver_preload(list(forkserver_preload))
+        self._transport = transport if transport is not None else QueueTransport(queue_max_size, self._ctx)
         self._enqueuer = enqueuer
         self._dequeuer = dequeuer
+        if wake_on_state_change:
+            space, data = QueueNotifier(self._ctx), QueueNotifier(self._ctx)
+            enqueuer.attach_notifiers(wake_on=space, notify=data)
+            dequeuer.attach_notifiers(wake_on=data, notify=space)
+        if serializer is not None:
+            if serializer.binary and large_payload_threshold is not None:
+                raise ValueError("large_payload_threshold requires batches pickled by the transport")
+            enqueuer.attach_serializer(serializer)
+            dequeuer.attach_serializer(serializer)
+        self._payload_store = None
+        if large_payload_threshold is not None:
+            self._payload_store = ShmPayloadStore(self._ctx, large_payload_threshold)
+            enqueuer.attach_payload_store(self._payload_store)
+            dequeuer.attach_payload_store(self._payload_store)
+        self._batch_size = batch_size
+        self._chunking = chunking
+        self._run_worker_count = 1
+        self._batch_linger_sec = batch_linger_sec
+        self._result_batch_size = result_batch_size
+        self._result_linger_sec = result_linger_sec
+        self._async_max_in_flight = async_max_in_flight
+        self._consumer_threads = consumer_threads
+        self._autoscale = autoscale
+        self._trace_latency = trace_latency
+        self._affinity = affinity
+        self._supervise = supervise
+        self._deadlines = deadlines
+        # workers acknowledge batches so the ledger of a supervised run can forget them
+        self._acks = self._ctx.Queue() if supervise is not None else None
+        self._ledger = None
+        self._ack_log = None
+        self._supervisor_stats = None
+        self._results = None
+        self._workers = []
+        self._slot_workers = []
+        self._worker_start_ns = []
+        self._worker_stats = None
+        self._latency_stats = None
+        self._latency_recorder = None
+        # set by shutdown(): producers stop, and with abort workers skip the messages still queued
+        self._stop_event = self._ctx.Event()
+        self._abort_event = self._ctx.Event()
+        self._shutdown_start = None
+        self._shutdown_sec = None
         self._log_level = self.logger.getEffectiveLevel()
+        self._log_sample_every = log_sample_every
+        self._log_sampler = LogSampler(self.logger, log_sample_every)
+        self._log_queue = None
+        if central_logging:
+            self._log_queue = LogQueue(self._ctx)
+            self._log_queue.start()
+        self._producer_stats = None
+        self._producer_slot = 0
+        self._publish_metrics = metrics is not None
+        self._metrics = metrics
+        if metrics is not None:
+            metrics.start(self)
+
+    @property
+    def context(self) -> BaseContext:
+        """multiprocessing context workers are started with"""
+        return self._ctx
+
+    @property
+    def startup_latencies_ns(self) -> list:
+        """
+        For each worker of the last run: time from Process.start() to its first get() from the queue,
+        None if the worker never got that far. With autoscaling, the last worker started in each slot.
+        """
+        latencies = []
+        for slot, start_ns in enumerate(self._worker_start_ns):
+            if start_ns is None:
+                continue
+            first_get_ns = self._worker_stats.get(slot, WorkerStats.FIRST_GET_NS)
+            latencies.append(first_get_ns - start_ns if first_get_ns else None)
+        return latencies
+
+    @property
+    def worker_stats(self) -> WorkerStats:
+        """Per-worker counters of the last run"""
+        return self._worker_stats
+
+    @property
+    def worker_cpus(self) -> list:
+        """
+        For each worker slot of the last run: CPU the worker last ran on, when it started or when it exited,
+        None if the worker never got that far or the platform does not tell
+        """
+        cpus = [self._worker_stats.get(slot, WorkerStats.CPU) for slot in range(self._worker_stats.slot_count)]
+        return [cpu - 1 if cpu else None for cpu in cpus]
+
+    @property
+    def supervisor_stats(self) -> SupervisorStats:
+        """supervise only: workers replaced and messages redelivered during the last run"""
+        return self._supervisor_stats
+
+    @property
+    def deadline_stats(self) -> DeadlineStats:
+        """deadlines only: messages expired or timed out during the last run, not counted for WorkerPool runs"""
+        if self._deadlines is None or self._worker_stats is None:
+            return None
+        worker_stats = self._worker_stats
+        stats = DeadlineStats(
+            expired=worker_stats.total(WorkerStats.EXPIRED),
+            timed_out=worker_stats.total(WorkerStats.TIMED_OUT),
+            wasted_ns=worker_stats.total(WorkerStats.WASTED_NS),
+        )
+        if self._supervisor_stats is not None:
+            stats.timed_out += self._supervisor_stats.timed_out
+            stats.killed = self._supervisor_stats.killed
+            stats.wasted_ns += self._supervisor_stats.wasted_ns
+        return stats
+
+    @property
+    def shutdown_sec(self) -> float:
+        """
+        Last run: time from the end of production, or from the shutdown() call, until every worker exited.
+        None until a run ends.
+        """
+        return self._shutdown_sec
+
+    @property
+    def latency_histograms(self) -> dict:
+        """
+        trace_latency only: per-message latency of the last run, merged across workers,
+        as LatencyStats.METRICS name -> LatencyHistogram. None without tracing.
+        """
+        if self._latency_stats is None:
+            return None
+        return self._latency_stats.merged()
+
+    @property
+    def latency_histograms_by_priority(self) -> list:
+        """trace_latency only: like latency_histograms, one dict per priority lane, see Transport.priority_count"""
+        if self._latency_stats is None:
+            return None
+        return self._latency_stats.merged_by_priority()
 
-    def process(self, producer: MsgProducer, consumer: MsgConsumer, consumer_count: int):
+    def shutdown(self, mode: str = SHUTDOWN_DRAIN):
         """
-        :param producer: single source of messages
+        Stop the current run early, from another thread. Producers stop after their current message.
+        :param mode: SHUTDOWN_DRAIN: workers process the messages already queued, then exit.
+            SHUTDOWN_ABORT: workers skip the messages still queued, exiting once done with their current one.
+            process_iter() yields no result for skipped messages.
+        """
+        if mode not in (self.SHUTDOWN_DRAIN, self.SHUTDOWN_ABORT):
+            raise ValueError(f"Unexpected shutdown mode {mode}")
+        if self._shutdown_start is None:
+            self._shutdown_start = perf_counter()
+        if mode == self.SHUTDOWN_ABORT:
+            self._abort_event.set()
+        self._stop_event.set()
+
+    def process(self, producer, consumer: MsgConsumer, consumer_count: int, producer_count: int = 1):
+        """
+        :param producer: source of messages, or list of MsgProducer each running in its own process
+        :param consumer: processes one message at a time
+        :param consumer_count: number of consumer processes to instantiate, initially if autoscaling
+        :param producer_count: split a single producer into these many shards with MsgProducer.split(),
+            each running in its own process. Autoscaling then only sees the queue depth, not producer blocked time.
+        """
+        self._results = None
+        producers = self._producers(producer, producer_count)
+        autoscaler = None
+        if self._autoscale is not None:
+            if not self._transport.shared:
+                raise ValueError("Autoscaling requires a transport with a shared channel")
+            consumer_count = self._autoscale.clamp(consumer_count)
+            autoscaler = Autoscaler(self, consumer, self._autoscale)
+        supervisor = None
+        if self._supervise is not None:
+            if len(producers) > 1 or isinstance(consumer, AsyncMsgConsumer):
+                raise ValueError("Supervision requires a single producer and a MsgConsumer")
+            self._ledger = InFlightLedger()
+            self._ack_log = AckLog(self._ctx, consumer_count, self._supervise.ack_batch_size)
+            supervisor = Supervisor(self, consumer, self._supervise, self._ledger, self._acks)
+            self._supervisor_stats = supervisor.stats
+
+        self._begin_run(consumer_count)
+        self._start_workers(consumer, consumer_count)
+        if autoscaler is not None:
+            autoscaler.start()
+        if supervisor is not None:
+            supervisor.start()
+        try:
+            msg_count = self._produce(producers)
+            if supervisor is not None:
+                # redelivered messages must not end up behind the QUIT sentinels
+                supervisor.wait_completed(msg_count)
+        finally:
+            if autoscaler is not None:
+                autoscaler.stop()
+            if supervisor is not None:
+                supervisor.stop()
+                self._ledger = None
+            # consumers stop once every producer is done, even if one of them failed
+            self._enqueue_quit()
+            self._join_workers(self._workers)
+            self._end_shutdown()
+
+        self.logger.debug("end")
+
+    def process_iter(self, producer, consumer: MsgConsumer, consumer_count: int,
+                     ordered: bool = False, reorder_buffer_size: int = 1024, producer_count: int = 1):
+        """
+        Like process(), but yield the value returned by consumer.process_msg() for each message.
+        Messages expired or timed out, see DeadlinePolicy, yield nothing.
+
+        :param producer: source of messages, or list of MsgProducer each running in its own process
         :param consumer: processes one message at a time
         :param consumer_count: number of consumer processes to instantiate
+        :param ordered: single producer only: yield results in submission order rather than in completion order
+        :param reorder_buffer_size: ordered only: maximum number of messages submitted but not yielded yet
+        :param producer_count: split a single producer into these many shards, see process()
+        """
+        if self._supervise is not None:
+            raise ValueError("Supervision only applies to process()")
+        producers = self._producers(producer, producer_count)
+        if ordered and len(producers) > 1:
+            raise ValueError("Results of several producers cannot be ordered")
+        self._results = self._ctx.Queue()
+        self._begin_run(consumer_count)
+        workers = self._start_workers(consumer, consumer_count)
+
+        # producers run from a background thread, so results can be yielded while messages are enqueued
+        throttle = _Throttle(reorder_buffer_size) if ordered else None
+        feeder = _Feeder(self, producers, throttle)
+        feeder.start()
+
+        reorder_buffer = {}
+        next_seq = 0
+        received = 0
+        try:
+            while not feeder.finished or received < feeder.msg_count:
+                try:
+                    result_batch = self._results.get(timeout=0.1)
+                except queue.Empty:
+                    if not feeder.is_alive() and not any(worker.is_alive() for worker in workers):
+                        break
+                    continue
+                received += len(result_batch)
+                if not ordered:
+                    for _, result in result_batch:
+                        if not isinstance(result, _GivenUp):
+                            yield result
+                    continue
+                reorder_buffer.update(result_batch)
+                while next_seq in reorder_buffer:
+                    result = reorder_buffer.pop(next_seq)
+                    if not isinstance(result, _GivenUp):
+                        yield result
+                    next_seq += 1
+                    throttle.release()
+        finally:
+            # also reached when the caller stops iterating early: let everything run to completion
+            if throttle is not None:
+                throttle.disable()
+            while feeder.is_alive() or any(worker.is_alive() for worker in workers):
+                try:
+                    self._results.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            feeder.join()
+            self._join_workers(workers)
+            self._end_shutdown()
+            self._results = None
+
+        if feeder.error is not None:
+            raise feeder.error
+        if received < feeder.msg_count and not self._abort_event.is_set():
+            raise RuntimeError(f"Received {received} results out of {feeder.msg_count} messages")
+
+        self.logger.debug("end")
+
+    def close(self):
         """
-        # create worker pool
-        workers = []
-        for worker_index in range(consumer_count):
-            self.logger.debug("Creating worker process %d", worker_index)
-            worker_process = Process(target=self._dequeue_and_process_msg, args=(consumer,))
-            workers.append(worker_process)
-            worker_process.start()
+        Release the resources held by the transport, the shared memory of large payloads, the log listener
+        and the metrics exporter
+        """
+        if self._metrics is not None:
+            self._metrics.stop()
+            self._metrics = None
+        self._transport.close()
+        if self._payload_store is not None:
+            self._payload_store.close()
+        if self._log_queue is not None:
+            self._log_queue.stop()
+
+    def __getstate__(self):
+        # workers do not need the parent's Process objects, which cannot be pickled anyway
+        state = self.__dict__.copy()
+        state["_workers"] = []
+        state["_slot_workers"] = []
+        state["_ledger"] = None
+        state["_metrics"] = None
+        return state
 
-        # put all messages from the producer on the queue
-        for msg in producer.yield_msgs():
-            self._enqueuer.put(self._q, self.MSG_TYPE_USER, msg)
+    def _start_workers(self, consumer: MsgConsumer, consumer_count: int) -> list:
+        self._transport.open(consumer_count)
 
-        # lastly, put the QUIT message on the queue to signal no more user messages
-        self._enqueuer.put(self._q, self.MSG_TYPE_QUIT, "")
+        slot_count = max(consumer_count, self._autoscale.max_workers if self._autoscale is not None else 0)
+        self._worker_stats = WorkerStats(self._ctx, slot_count)
+        self._latency_stats = None
+        if self._trace_latency:
+            self._latency_stats = LatencyStats(self._ctx, slot_count, self._transport.priority_count)
+        self._worker_start_ns = [None] * slot_count
+        self._slot_workers = [None] * slot_count
+        self._workers = []
+        for _ in range(consumer_count):
+            self._add_worker(consumer)
+        return self._workers
 
-        # wait for all dequeuer processes to terminate
+    def _add_worker(self, consumer: MsgConsumer):
+        """Start a worker in the first free slot, keeping the counters of a worker retired from it"""
+        slot = next(slot for slot, worker in enumerate(self._slot_workers) if worker is None or not worker.is_alive())
+        self._worker_stats.reset_process(slot)
+        self._worker_stats.set(slot, WorkerStats.RETIRE, 0)
+        self._worker_start_ns[slot] = perf_counter_ns()
+        worker = self._start_worker(consumer, slot)
+        self._slot_workers[slot] = worker
+        self._workers.append(worker)
+
+    def _respawn_worker(self, consumer: MsgConsumer, slot: int):
+        """Start a worker in place of the dead one in the slot, keeping the counters of the slot"""
+        self._worker_stats.reset_process(slot)
+        self._worker_start_ns[slot] = perf_counter_ns()
+        worker = self._start_worker(consumer, slot)
+        self._slot_workers[slot] = worker
+        self._workers.append(worker)
+
+    def _retire_worker(self):
+        """Ask the live worker in the highest slot to exit once done with its current batch"""
+        slot = self._live_worker_slots()[-1]
+        self._worker_stats.set(slot, WorkerStats.RETIRE, 1)
+
+    def _live_worker_slots(self) -> list:
+        return [
+            slot for slot, worker in enumerate(self._slot_workers)
+            if worker is not None and worker.is_alive() and not self._worker_stats.get(slot, WorkerStats.RETIRE)
+        ]
+
+    def _queue_depth(self) -> int:
+        """Number of batches waiting in the shared channels, None if they cannot tell"""
+        try:
+            return sum(self._transport.channel(index).qsize() for index in range(self._transport.channel_count))
+        except (AttributeError, NotImplementedError):
+            return None
+
+    def _start_worker(self, consumer: MsgConsumer, worker_index: int, control=None):
+        self.logger.debug("Creating worker process %d", worker_index)
+        worker_process = self._ctx.Process(target=self._dequeue_and_process_msg,
+                                           args=(consumer, worker_index, control))
+        worker_process.start()
+        return worker_process
+
+    def _join_workers(self, workers: list):
         for worker_process in workers:
             self.logger.debug("Joining worker process %d", worker_process.pid)
             worker_process.join()
 
+    @staticmethod
+    def _producers(producer, producer_count: int) -> list:
+        if isinstance(producer, (list, tuple)):
+            if not producer:
+                raise ValueError("At least one producer is needed")
+            if producer_count != 1:
+                raise ValueError("producer_count only applies to a single producer")
+            return list(producer)
+        if producer_count < 1:
+            raise ValueError(f"producer_count must be at least 1, got {producer_count}")
+        if producer_count == 1:
+            return [producer]
+        return producer.split(producer_count)
+
+    def _produce(self, producers: list, throttle: "_Throttle" = None) -> int:
+        """
+        Enqueue the messages of all producers. A single producer runs in the calling thread,
+        several producers each run in their own process, and all of them are waited for.
+        :param throttle: single producer only, see _enqueue_msgs()
+        :return: number of messages enqueued
+        """
+        if self._publish_metrics:
+            self._producer_stats = ProducerStats(self._ctx, len(producers))
+            self._enqueuer.publish_to(self._producer_stats, 0)
+        if len(producers) == 1:
+            return self._enqueue_msgs(producers[0], throttle)
+
+        msg_counts = self._ctx.Array("q", len(producers), lock=False)
+        producer_processes = [
+            self._ctx.Process(target=self._run_producer, args=(producer, index, len(producers), msg_counts),
+                              name=f"Producer-{index}")
+            for index, producer in enumerate(producers)
+        ]
+        for producer_process in producer_processes:
+            producer_process.start()
+        for producer_process in producer_processes:
+            producer_process.join()
+
+        failed = [index for index, producer_process in enumerate(producer_processes) if producer_process.exitcode]
+        if failed:
+            raise RuntimeError(f"Producers {', '.join(map(str, failed))} failed out of {len(producers)}")
+        return sum(msg_counts)
+
+    def _run_producer(self, producer: MsgProducer, producer_index: int, producer_count: int, msg_counts):
+        """Producer process main loop: interleaved sequence numbers keep them unique across producers"""
+        self._child_log_setup()
+        self.logger = logging.getLogger("Produce")
+        self.logger.debug("start")
+        if self._producer_stats is not None:
+            self._producer_slot = producer_index
+            self._enqueuer.publish_to(self._producer_stats, producer_index)
+        msg_counts[producer_index] = self._enqueue_msgs(producer, seq_start=producer_index, seq_step=producer_count)
         self.logger.debug("end")
 
-    def _dequeue_and_process_msg(self, consumer: MsgConsumer):
+    def _enqueue_msgs(self, producer: MsgProducer, throttle: "_Throttle" = None, seq_start: int = 0,
+                      seq_step: int = 1) -> int:
+        """
+        Put all messages from the producer on their channel, batch_size at a time or as sized by chunking.
+        :param throttle: acquired once per message, partial batches are flushed before blocking on it
+        :param seq_start: sequence number of the first message
+        :param seq_step: increment between the sequence numbers of successive messages
+        :return: number of messages enqueued
+        """
+        channel_count = self._transport.channel_count
+        batches = [[] for _ in range(channel_count)]
+        batch_starts = [0.0] * channel_count
+        seq = seq_start
+        msg_count = 0
+        expected_msg_count = producer.msg_count() if self._chunking is not None else None
+        batch_size = self._next_batch_size(expected_msg_count, 0)
+        # channels are priority lanes: the channel index is the priority
+        prioritized = self._transport.priority_count > 1
+        timestamped = self._trace_latency or self._deadlines is not None
+        # partial batches are flushed once lingered even when the producer is slow to yield the next message
+        flusher = None
+        batches_lock = nullcontext()
+        if self._batch_linger_sec > 0:
+            flusher = _LingerFlusher(self, batches, batch_starts, self._batch_linger_sec)
+            batches_lock = flusher.lock
+            flusher.start()
+        try:
+            for msg in producer.yield_msgs():
+                if throttle is not None and not throttle.acquire(blocking=False):
+                    with batches_lock:
+                        self._flush_batches(batches)
+                    throttle.acquire()
+                index = self._transport.route(msg)
+                enqueue_ns = perf_counter_ns() if timestamped else 0
+                with batches_lock:
+                    batch = batches[index]
+                    if not batch:
+                        batch_starts[index] = perf_counter()
+                    batch.append((self.MSG_TYPE_USER, Envelope(seq, msg, enqueue_ns, index if prioritized else 0)))
+                    seq += seq_step
+                    msg_count += 1
+                    if len(batch) < batch_size:
+                        continue
+                    self._put_batch(index, batch)
+                    batches[index] = []
+                batch_size = self._next_batch_size(expected_msg_count, msg_count)
+                # checked once per batch, Event.is_set() takes a lock
+                if self._stop_event.is_set():
+                    self.logger.debug("Shutdown requested, stopping production")
+                    break
+            with batches_lock:
+                self._flush_batches(batches)
+        finally:
+            if flusher is not None:
+                flusher.stop()
+        if flusher is not None and flusher.error is not None:
+            raise flusher.error
+        return msg_count
+
+    def _next_batch_size(self, expected_msg_count: int, msg_count: int) -> int:
+        """
+        :param expected_msg_count: chunking only: messages the producer yields in total, None if unknown
+        :param msg_count: messages enqueued so far
+        """
+        if self._chunking is None:
+            return self._batch_size
+        remaining = None if expected_msg_count is None else max(expected_msg_count - msg_count, 0)
+        return self._chunking.next_size(remaining, self._run_worker_count, self._service_ns())
+
+    def _service_ns(self) -> float:
+        """Mean time workers took to process a message so far in this run, None before the first one"""
+        if self._worker_stats is None:
+            return None
+        processed = self._worker_stats.total(WorkerStats.PROCESSED)
+        if not processed:
+            return None
+        return self._worker_stats.total(WorkerStats.BUSY_NS) / processed
+
+    def _flush_batches(self, batches: list):
+        for index, batch in enumerate(batches):
+            if batch:
+                self._put_batch(index, batch)
+                batches[index] = []
+
+    def _put_batch(self, index: int, batch: list):
+        if self._ledger is not None:
+            # before the put: the worker getting the batch may die right away
+            self._ledger.add(index, batch)
+        self._enqueuer.put_many(self._transport.channel(index), batch)
+        if self._producer_stats is not None:
+            self._producer_stats.add(self._producer_slot, ProducerStats.ENQUEUED, len(batch))
+
+    def _child_log_setup(self):
+        if self._log_queue is not None:
+            self._log_queue.worker_setup(self._log_level)
+        else:
+            log_setup(self._log_level)
+
+    def _begin_run(self, worker_count: int):
+        self._run_worker_count = worker_count
+        self._stop_event.clear()
+        self._abort_event.clear()
+        self._shutdown_start = None
+        self._shutdown_sec = None
+
+    def _enqueue_quit(self, worker_count: int = None):
+        """
+        Put QUIT sentinels after all user messages, one per worker: each worker exits on the first one it gets,
+        so all workers stop at once rather than passing a single QUIT on to each other.
+        :param worker_count: shared channel only: number of workers to stop, defaults to the live workers
+            not retiring. Retiring workers pass on any sentinel they get.
+        """
+        if self._shutdown_start is None:
+            self._shutdown_start = perf_counter()
+        if self._transport.shared:
+            if worker_count is None:
+                worker_count = len(self._live_worker_slots())
+            channels = [self._transport.control_channel()] * worker_count
+        else:
+            channels = [self._transport.channel(index) for index in range(self._transport.channel_count)]
+        for channel in channels:
+            self._enqueuer.put_many(channel, [(self.MSG_TYPE_QUIT, "")])
+
+    def _end_shutdown(self):
+        """Called once all workers are joined"""
+        self._shutdown_sec = perf_counter() - self._shutdown_start
+        self.logger.debug("Shutdown took %f sec", self._shutdown_sec)
+
+    def _dequeue_and_process_msg(self, consumer: MsgConsumer, worker_index: int, control=None):
+        """
+        Worker process main loop.
+        :param control: WorkerControl of the WorkerPool the worker belongs to, None outside pools
+        """
         # we're on a new process, sys.stdout is different from our parent process
-        log_setup(self._log_level)
+        self._child_log_setup()
         self.logger = logging.getLogger("DequeueAndProcess")
+        self._log_sampler = LogSampler(self.logger, self._log_sample_every)
 
         self.logger.debug("start")
+        if self._affinity is not None:
+            self.logger.debug("Pinned to cores %s", self._affinity.apply(worker_index))
+
+        channel = self._transport.worker_channel(worker_index)
+        results = _ResultBatch(self._results, self._result_batch_size, self._result_linger_sec)
+        if control is None:
+            # perf_counter_ns() is system-wide on Linux, comparable with the parent's timestamps
+            self._worker_stats.set(worker_index, WorkerStats.FIRST_GET_NS, perf_counter_ns())
+            self._report_cpu(worker_index)
+            if self._latency_stats is not None:
+                self._latency_recorder = LatencyRecorder(self._transport.priority_count)
+            if self._publish_metrics:
+                self._dequeuer.publish_to(self._worker_stats, worker_index)
+                # workers passing QUIT on must not write to the producers' slots
+                self._enqueuer.publish_to(None, 0)
+        else:
+            # pool workers outlive the stats of any single run
+            self._worker_stats = None
 
+        try:
+            if isinstance(consumer, AsyncMsgConsumer):
+                asyncio.run(self._process_msgs_async(consumer, worker_index, channel, results, control))
+            elif self._consumer_threads > 1:
+                self._process_msgs_threaded(consumer, worker_index, channel, results, control)
+            else:
+                self._process_msgs(consumer, worker_index, channel, results, control)
+        finally:
+            if self._latency_recorder is not None:
+                self._latency_stats.publish(worker_index, self._latency_recorder)
+            self._report_cpu(worker_index)
+
+        self.logger.debug("end")
+
+    def _process_msgs(self, consumer: MsgConsumer, worker_index: int, channel, results: "_ResultBatch", control):
         terminate = False
+        supervised = self._acks is not None and control is None
+        held = None
+        if self._deadlines is not None and self._deadlines.timeout_sec is not None:
+            install_alarm()
 
         while not terminate:
 
-            msg_type, msg = self._dequeuer.get(self._q)
+            processed = 0
+            skipped = 0
+            busy_ns = 0
 
-            if msg_type is None:
-                continue
+            batch = self._get_many(channel, results, worker_index if supervised else None)
+            dequeue_ns = perf_counter_ns()
+            if supervised:
+                held = self._hold(worker_index, batch)
+            aborting = self._abort_event.is_set()
+
+            for msg_type, msg in batch:
+
+                if msg_type is None:
+                    continue
+
+                if msg_type == self.MSG_TYPE_USER:
+                    if aborting:
+                        skipped += 1
+                        continue
+                    if self._log_sampler():
+                        self.logger.debug("processing %s %s", msg_type, msg)
+                    t_start = perf_counter_ns()
+                    if self._deadlines is None:
+                        results.append(msg.seq, consumer.process_msg(msg.msg))
+                    elif not self._process_with_deadlines(consumer, worker_index, msg, t_start, results):
+                        skipped += 1
+                        if supervised:
+                            self._worker_stats.set(worker_index, WorkerStats.HELD_DONE, processed + skipped)
+                        continue
+                    t_end = perf_counter_ns()
+                    busy_ns += t_end - t_start
+                    processed += 1
+                    if supervised:
+                        # recorded right away: the supervisor must know what a dying worker did
+                        self._record(worker_index, 1, t_end - t_start)
+                        self._worker_stats.set(worker_index, WorkerStats.HELD_DONE, processed + skipped)
+                    if self._latency_recorder is not None:
+                        self._latency_recorder.record(msg.enqueue_ns, dequeue_ns, t_start, t_end, msg.priority)
+                else:
+                    terminate = self._process_control_msg(msg_type, worker_index, channel, results, control)
+
+            lease = getattr(batch, "lease", None)
+            if lease is not None:
+                lease.done(len(batch))
+            if processed or skipped:
+                self._transport.complete(worker_index, processed + skipped)
+            if processed and not supervised:
+                self._record(worker_index, processed, busy_ns)
+            if held is not None:
+                # logged before released: a worker dying in between must not leave the batch unaccounted for
+                if self._ack_log.add(worker_index, held):
+                    self._send_acks(worker_index)
+                self._worker_stats.set(worker_index, WorkerStats.HELD, 0)
+                held = None
+            terminate = terminate or self._retire_requested(worker_index, results)
+            results.flush_if_due()
+
+    def _process_msgs_threaded(self, consumer: MsgConsumer, worker_index: int, channel, results: "_ResultBatch",
+                               control):
+        """
+        consumer_threads threads process messages from a local buffer, which the main thread keeps fed.
+        """
+        buffer = queue.Queue(maxsize=2 * self._consumer_threads)
+        credit_lock = threading.Lock()
+        errors = []
+
+        def process_msgs():
+            while True:
+                item = buffer.get()
+                try:
+                    if item is None:
+                        return
+                    envelope, dequeue_ns, lease = item
+                    t_start = perf_counter_ns()
+                    expired = self._deadlines is not None and self._deadlines.expired(envelope.msg,
+                                                                                      envelope.enqueue_ns, t_start)
+                    if expired and not errors:
+                        with credit_lock:
+                            self._transport.complete(worker_index, 1)
+                            self._give_up(worker_index, envelope.seq, WorkerStats.EXPIRED, results)
+                    elif not errors:
+                        results.append(envelope.seq, consumer.process_msg(envelope.msg))
+                        t_end = perf_counter_ns()
+                        with credit_lock:
+                            self._transport.complete(worker_index, 1)
+                            # threads share the worker's slot: busy time is per thread
+                            self._record(worker_index, 1, (t_end - t_start) // self._consumer_threads)
+                            if self._latency_recorder is not None:
+                                self._latency_recorder.record(envelope.enqueue_ns, dequeue_ns, t_start, t_end,
+                                                              envelope.priority)
+                    if lease is not None:
+                        lease.done()
+                except Exception as ex:  # pylint: disable=broad-exception-caught
+                    errors.append(ex)
+                finally:
+                    buffer.task_done()
+
+        threads = [
+            threading.Thread(target=process_msgs, name=f"Consumer-{thread_index}", daemon=True)
+            for thread_index in range(self._consumer_threads)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            terminate = False
+
+            while not terminate:
+
+                batch = self._get_many(channel, results)
+                dequeue_ns = perf_counter_ns()
+                lease = getattr(batch, "lease", None)
+                aborting = self._abort_event.is_set()
+
+                for msg_type, msg in batch:
+
+                    if errors:
+                        raise errors[0]
+
+                    if msg_type == self.MSG_TYPE_USER and not aborting:
+                        if self._log_sampler():
+                            self.logger.debug("buffering %s %s", msg_type, msg)
+                        buffer.put((msg, dequeue_ns, lease))
+                        continue
+
+                    if lease is not None:
+                        lease.done()
+                    if msg_type == self.MSG_TYPE_USER:
+                        # aborting: skipped
+                        with credit_lock:
+                            self._transport.complete(worker_index, 1)
+                    elif msg_type is not None:
+                        # control messages apply once all messages before them are processed
+                        buffer.join()
+                        terminate = self._process_control_msg(msg_type, worker_index, channel, results, control)
 
+                if not terminate and self._retire_flagged(worker_index):
+                    buffer.join()
+                    terminate = self._retire_requested(worker_index, results)
+                results.flush_if_due()
+        finally:
+            for _ in threads:
+                buffer.put(None)
+            for thread in threads:
+                thread.join()
+
+        if errors:
+            raise errors[0]
+
+    async def _process_msgs_async(self, consumer: AsyncMsgConsumer, worker_index: int, channel,
+                                  results: "_ResultBatch", control):
+        """
+        Keep up to async_max_in_flight messages in flight.
+        Blocking get() calls run in the default executor, so they never block the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        in_flight = asyncio.Semaphore(self._async_max_in_flight)
+        tasks = set()
+        errors = []
+
+        async def process_msg(envelope: Envelope, dequeue_ns: int, lease: PayloadLease):
+            try:
+                t_start = perf_counter_ns()
+                if self._deadlines is None:
+                    results.append(envelope.seq, await consumer.process_msg(envelope.msg))
+                elif not await self._process_with_deadlines_async(consumer, worker_index, envelope, t_start, results):
+                    self._transport.complete(worker_index, 1)
+                    return
+                t_end = perf_counter_ns()
+                self._transport.complete(worker_index, 1)
+                # busy time is per in-flight slot
+                self._record(worker_index, 1, (t_end - t_start) // self._async_max_in_flight)
+                if self._latency_recorder is not None:
+                    self._latency_recorder.record(envelope.enqueue_ns, dequeue_ns, t_start, t_end,
+                                                  envelope.priority)
+            finally:
+                if lease is not None:
+                    lease.done()
+                in_flight.release()
+
+        def on_done(task: asyncio.Task):
+            tasks.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                errors.append(task.exception())
+
+        terminate = False
+
+        while not terminate:
+
+            batch = await self._get_many_async(loop, channel, results)
+            dequeue_ns = perf_counter_ns()
+            lease = getattr(batch, "lease", None)
+            aborting = self._abort_event.is_set()
+
+            for msg_type, msg in batch:
+
+                if errors:
+                    raise errors[0]
+
+                if msg_type == self.MSG_TYPE_USER and not aborting:
+                    if self._log_sampler():
+                        self.logger.debug("processing %s %s", msg_type, msg)
+                    await in_flight.acquire()
+                    task = loop.create_task(process_msg(msg, dequeue_ns, lease))
+                    tasks.add(task)
+                    task.add_done_callback(on_done)
+                    continue
+
+                if lease is not None:
+                    lease.done()
+                if msg_type == self.MSG_TYPE_USER:
+                    # aborting: skipped
+                    self._transport.complete(worker_index, 1)
+                elif msg_type is not None:
+                    # control messages apply once all messages before them are processed
+                    await asyncio.gather(*tasks)
+                    terminate = self._process_control_msg(msg_type, worker_index, channel, results, control)
+
+            if not terminate and self._retire_flagged(worker_index):
+                await asyncio.gather(*tasks)
+                terminate = self._retire_requested(worker_index, results)
+            results.flush_if_due()
+
+    async def _get_many_async(self, loop: asyncio.AbstractEventLoop, channel, results: "_ResultBatch") -> list:
+        """Like _get_many(), sending back results of messages completing while waiting"""
+        try:
+            return self._dequeuer.get_many_nowait(channel)
+        except queue.Empty:
+            results.flush()
+
+        future = loop.run_in_executor(None, self._dequeuer.get_many, channel)
+        while not future.done():
+            await asyncio.wait({future}, timeout=self._result_linger_sec or None)
+            results.flush_if_due()
+        return future.result()
+
+    def _process_with_deadlines(self, consumer: MsgConsumer, worker_index: int, envelope: Envelope, t_start: int,
+                                results: "_ResultBatch") -> bool:
+        """
+        Process the message unless it expired, interrupting it once it runs past timeout_sec.
+        :return: False if the message was given up on
+        """
+        deadlines = self._deadlines
+        if deadlines.expired(envelope.msg, envelope.enqueue_ns, t_start):
+            self._give_up(worker_index, envelope.seq, WorkerStats.EXPIRED, results)
+            return False
+        if deadlines.timeout_sec is None:
+            results.append(envelope.seq, consumer.process_msg(envelope.msg))
+            return True
+        if self._worker_stats is not None:
+            # the supervisor kills the worker if the interruption does not work
+            self._worker_stats.set(worker_index, WorkerStats.MSG_START_NS, t_start)
+        try:
+            with interrupt_after(deadlines.timeout_sec):
+                result = consumer.process_msg(envelope.msg)
+        except MsgTimeout:
+            self.logger.warning("Message %d timed out after %s sec", envelope.seq, deadlines.timeout_sec)
+            self._give_up(worker_index, envelope.seq, WorkerStats.TIMED_OUT, results)
+            self._count(worker_index, WorkerStats.WASTED_NS, perf_counter_ns() - t_start)
+            return False
+        finally:
+            if self._worker_stats is not None:
+                self._worker_stats.set(worker_index, WorkerStats.MSG_START_NS, 0)
+        results.append(envelope.seq, result)
+        return True
+
+    async def _process_with_deadlines_async(self, consumer: AsyncMsgConsumer, worker_index: int, envelope: Envelope,
+                                            t_start: int, results: "_ResultBatch") -> bool:
+        """Like _process_with_deadlines(), cancelling the message rather than interrupting it"""
+        deadlines = self._deadlines
+        if deadlines.expired(envelope.msg, envelope.enqueue_ns, t_start):
+            self._give_up(worker_index, envelope.seq, WorkerStats.EXPIRED, results)
+            return False
+        try:
+            result = await asyncio.wait_for(consumer.process_msg(envelope.msg), deadlines.timeout_sec)
+        except asyncio.TimeoutError:
+            self.logger.warning("Message %d timed out after %s sec", envelope.seq, deadlines.timeout_sec)
+            self._give_up(worker_index, envelope.seq, WorkerStats.TIMED_OUT, results)
+            self._count(worker_index, WorkerStats.WASTED_NS, perf_counter_ns() - t_start)
+            return False
+        results.append(envelope.seq, result)
+        return True
+
+    def _give_up(self, worker_index: int, seq: int, field: int, results: "_ResultBatch"):
+        """Count a message as expired or timed out"""
+        self._count(worker_index, field, 1)
+        # process_iter() counts it as received, yielding nothing
+        results.append(seq, _GivenUp())
+
+    def _hold(self, worker_index: int, batch: list) -> int:
+        """
+        Supervised runs: record the batch the worker is about to process in its slot.
+        :return: key of the batch in the ledger, None if the batch holds no user message
+        """
+        for msg_type, msg in batch:
             if msg_type == self.MSG_TYPE_USER:
-                self.logger.debug("processing %s %s", msg_type, msg)
-                consumer.process_msg(msg)
-            elif msg_type == self.MSG_TYPE_QUIT:
-                self.logger.debug("Enqueueing QUIT message")
-                self._enqueuer.put(self._q, self.MSG_TYPE_QUIT, "")
-                terminate = True
+                self._worker_stats.set(worker_index, WorkerStats.HELD_DONE, 0)
+                self._worker_stats.set(worker_index, WorkerStats.HELD, msg.seq + 1)
+                return msg.seq
+        return None
+
+    def _report_cpu(self, worker_index: int):
+        if self._worker_stats is not None:
+            cpu = current_cpu()
+            self._worker_stats.set(worker_index, WorkerStats.CPU, 0 if cpu is None else cpu + 1)
+
+    def _record(self, worker_index: int, msg_count: int, busy_ns: int):
+        if self._worker_stats is not None:
+            self._worker_stats.record(worker_index, msg_count, busy_ns)
+
+    def _count(self, worker_index: int, field: int, value: int):
+        if self._worker_stats is not None:
+            self._worker_stats.add(worker_index, field, value)
+
+    def _retire_flagged(self, worker_index: int) -> bool:
+        return self._worker_stats is not None and bool(self._worker_stats.get(worker_index, WorkerStats.RETIRE))
+
+    def _retire_requested(self, worker_index: int, results: "_ResultBatch") -> bool:
+        """
+        Autoscaling: exit if the parent asked this worker to retire. Unlike QUIT, nothing is passed on.
+        :return: True if the worker should terminate
+        """
+        if not self._retire_flagged(worker_index):
+            return False
+        self.logger.debug("Retiring")
+        results.flush()
+        return True
+
+    def _process_control_msg(self, msg_type: int, worker_index: int, channel, results: "_ResultBatch",
+                             control) -> bool:
+        """
+        :return: True if the worker should terminate
+        """
+        if msg_type == self.MSG_TYPE_QUIT:
+            results.flush()
+            if self._transport.shared and self._retire_flagged(worker_index):
+                # retiring workers got no sentinel of their own
+                self.logger.debug("Passing QUIT message on")
+                self._enqueuer.put_many(channel, [(self.MSG_TYPE_QUIT, "")])
+            return True
+        if msg_type == self.MSG_TYPE_END_RUN and control is not None:
+            results.flush()
+            control.end_run()
+            return False
+        if msg_type == self.MSG_TYPE_RETIRE and control is not None:
+            results.flush()
+            control.retire()
+            return True
+        raise ValueError(f"Unexpected message type {msg_type}")
+
+    def _get_many(self, channel, results: "_ResultBatch", ack_slot: int = None) -> list:
+        """
+        Send back pending results before blocking on an empty channel.
+        :param ack_slot: supervised runs: also acknowledge the batches done by the worker in this slot,
+            so that an idle worker has acknowledged all it did, see Supervisor._recover_lost()
+        """
+        acks_pending = ack_slot is not None and self._ack_log.unsent_count(ack_slot) > 0
+        if results or acks_pending:
+            try:
+                return self._dequeuer.get_many_nowait(channel)
+            except queue.Empty:
+                results.flush()
+                if acks_pending:
+                    self._send_acks(ack_slot)
+        return self._dequeuer.get_many(channel)
+
+    def _send_acks(self, worker_index: int):
+        self._acks.put(self._ack_log.unsent(worker_index))
+        self._ack_log.mark_sent(worker_index)
+
+
+class _Feeder(threading.Thread):
+    """Runs the producer side of ProcessManager.process_iter()"""
+
+    def __init__(self, proc_mgr: ProcessManager, producers: list, throttle: "_Throttle"):
+        super().__init__(name="Feeder", daemon=True)
+        self._proc_mgr = proc_mgr
+        self._producers = producers
+        self._throttle = throttle
+        self.msg_count = 0
+        self.finished = False
+        self.error = None
+
+    def run(self):
+        # pylint: disable=protected-access
+        try:
+            self.msg_count = self._proc_mgr._produce(self._producers, self._throttle)
+        except Exception as ex:  # pylint: disable=broad-exception-caught
+            self.error = ex
+        self.finished = True
+        try:
+            # consumers stop once every producer is done, even if one of them failed
+            self._proc_mgr._enqueue_quit()
+        except Exception as ex:  # pylint: disable=broad-exception-caught
+            self.error = self.error or ex
+
+
+class _Throttle:
+    """Counting semaphore which can be disabled, releasing all waiters for good"""
+
+    def __init__(self, value: int):
+        self._value = value
+        self._disabled = False
+        self._cond = threading.Condition()
+
+    def acquire(self, blocking: bool = True) -> bool:
+        with self._cond:
+            if blocking:
+                self._cond.wait_for(lambda: self._value > 0 or self._disabled)
+            if self._disabled:
+                return True
+            if self._value <= 0:
+                return False
+            self._value -= 1
+            return True
+
+    def release(self):
+        with self._cond:
+            self._value += 1
+            self._cond.notify()
+
+    def disable(self):
+        with self._cond:
+            self._disabled = True
+            self._cond.notify_all()
+
+
+class _LingerFlusher(threading.Thread):
+    """
+    Producer side: puts partial batches once their oldest message is linger_sec old, without waiting for
+    the producer to yield another message. The producer holds lock while it touches the batches.
+    """
+
+    def __init__(self, proc_mgr: ProcessManager, batches: list, batch_starts: list, linger_sec: float):
+        super().__init__(name="LingerFlusher", daemon=True)
+        self.lock = threading.Lock()
+        self.error = None
+        self._proc_mgr = proc_mgr
+        self._batches = batches
+        self._batch_starts = batch_starts
+        self._linger_sec = linger_sec
+        self._stop_event = threading.Event()
+
+    def run(self):
+        wait_sec = self._linger_sec
+        while not self._stop_event.wait(wait_sec):
+            try:
+                with self.lock:
+                    wait_sec = self._flush_lingered()
+            except Exception as ex:  # pylint: disable=broad-exception-caught
+                # raised by the producer once done
+                self.error = ex
+                return
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def _flush_lingered(self) -> float:
+        """:return: time until the oldest partial batch left lingers"""
+        # pylint: disable=protected-access
+        now = perf_counter()
+        wait_sec = self._linger_sec
+        for index, batch in enumerate(self._batches):
+            if not batch:
+                continue
+            age = now - self._batch_starts[index]
+            if age >= self._linger_sec:
+                self._proc_mgr._put_batch(index, batch)
+                self._batches[index] = []
             else:
-                raise ValueError(f"Unexpected message type {msg_type}")
+                wait_sec = min(wait_sec, self._linger_sec - age)
+        return wait_sec
 
-        self.logger.debug("end")
+
+class _GivenUp:
+    """Result of a message expired or timed out, which process_iter() does not yield"""
+
+
+class _ResultBatch:
+    """Results a worker has not sent back to the parent yet"""
+
+    def __init__(self, results: Queue, batch_size: int, linger_sec: float):
+        """
+        :param results: where to send results, None to discard them
+        """
+        self._results = results
+        self._batch_size = batch_size
+        self._linger_sec = linger_sec
+        self._batch = []
+        self._batch_start = 0.0
+        # consumer threads append results while the main thread flushes them
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._batch)
+
+    def append(self, seq: int, result):
+        if self._results is None:
+            return
+        with self._lock:
+            if not self._batch:
+                self._batch_start = perf_counter()
+            self._batch.append((seq, result))
+            if len(self._batch) >= self._batch_size:
+                self._flush()
+
+    def flush_if_due(self):
+        with self._lock:
+            if self._batch and perf_counter() - self._batch_start >= self._linger_sec:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if self._batch:
+            self._results.put(self._batch)
+            self._batch = []
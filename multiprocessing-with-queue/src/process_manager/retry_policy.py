@@ -0,0 +1,116 @@
+"""
+How MsgEnqueuer and MsgDequeuer retry a put() or get() which timed out.
+"""
+import random
+from multiprocessing.context import BaseContext
+from time import perf_counter
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with jitter, bounded by a number of attempts and/or a total time budget.
+
+    With the defaults of MsgProcessor (multiplier 1, no jitter, no deadline) this is the original behaviour:
+    a fixed wait between a fixed number of attempts.
+    """
+
+    def __init__(self, max_attempts: int = 1, wait_sec: float = 0, multiplier: float = 2.0,
+                 max_wait_sec: float = None, jitter: float = 0.0, deadline_sec: float = None):
+        """
+        :param max_attempts: how many times to try, None for as many as deadline_sec allows
+        :param wait_sec: wait before the second attempt
+        :param multiplier: each following wait is this many times longer than the previous one
+        :param max_wait_sec: upper bound of a single wait, None for no bound
+        :param jitter: fraction of each wait drawn at random, 0 to 1, so that competing processes spread out
+        :param deadline_sec: total time budget across all attempts and waits, None for no budget
+        """
+        if max_attempts is None and deadline_sec is None:
+            raise ValueError("At least one of max_attempts and deadline_sec is needed")
+        if max_attempts is not None and max_attempts < 1:
+            raise ValueError(f"max_attempts must be at least 1, got {max_attempts}")
+        if not 0 <= jitter <= 1:
+            raise ValueError(f"jitter must be between 0 and 1, got {jitter}")
+        self.max_attempts = max_attempts
+        self.wait_sec = wait_sec
+        self.multiplier = multiplier
+        self.max_wait_sec = max_wait_sec
+        self.jitter = jitter
+        self.deadline_sec = deadline_sec
+
+    def wait_after(self, attempt: int) -> float:
+        """
+        :param attempt: number of attempts made so far, starting at 1
+        :return: how long to wait before the next attempt
+        """
+        wait_sec = self.wait_sec * self.multiplier ** (attempt - 1)
+        if self.max_wait_sec is not None:
+            wait_sec = min(wait_sec, self.max_wait_sec)
+        return wait_sec * (1 - self.jitter * random.random())
+
+    def start(self) -> "RetryBudget":
+        return RetryBudget(self)
+
+
+class RetryBudget:
+    """Attempts and time left for one retried call"""
+
+    def __init__(self, policy: RetryPolicy):
+        self._policy = policy
+        self._deadline = perf_counter() + policy.deadline_sec if policy.deadline_sec is not None else None
+        self.attempts = 0
+
+    def remaining_sec(self) -> float:
+        """Time left before the deadline, None without deadline"""
+        if self._deadline is None:
+            return None
+        return max(0.0, self._deadline - perf_counter())
+
+    def exhausted(self) -> bool:
+        max_attempts = self._policy.max_attempts
+        if max_attempts is not None and self.attempts >= max_attempts:
+            return True
+        return self._deadline is not None and perf_counter() >= self._deadline
+
+    def limit(self, timeout: float) -> float:
+        """Shorten the timeout of the next attempt so it ends by the deadline"""
+        remaining_sec = self.remaining_sec()
+        return timeout if remaining_sec is None else min(timeout, remaining_sec)
+
+    def next_wait(self) -> float:
+        return self.limit(self._policy.wait_after(self.attempts))
+
+
+class QueueNotifier:
+    """
+    Wakes up processes waiting between two attempts as soon as a queue changes state:
+    the dequeuer notifies space after each get(), the enqueuer notifies data after each put().
+
+    Waiters register in a shared counter, so notify() only takes the cross-process lock when one is waiting:
+    a put() or get() which nobody waits for costs one shared memory read.
+    """
+
+    def __init__(self, ctx: BaseContext):
+        self._cond = ctx.Condition()
+        # only changed with the lock of _cond held
+        self._waiters = ctx.Value("i", 0, lock=False)
+
+    @property
+    def waiters(self) -> int:
+        return self._waiters.value
+
+    def notify(self):
+        # a waiter registering right after this read misses the notification: it waits for its timeout,
+        # as it would if the queue had changed state just before it started waiting
+        if self._waiters.value == 0:
+            return
+        with self._cond:
+            self._cond.notify_all()
+
+    def wait(self, timeout: float) -> bool:
+        """:return: False if nothing happened within timeout"""
+        with self._cond:
+            self._waiters.value += 1
+            try:
+                return self._cond.wait(timeout)
+            finally:
+                self._waiters.value -= 1
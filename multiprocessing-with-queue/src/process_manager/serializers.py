@@ -0,0 +1,171 @@
+"""
+Serializers turn a batch of (msg_type, Envelope) tuples into what travels through the transport, and back.
+"""
+import struct
+from operator import attrgetter
+
+from .envelope import Envelope
+from .msg_types import MSG_TYPE_USER
+
+
+class MsgSchema:
+    """
+    Fixed binary layout of a user message class: fields packed with a struct format,
+    optionally followed by a single variable-length bytes field.
+
+    The layout must hold every attribute of the messages: an attribute it left out, such as a priority
+    or a deadline_sec, would silently be lost on the way. __slots__ are checked here, instance
+    dictionaries when encoding.
+    """
+
+    def __init__(self, msg_class: type, fields: tuple, fmt: str, tail_field: str = None):
+        """
+        :param msg_class: built as msg_class(field=value, ...), one keyword argument per field and tail field
+        :param fields: names of the attributes packed with fmt, in order
+        :param fmt: struct format of the fields, without byte order: always little-endian, unpadded
+        :param tail_field: name of a bytes attribute stored after the fields, None if none
+        """
+        self.msg_class = msg_class
+        self.fields = tuple(fields)
+        self.fmt = fmt
+        self.tail_field = tail_field
+        layout = struct.Struct("<" + fmt)
+        if len(layout.unpack(bytes(layout.size))) != len(self.fields):
+            raise ValueError(f"Format {fmt} does not match fields {', '.join(self.fields)}")
+        self.names = frozenset(self.fields + ((tail_field,) if tail_field else ()))
+        slots = {slot for cls in msg_class.__mro__ for slot in _slots(cls)} - {"__dict__", "__weakref__"}
+        if slots - self.names:
+            raise ValueError(f"Schema of {msg_class.__name__} cannot hold {', '.join(sorted(slots - self.names))}")
+        # a class of the hierarchy without __slots__ gives instances a dictionary
+        self.has_dict = any("__slots__" not in vars(cls) or "__dict__" in _slots(cls) for cls in msg_class.__mro__[:-1])
+
+    def check(self, msg):
+        """:raise ValueError: if msg has attributes the layout cannot hold"""
+        if self.has_dict and not vars(msg).keys() <= self.names:
+            extra = ", ".join(sorted(vars(msg).keys() - self.names))
+            raise ValueError(f"Schema of {self.msg_class.__name__} cannot hold {extra}")
+
+
+def _slots(cls: type) -> tuple:
+    slots = vars(cls).get("__slots__", ())
+    return (slots,) if isinstance(slots, str) else tuple(slots)
+
+
+class Serializer:
+    """Serializer interface"""
+
+    # whether batches become bytes, rather than being pickled by the transport
+    binary = False
+
+    def encode(self, msgs: list):
+        """
+        :param msgs: list of (msg_type, msg) tuples, msg being an Envelope for user messages
+        :return: what goes through the transport
+        """
+        raise NotImplementedError()
+
+    def decode(self, item) -> list:
+        """:return: list of (msg_type, msg) tuples, as passed to encode()"""
+        raise NotImplementedError()
+
+
+class PickleSerializer(Serializer):
+    """Any message: batches go through unchanged, pickled by the transport"""
+
+    def encode(self, msgs: list):
+        return msgs
+
+    def decode(self, item) -> list:
+        return item
+
+
+class StructSerializer(Serializer):
+    """
+    Messages of a single MsgSchema, packed into one bytes object per batch.
+
+    Each message is a fixed-size record: type code, priority, seq, enqueue_ns and the schema fields,
+    zero-filled for control messages. A tail field adds its length to the record, its bytes after the record.
+    Messages with attributes outside the schema raise ValueError rather than lose them.
+    """
+
+    binary = True
+
+    _COUNT = struct.Struct("<I")
+
+    def __init__(self, schema: MsgSchema):
+        self._schema = schema
+        self._record = struct.Struct("<BBqQ" + schema.fmt + ("I" if schema.tail_field else ""))
+        # blank values of any format: whatever zero bytes unpack to
+        self._blank = self._record.unpack(bytes(self._record.size))[4:]
+        get_values = attrgetter(*schema.fields)
+        self._get_values = get_values if len(schema.fields) > 1 else lambda msg: (get_values(msg),)
+        self._check = schema.check if schema.has_dict else None
+
+    def encode(self, msgs: list) -> bytes:
+        record = self._record
+        tail_field = self._schema.tail_field
+        parts = [self._COUNT.pack(len(msgs))]
+        for msg_type, envelope in msgs:
+            if msg_type != MSG_TYPE_USER:
+                parts.append(record.pack(msg_type, 0, 0, 0, *self._blank))
+                continue
+            msg = envelope.msg
+            if self._check is not None:
+                self._check(msg)
+            values = self._get_values(msg)
+            if tail_field is None:
+                parts.append(record.pack(msg_type, envelope.priority, envelope.seq, envelope.enqueue_ns, *values))
+            else:
+                tail = getattr(msg, tail_field)
+                parts.append(record.pack(msg_type, envelope.priority, envelope.seq, envelope.enqueue_ns, *values,
+                                         len(tail)))
+                parts.append(tail)
+        return b"".join(parts)
+
+    def decode(self, item: bytes) -> list:
+        msg_class = self._schema.msg_class
+        fields = self._schema.fields
+        record = self._record
+        msgs = []
+        if self._schema.tail_field is None:
+            # fixed-size records only: a single pass of the C unpacker
+            for msg_type, priority, seq, enqueue_ns, *values in record.iter_unpack(memoryview(item)[self._COUNT.size:]):
+                if msg_type == MSG_TYPE_USER:
+                    msgs.append((msg_type, Envelope(seq, msg_class(**dict(zip(fields, values))), enqueue_ns,
+                                                    priority)))
+                else:
+                    msgs.append((msg_type, None))
+            return msgs
+
+        tail_field = self._schema.tail_field
+        (count,) = self._COUNT.unpack_from(item)
+        offset = self._COUNT.size
+        for _ in range(count):
+            msg_type, priority, seq, enqueue_ns, *values, tail_size = record.unpack_from(item, offset)
+            offset += record.size
+            if msg_type == MSG_TYPE_USER:
+                tail = item[offset:offset + tail_size]
+                offset += tail_size
+                kwargs = dict(zip(fields, values))
+                kwargs[tail_field] = tail
+                msgs.append((msg_type, Envelope(seq, msg_class(**kwargs), enqueue_ns, priority)))
+            else:
+                msgs.append((msg_type, None))
+        return msgs
+
+
+SERIALIZERS = ["pickle", "struct"]
+
+
+def create_serializer(name: str, schema: MsgSchema = None) -> Serializer:
+    """
+    :param name: one of SERIALIZERS
+    :param schema: struct only: layout of the user messages
+    """
+    if name == "pickle":
+        return PickleSerializer()
+    if name == "struct":
+        if schema is None:
+            raise ValueError("The struct serializer needs a message schema")
+        return StructSerializer(schema)
+    raise ValueError(f"Unexpected serializer {name}")
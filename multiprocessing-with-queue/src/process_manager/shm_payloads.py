@@ -0,0 +1,252 @@
+"""
+Large payloads travel through shared memory segments, only a small handle goes through the queue.
+"""
+import io
+import logging
+import os
+import pickle
+import queue
+import threading
+from collections import OrderedDict
+from multiprocessing import resource_tracker
+from multiprocessing.context import BaseContext
+from multiprocessing.shared_memory import SharedMemory
+
+
+# kinds of large buffers
+_KIND_BUFFER = 0  # PickleBuffer handed out of band by pickle protocol 5
+_KIND_BYTES = 1
+_KIND_BYTEARRAY = 2
+
+_BUFFER_TYPES = {bytes: _KIND_BYTES, bytearray: _KIND_BYTEARRAY}
+
+
+class _OutOfBandPickler(pickle.Pickler):
+    """
+    Pickle protocol 5: objects reducing to a PickleBuffer, like numpy arrays, go to buffer_callback.
+    Protocol 5 still pickles bytes and bytearray inline, large ones go to buffer_callback as persistent ids instead.
+    """
+
+    def __init__(self, file, threshold: int, buffer_callback):
+        super().__init__(file, protocol=5, buffer_callback=lambda buffer: buffer_callback(buffer, _KIND_BUFFER))
+        self._threshold = threshold
+        self._buffer_callback = buffer_callback
+
+    def persistent_id(self, obj):
+        kind = _BUFFER_TYPES.get(type(obj))
+        if kind is None or len(obj) < self._threshold:
+            return None
+        return self._buffer_callback(pickle.PickleBuffer(obj), kind)
+
+
+class _OutOfBandUnpickler(pickle.Unpickler):
+
+    def __init__(self, file, views: list, kinds: list):
+        super().__init__(file, buffers=[view for view, kind in zip(views, kinds) if kind == _KIND_BUFFER])
+        self._views = views
+        self._kinds = kinds
+
+    def persistent_load(self, pid):
+        if self._kinds[pid] == _KIND_BYTES:
+            return bytes(self._views[pid])
+        return bytearray(self._views[pid])
+
+
+class OutOfBandBatch:
+    """What goes through the queue in place of a batch holding large payloads"""
+
+    __slots__ = ("data", "segments", "msg_count")
+
+    def __init__(self, data: bytes, segments: list, msg_count: int):
+        """
+        :param data: the batch, pickled with protocol 5 without its large buffers
+        :param segments: (segment name, buffer size, kind) of each large buffer, in pickling order.
+            PickleBuffer objects are rebuilt by pickle, bytes and bytearray ones are referenced by their index.
+        """
+        self.data = data
+        self.segments = segments
+        self.msg_count = msg_count
+
+    def __len__(self):
+        return self.msg_count
+
+    def __reduce__(self):
+        return OutOfBandBatch, (self.data, self.segments, self.msg_count)
+
+
+class PayloadLease:
+    """Keeps the segments of a batch in use until each message of the batch is done"""
+
+    def __init__(self, store: "ShmPayloadStore", segment_names: list, msg_count: int):
+        self._store = store
+        self._segment_names = segment_names
+        self._pending = msg_count
+        # consumer threads may finish messages of the same batch concurrently
+        self._lock = threading.Lock()
+
+    def done(self, msg_count: int = 1):
+        """Called by the worker once it is done with msg_count messages of the batch"""
+        with self._lock:
+            self._pending -= msg_count
+            if self._pending:
+                return
+        self._store.release(self._segment_names)
+
+
+class LeasedBatch(list):
+    """Batch unpacked from an OutOfBandBatch, lease.done() must be called for each message, control ones included"""
+
+    def __init__(self, msgs: list, lease: PayloadLease):
+        super().__init__(msgs)
+        self.lease = lease
+
+
+class ShmPayloadStore:
+    """
+    Moves buffers of threshold bytes or more out of pickled batches, into pooled shared memory segments.
+
+    Parent side, pack() pickles the batch once and copies each large buffer once into a segment. Worker side,
+    unpack() maps the segments and rebuilds the messages from them: objects supporting pickle protocol 5
+    out-of-band buffers keep pointing to shared memory, bytes and bytearray objects are copied out once.
+
+    Once a worker is done with all messages of a batch, it sends the segment names back and the parent
+    recycles the segments for later batches. Segments are sized in powers of 2 so they can be reused.
+    """
+
+    logger = logging.getLogger("ShmPayloadStore")
+
+    def __init__(self, ctx: BaseContext, threshold: int = 1 << 20, max_pooled: int = 8, max_attached: int = 16):
+        """
+        :param threshold: size in bytes above which a buffer goes through shared memory
+        :param max_pooled: parent side: maximum number of free segments kept for reuse, per segment size
+        :param max_attached: worker side: maximum number of segments kept mapped between batches
+        """
+        self._threshold = threshold
+        self._max_pooled = max_pooled
+        self._max_attached = max_attached
+        self._released = ctx.Queue()
+        self._owner_pid = os.getpid()
+        # workers register the segments they attach with a resource tracker, which unlinks them when it exits.
+        # Started now, before any worker, forked workers share it rather than each start one dying with them
+        resource_tracker.ensure_running()
+        # parent side
+        self._free = {}
+        self._in_use = {}
+        # worker side
+        self._attached = OrderedDict()
+        self._detached = []
+
+    @property
+    def threshold(self) -> int:
+        return self._threshold
+
+    @property
+    def segments_in_use(self) -> int:
+        """Parent side: segments holding payloads not processed yet"""
+        self._collect_released()
+        return len(self._in_use)
+
+    def pack(self, msgs: list):
+        """
+        Parent side. Workers passing control messages on get msgs back unchanged.
+        :return: an OutOfBandBatch, holding segments if any buffer is large enough
+        """
+        if os.getpid() != self._owner_pid:
+            return msgs
+        self._collect_released()
+        segments = []
+
+        def buffer_callback(buffer: pickle.PickleBuffer, kind: int):
+            """:return: index of the segment, or whether to pickle the buffer inline for PickleBuffer objects"""
+            view = buffer.raw()
+            if kind == _KIND_BUFFER and view.nbytes < self._threshold:
+                return True
+            shm = self._allocate(view.nbytes)
+            shm.buf[:view.nbytes] = view
+            segments.append((shm.name, view.nbytes, kind))
+            return False if kind == _KIND_BUFFER else len(segments) - 1
+
+        data = io.BytesIO()
+        _OutOfBandPickler(data, self._threshold, buffer_callback).dump(msgs)
+        # pickled once here: the transport only copies the resulting bytes
+        return OutOfBandBatch(data.getvalue(), segments, len(msgs))
+
+    def unpack(self, item) -> list:
+        """
+        Worker side.
+        :return: item itself if it is not an OutOfBandBatch, a LeasedBatch if the batch holds segments
+        """
+        if not isinstance(item, OutOfBandBatch):
+            return item
+        views = [self._attach(name).buf[:size] for name, size, _ in item.segments]
+        kinds = [kind for _, _, kind in item.segments]
+        msgs = _OutOfBandUnpickler(io.BytesIO(item.data), views, kinds).load()
+        if not item.segments:
+            return msgs
+        names = [name for name, _, _ in item.segments]
+        return LeasedBatch(msgs, PayloadLease(self, names, len(msgs)))
+
+    def release(self, segment_names: list):
+        """Worker side: let the parent reuse the segments"""
+        self._released.put(segment_names)
+
+    def close(self):
+        """Parent side: destroy all segments, whether in use or not"""
+        if os.getpid() != self._owner_pid:
+            return
+        self._collect_released()
+        for shm in list(self._in_use.values()) + [shm for pool in self._free.values() for shm in pool]:
+            shm.close()
+            shm.unlink()
+        self._in_use = {}
+        self._free = {}
+
+    def __getstate__(self):
+        # workers only need the release queue, not the parent's segments
+        state = self.__dict__.copy()
+        state["_free"] = {}
+        state["_in_use"] = {}
+        state["_attached"] = OrderedDict()
+        state["_detached"] = []
+        return state
+
+    def _allocate(self, size: int) -> SharedMemory:
+        capacity = 1 << (size - 1).bit_length()
+        pool = self._free.get(capacity)
+        shm = pool.pop() if pool else SharedMemory(create=True, size=capacity)
+        self._in_use[shm.name] = shm
+        return shm
+
+    def _collect_released(self):
+        while True:
+            try:
+                names = self._released.get_nowait()
+            except queue.Empty:
+                return
+            for name in names:
+                shm = self._in_use.pop(name)
+                pool = self._free.setdefault(shm.size, [])
+                if len(pool) < self._max_pooled:
+                    pool.append(shm)
+                else:
+                    shm.close()
+                    shm.unlink()
+
+    def _attach(self, name: str) -> SharedMemory:
+        shm = self._attached.pop(name, None) or SharedMemory(name)
+        self._attached[name] = shm
+        while len(self._attached) > self._max_attached:
+            _, evicted = self._attached.popitem(last=False)
+            self._detached.append(evicted)
+        self._close_detached()
+        return shm
+
+    def _close_detached(self):
+        still_exported = []
+        for shm in self._detached:
+            try:
+                shm.close()
+            except BufferError:
+                # messages still point to the segment
+                still_exported.append(shm)
+        self._detached = still_exported
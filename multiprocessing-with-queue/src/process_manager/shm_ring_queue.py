@@ -0,0 +1,127 @@
+"""
+Fixed capacity ring buffer living in a shared memory segment.
+"""
+import multiprocessing
+import os
+import pickle
+import queue
+import struct
+from multiprocessing.context import BaseContext
+from multiprocessing.shared_memory import SharedMemory
+
+
+class ShmRingQueue:
+    """
+    Drop-in replacement for multiprocessing.Queue backed by a ring of fixed-size slots in shared memory.
+
+    Items are pickled and stored length-prefixed in a slot, so there is no feeder thread and no pipe:
+    put() returns once the item is in shared memory and get() reads it straight from there.
+    Producers and consumers use separate locks, so a put() never waits for a get() to complete.
+
+    put() raises queue.Full and get() raises queue.Empty on timeout, like multiprocessing.Queue.
+    """
+
+    # the header holds two counters: items read so far (head) and items written so far (tail)
+    _COUNTER = struct.Struct("Q")
+    _HEAD_OFFSET = 0
+    _TAIL_OFFSET = _COUNTER.size
+    _HEADER_SIZE = 2 * _COUNTER.size
+    _LENGTH = struct.Struct("I")
+
+    def __init__(self, maxsize: int = 1, slot_size: int = 4096, ctx: BaseContext = None):
+        """
+        :param maxsize: number of slots, i.e. maximum number of items the queue can hold at any given time
+        :param slot_size: maximum size in bytes of a pickled item
+        :param ctx: multiprocessing context the locks are created from, default context if None
+        """
+        if maxsize < 1:
+            raise ValueError(f"maxsize must be at least 1, got {maxsize}")
+        self._maxsize = maxsize
+        self._slot_size = slot_size
+        self._stride = self._LENGTH.size + slot_size
+        self._shm = SharedMemory(create=True, size=self._HEADER_SIZE + maxsize * self._stride)
+        self._write_counter(self._HEAD_OFFSET, 0)
+        self._write_counter(self._TAIL_OFFSET, 0)
+        self._owner_pid = os.getpid()
+        ctx = ctx or multiprocessing.get_context()
+        self._free_slots = ctx.Semaphore(maxsize)
+        self._used_slots = ctx.Semaphore(0)
+        self._put_lock = ctx.Lock()
+        self._get_lock = ctx.Lock()
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @property
+    def slot_size(self) -> int:
+        return self._slot_size
+
+    def _read_counter(self, offset: int) -> int:
+        return self._COUNTER.unpack_from(self._shm.buf, offset)[0]
+
+    def _write_counter(self, offset: int, value: int):
+        self._COUNTER.pack_into(self._shm.buf, offset, value)
+
+    def _slot_offset(self, index: int) -> int:
+        return self._HEADER_SIZE + (index % self._maxsize) * self._stride
+
+    def put(self, obj, block: bool = True, timeout: float = None):
+        data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self._slot_size:
+            raise ValueError(f"Item of {len(data)} bytes does not fit in a {self._slot_size} bytes slot")
+
+        if not self._free_slots.acquire(block, timeout):
+            raise queue.Full
+
+        with self._put_lock:
+            tail = self._read_counter(self._TAIL_OFFSET)
+            offset = self._slot_offset(tail)
+            self._LENGTH.pack_into(self._shm.buf, offset, len(data))
+            offset += self._LENGTH.size
+            self._shm.buf[offset:offset + len(data)] = data
+            self._write_counter(self._TAIL_OFFSET, tail + 1)
+
+        self._used_slots.release()
+
+    def get(self, block: bool = True, timeout: float = None):
+        if not self._used_slots.acquire(block, timeout):
+            raise queue.Empty
+
+        with self._get_lock:
+            head = self._read_counter(self._HEAD_OFFSET)
+            offset = self._slot_offset(head)
+            (length,) = self._LENGTH.unpack_from(self._shm.buf, offset)
+            offset += self._LENGTH.size
+            data = bytes(self._shm.buf[offset:offset + length])
+            self._write_counter(self._HEAD_OFFSET, head + 1)
+
+        self._free_slots.release()
+        return pickle.loads(data)
+
+    def put_nowait(self, obj):
+        return self.put(obj, block=False)
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def qsize(self) -> int:
+        return self._read_counter(self._TAIL_OFFSET) - self._read_counter(self._HEAD_OFFSET)
+
+    def empty(self) -> bool:
+        return self.qsize() == 0
+
+    def full(self) -> bool:
+        return self.qsize() >= self._maxsize
+
+    def close(self):
+        """Release the shared memory segment. The process which created the queue also destroys it."""
+        if getattr(self, "_shm", None) is None:
+            return
+        self._shm.close()
+        if os.getpid() == self._owner_pid:
+            self._shm.unlink()
+        self._shm = None
+
+    def __del__(self):
+        self.close()
@@ -0,0 +1,347 @@
+"""
+Detects worker processes which died during ProcessManager.process(), replaces them and redelivers their messages.
+"""
+import logging
+import queue
+import threading
+from multiprocessing.context import BaseContext
+from time import perf_counter_ns, sleep
+
+from .msg_types import MSG_TYPE_USER
+from .worker_stats import WorkerStats
+
+
+class SupervisePolicy:
+    """
+    How a Supervisor watches the workers.
+
+    A message is redelivered each time the worker processing it dies, up to max_redeliveries times:
+    a message which keeps killing workers is then dropped.
+
+    A worker dying right after getting a batch, before recording it, leaves no trace of the batch: once a worker
+    died that way and no message completed for lost_after_sec, all live workers being idle, the batches
+    still unacknowledged are presumed lost and redelivered.
+    """
+
+    def __init__(self, interval_sec: float = 0.05, max_redeliveries: int = 3, ack_batch_size: int = 64,
+                 lost_after_sec: float = 1.0):
+        """
+        :param interval_sec: time between two checks of the workers
+        :param max_redeliveries: redeliveries of a single message before dropping it
+        :param ack_batch_size: number of batches a worker acknowledges at once
+        :param lost_after_sec: time without progress after which batches no worker recorded are redelivered
+        """
+        if max_redeliveries < 0:
+            raise ValueError(f"max_redeliveries must be at least 0, got {max_redeliveries}")
+        if ack_batch_size < 1:
+            raise ValueError(f"ack_batch_size must be at least 1, got {ack_batch_size}")
+        if lost_after_sec <= 0:
+            raise ValueError(f"lost_after_sec must be positive, got {lost_after_sec}")
+        self.interval_sec = interval_sec
+        self.max_redeliveries = max_redeliveries
+        self.ack_batch_size = ack_batch_size
+        self.lost_after_sec = lost_after_sec
+
+
+class SupervisorStats:
+    """What the supervisor did during a run"""
+
+    def __init__(self):
+        self.crashes = 0  # workers found dead and replaced
+        self.redelivered = 0  # messages put back on the transport
+        self.dropped = 0  # messages given up on after max_redeliveries
+        self.killed = 0  # workers killed and replaced because a message overran its timeout, see DeadlinePolicy
+        self.timed_out = 0  # messages given up on when killing their worker
+        self.wasted_ns = 0  # time the killed workers spent on these messages
+
+    def __repr__(self):
+        return (f"crashes={self.crashes} redelivered={self.redelivered} dropped={self.dropped} "
+                f"killed={self.killed}")
+
+
+class InFlightLedger:
+    """
+    Parent side reference to each batch put on the transport, until a worker acknowledges it.
+    A batch is identified by the sequence number of its first user message.
+    """
+
+    def __init__(self):
+        self._batches = {}
+        self._redeliveries = {}
+        # the producer adds batches while the supervisor acknowledges and takes them
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._batches)
+
+    def add(self, channel_index: int, msgs: list):
+        for msg_type, envelope in msgs:
+            if msg_type == MSG_TYPE_USER:
+                with self._lock:
+                    self._batches[envelope.seq] = (channel_index, msgs)
+                return
+
+    def ack(self, keys: list):
+        with self._lock:
+            for key in keys:
+                self._batches.pop(key, None)
+
+    def keys(self) -> set:
+        with self._lock:
+            return set(self._batches)
+
+    def take(self, key: int) -> tuple:
+        """:return: channel index and messages of the batch, None if already acknowledged"""
+        with self._lock:
+            return self._batches.pop(key, None)
+
+    def redelivered(self, seq: int) -> int:
+        """:return: number of times the message has now been redelivered"""
+        count = self._redeliveries.get(seq, 0) + 1
+        self._redeliveries[seq] = count
+        return count
+
+
+class AckLog:
+    """
+    Keys of the last capacity batches each worker is done with, whether the worker sent them to the supervisor or not.
+    In shared memory, so that the supervisor can still acknowledge them once the worker died:
+    keys sent just before dying may never have left the worker. Like WorkerStats, each worker only writes its own slot.
+    """
+
+    # per slot: keys added, keys sent, then the last keys added in a ring
+    _ADDED = 0
+    _SENT = 1
+    _HEADER = 2
+
+    def __init__(self, ctx: BaseContext, slot_count: int, capacity: int):
+        self._capacity = capacity
+        self._stride = self._HEADER + capacity
+        self._values = ctx.Array("q", slot_count * self._stride, lock=False)
+
+    def add(self, slot: int, key: int) -> bool:
+        """Worker side. :return: True once capacity keys were not sent"""
+        base = slot * self._stride
+        added = self._values[base + self._ADDED]
+        self._values[base + self._HEADER + added % self._capacity] = key
+        self._values[base + self._ADDED] = added + 1
+        return added + 1 - self._values[base + self._SENT] >= self._capacity
+
+    def unsent_count(self, slot: int) -> int:
+        base = slot * self._stride
+        return self._values[base + self._ADDED] - self._values[base + self._SENT]
+
+    def unsent(self, slot: int) -> list:
+        """Worker side"""
+        return self._last(slot * self._stride, self.unsent_count(slot))
+
+    def mark_sent(self, slot: int):
+        """Worker side"""
+        base = slot * self._stride
+        self._values[base + self._SENT] = self._values[base + self._ADDED]
+
+    def recent(self, slot: int) -> list:
+        """Parent side, once the worker is dead"""
+        base = slot * self._stride
+        return self._last(base, min(self._values[base + self._ADDED], self._capacity))
+
+    def reset(self, slot: int):
+        """Parent side: clear the slot of a dead worker before handing it to a new one"""
+        base = slot * self._stride
+        self._values[base + self._ADDED] = 0
+        self._values[base + self._SENT] = 0
+
+    def _last(self, base: int, count: int) -> list:
+        added = self._values[base + self._ADDED]
+        return [self._values[base + self._HEADER + index % self._capacity] for index in range(added - count, added)]
+
+
+class Supervisor(threading.Thread):
+    """
+    Watches the workers of a ProcessManager.process() run: a worker exiting with a non-zero code is replaced
+    in its slot, and the messages of the batch it held which it had not processed yet are put back on the transport.
+
+    Workers record the batch they hold and how many of its messages are done in their WorkerStats slot,
+    which outlives them. A worker dying between processing a message and recording it gets the message
+    processed twice. Workers acknowledge the batches they are done with a few at a time, and before waiting on
+    an empty channel, logging the last ones in an AckLog: once every live worker is idle, the batches
+    left in the ledger are the ones lost with a dead worker, see SupervisePolicy.lost_after_sec.
+
+    With DeadlinePolicy timeouts, a worker still running the same message kill_grace_sec after its timeout
+    is killed and replaced the same way, the message being given up on rather than redelivered.
+
+    A worker dying inside get() can leave the lock of a shared channel held, no supervisor can repair that.
+    """
+
+    logger = logging.getLogger("Supervisor")
+
+    # messages processed, or given up on by their worker
+    _COMPLETED_FIELDS = (WorkerStats.PROCESSED, WorkerStats.EXPIRED, WorkerStats.TIMED_OUT)
+
+    def __init__(self, proc_mgr, consumer, policy: SupervisePolicy, ledger: InFlightLedger, acks):
+        """
+        :param acks: queue of lists of batch keys sent by the workers
+        """
+        super().__init__(name="Supervisor", daemon=True)
+        self._proc_mgr = proc_mgr
+        self._consumer = consumer
+        self._policy = policy
+        self._ledger = ledger
+        self._acks = acks
+        self._stop_event = threading.Event()
+        self._redeliveries = []
+        # slot -> (held, done, running time) of the workers killed for overrunning
+        self._overruns = {}
+        # workers which died holding no batch, possibly right after getting one
+        self._unheld_deaths = 0
+        # ledger keys and completed messages when progress last stopped, see _recover_lost()
+        self._stall_start_ns = None
+        self._stall_keys = set()
+        self._stall_completed = None
+        self.stats = SupervisorStats()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        for redelivery in self._redeliveries:
+            redelivery.join()
+
+    def wait_completed(self, msg_count: int):
+        """Block until msg_count messages are processed or given up on, or the run is aborted"""
+        # pylint: disable=protected-access
+        while not self._proc_mgr._abort_event.is_set():
+            if self._completed() >= msg_count:
+                return
+            sleep(self._policy.interval_sec)
+
+    def run(self):
+        # pylint: disable=protected-access
+        deadlines = self._proc_mgr._deadlines
+        kill_after_ns = deadlines.kill_after_ns if deadlines is not None else None
+        while not self._stop_event.wait(self._policy.interval_sec):
+            self._collect_acks()
+            for slot, worker in enumerate(self._proc_mgr._slot_workers):
+                if worker is None:
+                    continue
+                if kill_after_ns is not None and worker.exitcode is None:
+                    self._kill_overrunning(slot, worker, kill_after_ns)
+                if worker.exitcode not in (None, 0):
+                    self._recover(slot, worker.exitcode)
+            if self._unheld_deaths:
+                self._recover_lost()
+        self._collect_acks()
+
+    def _completed(self) -> int:
+        """:return: messages processed or given up on so far"""
+        # pylint: disable=protected-access
+        worker_stats = self._proc_mgr._worker_stats
+        completed = sum(worker_stats.total(field) for field in self._COMPLETED_FIELDS)
+        return completed + self.stats.dropped + self.stats.timed_out
+
+    def _kill_overrunning(self, slot: int, worker, kill_after_ns: int):
+        # pylint: disable=protected-access
+        worker_stats = self._proc_mgr._worker_stats
+        start_ns = worker_stats.get(slot, WorkerStats.MSG_START_NS)
+        running_ns = perf_counter_ns() - start_ns
+        if not start_ns or running_ns < kill_after_ns:
+            return
+        # the worker may finish its message before the kill lands, _recover() then sees it moved on
+        held = worker_stats.get(slot, WorkerStats.HELD)
+        done = worker_stats.get(slot, WorkerStats.HELD_DONE)
+        self.logger.warning("Worker %d still running a message after %.3f sec, killing it", slot, running_ns / 1e9)
+        worker.kill()
+        worker.join()
+        self._overruns[slot] = (held, done, running_ns)
+
+    def _collect_acks(self):
+        while True:
+            try:
+                self._ledger.ack(self._acks.get_nowait())
+            except queue.Empty:
+                return
+
+    def _recover(self, slot: int, exitcode: int):
+        # pylint: disable=protected-access
+        ack_log = self._proc_mgr._ack_log
+        self._ledger.ack(ack_log.recent(slot))
+        ack_log.reset(slot)
+        worker_stats = self._proc_mgr._worker_stats
+        held = worker_stats.get(slot, WorkerStats.HELD)
+        done = worker_stats.get(slot, WorkerStats.HELD_DONE)
+        overrun = self._overruns.pop(slot, None)
+        overran = overrun is not None and overrun[:2] == (held, done)
+        if overrun is not None:
+            self.stats.killed += 1
+            self.logger.warning("Replacing worker %d", slot)
+        else:
+            self.stats.crashes += 1
+            self.logger.warning("Worker %d died with exit code %d, replacing it", slot, exitcode)
+        self._proc_mgr._respawn_worker(self._consumer, slot)
+
+        batch = self._ledger.take(held - 1) if held else None
+        if batch is None:
+            if not held:
+                self._unheld_deaths += 1
+            return
+        channel_index, msgs = batch
+        remaining = [msg for msg in msgs if msg[0] == MSG_TYPE_USER][done:]
+        # the worker died processing the first message not done
+        if remaining and overran:
+            self.logger.warning("Giving up on message %d, which timed out", remaining[0][1].seq)
+            self.stats.timed_out += 1
+            self.stats.wasted_ns += overrun[2]
+            remaining = remaining[1:]
+        elif remaining and self._ledger.redelivered(remaining[0][1].seq) > self._policy.max_redeliveries:
+            self.logger.warning("Dropping message %d after %d redeliveries",
+                                remaining[0][1].seq, self._policy.max_redeliveries)
+            self.stats.dropped += 1
+            remaining = remaining[1:]
+        if remaining:
+            self._put_back(channel_index, remaining)
+
+    def _recover_lost(self):
+        """
+        Redeliver the batches which stayed unacknowledged while no message completed for lost_after_sec
+        and all live workers were idle: idle workers have acknowledged all they did.
+        """
+        # pylint: disable=protected-access
+        worker_stats = self._proc_mgr._worker_stats
+        completed = self._completed()
+        idle = not any(worker_stats.get(slot, WorkerStats.HELD) for slot in self._proc_mgr._live_worker_slots())
+        if not idle or completed != self._stall_completed:
+            self._stall_start_ns = None
+            self._stall_completed = completed
+            return
+        if self._stall_start_ns is None:
+            self._stall_start_ns = perf_counter_ns()
+            self._stall_keys = self._ledger.keys()
+            return
+        if perf_counter_ns() - self._stall_start_ns < self._policy.lost_after_sec * 1e9:
+            return
+        self._unheld_deaths = 0
+        self._stall_start_ns = None
+        # batches put since the stall started may still be on their way to a worker
+        for key in sorted(self._stall_keys & self._ledger.keys()):
+            batch = self._ledger.take(key)
+            if batch is None:
+                continue
+            channel_index, msgs = batch
+            self.logger.warning("Batch %d was lost with a worker which died before recording it", key)
+            self._put_back(channel_index, [msg for msg in msgs if msg[0] == MSG_TYPE_USER])
+
+    def _put_back(self, channel_index: int, msgs: list):
+        self._ledger.add(channel_index, msgs)
+        self.stats.redelivered += len(msgs)
+        # the channel may be full until the replacement starts, which may die in turn: never block watching
+        redelivery = threading.Thread(target=self._redeliver, args=(channel_index, msgs),
+                                      name=f"Redeliver-{msgs[0][1].seq}", daemon=True)
+        redelivery.start()
+        self._redeliveries = [thread for thread in self._redeliveries if thread.is_alive()] + [redelivery]
+
+    def _redeliver(self, channel_index: int, msgs: list):
+        # pylint: disable=protected-access
+        try:
+            self._proc_mgr._enqueuer.put_many(self._proc_mgr._transport.channel(channel_index), msgs)
+        except Exception:  # pylint: disable=broad-exception-caught
+            self.logger.exception("Dropping %d messages which could not be redelivered", len(msgs))
+            self.stats.dropped += len(msgs)
@@ -0,0 +1,420 @@
+"""
+Ways of moving batches of messages from the parent process to the worker processes.
+
+Each transport exposes one or more queue-like channels:
+put(obj, block, timeout) raises queue.Full and get(block, timeout) raises queue.Empty on timeout,
+so channels can be handed to MsgEnqueuer and MsgDequeuer like a multiprocessing.Queue.
+"""
+import multiprocessing
+import queue
+from multiprocessing.connection import Connection, wait
+from multiprocessing.context import BaseContext
+from time import perf_counter
+
+from .dispatch import DispatchPolicy, RoundRobinDispatch
+from .lanes import LanePolicy
+from .shm_ring_queue import ShmRingQueue
+
+
+class Transport:
+    """
+    Transport interface.
+
+    The parent process puts batches on channel(route(msg)), worker i gets them from worker_channel(i).
+    A shared transport has a single channel all workers compete for,
+    otherwise there is one channel per worker.
+    """
+
+    shared: bool = True
+
+    def open(self, consumer_count: int):
+        """Prepare channels for consumer_count workers. Called before starting the workers."""
+
+    @property
+    def channel_count(self) -> int:
+        return 1
+
+    def channel(self, index: int):
+        """Parent side of a channel"""
+        raise NotImplementedError()
+
+    def worker_channel(self, worker_index: int):
+        """Worker side of the channel read by the specified worker"""
+        return self.channel(0)
+
+    def route(self, msg) -> int:
+        """Index of the channel the specified message should be put on"""
+        return 0
+
+    @property
+    def priority_count(self) -> int:
+        """Number of priority lanes, route() then returning the priority of each message, 0 the most urgent"""
+        return 1
+
+    def control_channel(self):
+        """Shared transports: parent side of the channel control messages are put on, behind all user messages"""
+        return self.channel(0)
+
+    def complete(self, worker_index: int, msg_count: int):
+        """Called by a worker after processing msg_count messages"""
+
+    def close(self):
+        """Release resources held by the transport"""
+
+
+class QueueTransport(Transport):
+    """A single multiprocessing.Queue shared by all workers"""
+
+    def __init__(self, maxsize: int = 1, ctx: BaseContext = None):
+        self._q = (ctx or multiprocessing.get_context()).Queue(maxsize)
+
+    def channel(self, index: int):
+        return self._q
+
+
+class ShmRingTransport(Transport):
+    """A single shared memory ring buffer shared by all workers"""
+
+    def __init__(self, maxsize: int = 1, slot_size: int = 4096, ctx: BaseContext = None):
+        self._q = ShmRingQueue(maxsize, slot_size, ctx)
+
+    def channel(self, index: int):
+        return self._q
+
+    def close(self):
+        self._q.close()
+
+
+class _SimpleQueueChannel:
+    """
+    Adds timeouts to multiprocessing.SimpleQueue, which is unbounded and has a blocking get() only.
+    Another worker can win the race for the item announced by poll(): get() then waits for the next item.
+    """
+
+    def __init__(self, ctx: BaseContext):
+        self._q = ctx.SimpleQueue()
+
+    def put(self, obj, block: bool = True, timeout: float = None):
+        self._q.put(obj)
+
+    def get(self, block: bool = True, timeout: float = None):
+        # pylint: disable=protected-access
+        if not self._q._reader.poll(timeout if block else 0):
+            raise queue.Empty
+        return self._q.get()
+
+
+class SimpleQueueTransport(Transport):
+    """A single multiprocessing.SimpleQueue shared by all workers. Unbounded: put() never raises queue.Full."""
+
+    def __init__(self, ctx: BaseContext = None):
+        self._q = _SimpleQueueChannel(ctx or multiprocessing.get_context())
+
+    def channel(self, index: int):
+        return self._q
+
+
+class _PipeSender:
+    """Parent end of a one-way pipe. Unbounded: send() blocks when the OS pipe buffer is full."""
+
+    def __init__(self, conn: Connection):
+        self._conn = conn
+
+    def put(self, obj, block: bool = True, timeout: float = None):
+        self._conn.send(obj)
+
+
+class _PipeReceiver:
+    """Worker end of a one-way pipe"""
+
+    def __init__(self, conn: Connection):
+        self._conn = conn
+
+    def get(self, block: bool = True, timeout: float = None):
+        if not self._conn.poll(timeout if block else 0):
+            raise queue.Empty
+        return self._conn.recv()
+
+
+class PerWorkerTransport(Transport):
+    """
+    One channel per worker, so workers never compete for a lock.
+    Messages are routed by a dispatch policy, workers send back credits for each message they processed.
+    """
+
+    shared = False
+
+    def __init__(self, dispatch: DispatchPolicy = None, ctx: BaseContext = None):
+        """
+        :param dispatch: how messages are spread across workers, round-robin by default
+        """
+        self._dispatch = dispatch if dispatch is not None else RoundRobinDispatch()
+        self._ctx = ctx or multiprocessing.get_context()
+        self._senders = []
+        self._receivers = []
+        self._completed = None
+
+    def _create_channel(self) -> tuple:
+        """:return: parent side, worker side"""
+        raise NotImplementedError()
+
+    def open(self, consumer_count: int):
+        self.close()
+        for _ in range(consumer_count):
+            sender, receiver = self._create_channel()
+            self._senders.append(sender)
+            self._receivers.append(receiver)
+        # each worker only ever writes its own slot
+        self._completed = self._ctx.Array("q", consumer_count, lock=False)
+        self._dispatch.open(consumer_count, self._completed)
+
+    @property
+    def channel_count(self) -> int:
+        return len(self._senders)
+
+    def channel(self, index: int):
+        return self._senders[index]
+
+    def worker_channel(self, worker_index: int):
+        return self._receivers[worker_index]
+
+    def route(self, msg) -> int:
+        return self._dispatch.route(msg)
+
+    def complete(self, worker_index: int, msg_count: int):
+        self._completed[worker_index] += msg_count
+
+    def close(self):
+        self._senders = []
+        self._receivers = []
+
+
+class PipeTransport(PerWorkerTransport):
+    """One multiprocessing.Pipe per worker"""
+
+    def _create_channel(self) -> tuple:
+        receiver, sender = self._ctx.Pipe(duplex=False)
+        return _PipeSender(sender), _PipeReceiver(receiver)
+
+    def close(self):
+        # pylint: disable=protected-access
+        for endpoint in self._senders + self._receivers:
+            endpoint._conn.close()
+        super().close()
+
+
+class QueuePerWorkerTransport(PerWorkerTransport):
+    """One bounded multiprocessing.Queue per worker"""
+
+    def __init__(self, maxsize: int = 1, dispatch: DispatchPolicy = None, ctx: BaseContext = None):
+        super().__init__(dispatch, ctx)
+        self._maxsize = maxsize
+
+    def _create_channel(self) -> tuple:
+        q = self._ctx.Queue(self._maxsize)
+        return q, q
+
+
+class ManagerQueueTransport(Transport):
+    """A single queue.Queue living in a Manager server process, accessed by all workers through a proxy"""
+
+    def __init__(self, maxsize: int = 1, ctx: BaseContext = None):
+        self._manager = (ctx or multiprocessing.get_context()).Manager()
+        self._q = self._manager.Queue(maxsize)
+
+    def channel(self, index: int):
+        return self._q
+
+    def close(self):
+        if self._manager is not None:
+            self._manager.shutdown()
+
+    def __getstate__(self):
+        # workers only need the proxy, the manager itself cannot be pickled
+        state = self.__dict__.copy()
+        state["_manager"] = None
+        return state
+
+
+class _LaneMark:
+    """Put on every lane ahead of each control message, see _ControlChannel"""
+
+
+# fields of PriorityTransport._marks
+_MARKS_PUT = 0
+_MARKS_TAKEN = 1
+
+
+class _ControlChannel:
+    """
+    Parent side of the control lane of a PriorityTransport.
+
+    Each lane is a multiprocessing.Queue: a put only reaches the lane once its feeder thread has written it,
+    so a worker finding the lanes empty does not mean the lanes are drained. Each control message is therefore
+    preceded by a mark on every lane, and workers only read the control lane once every mark put has been taken:
+    batches are taken in order from each lane, so all batches put before the marks have been taken by then.
+    """
+
+    def __init__(self, lanes: list, control: multiprocessing.Queue, marks):
+        self._lanes = lanes
+        self._control = control
+        self._marks = marks
+
+    def put(self, obj, block: bool = True, timeout: float = None):
+        for lane in self._lanes:
+            # counted before the put, so that the marks taken never exceed the marks put
+            with self._marks.get_lock():
+                self._marks[_MARKS_PUT] += 1
+            try:
+                lane.put(_LaneMark(), block, timeout)
+            except queue.Full:
+                with self._marks.get_lock():
+                    self._marks[_MARKS_PUT] -= 1
+                raise
+        self._control.put(obj, block, timeout)
+
+
+class _LaneChannel:
+    """
+    Worker side of a PriorityTransport: gets from the lanes in the order of the worker's LaneScheduler,
+    and from the control lane only once the lanes are drained of everything put before the control messages.
+    """
+
+    # longest wait between two passes over the lanes, another worker may have won the race for an item
+    _WAIT_SEC = 0.05
+
+    def __init__(self, lanes: list, control: multiprocessing.Queue, marks, policy: LanePolicy):
+        # pylint: disable=protected-access
+        self._lanes = lanes
+        self._control = control
+        self._marks = marks
+        self._scheduler = policy.scheduler()
+        self._readers = [lane._reader for lane in lanes] + [control._reader]
+
+    def put(self, obj, block: bool = True, timeout: float = None):
+        """Retiring workers pass QUIT messages on: no marks needed, the lanes are drained by then"""
+        self._control.put(obj, block, timeout)
+
+    def get(self, block: bool = True, timeout: float = None):
+        deadline = None if timeout is None else perf_counter() + timeout
+        while True:
+            try:
+                return self._get_nowait()
+            except queue.Empty:
+                if not block:
+                    raise
+            wait_sec = self._WAIT_SEC
+            if deadline is not None:
+                wait_sec = min(wait_sec, deadline - perf_counter())
+                if wait_sec <= 0:
+                    raise queue.Empty
+            wait(self._readers, wait_sec)
+
+    def _get_nowait(self):
+        now = perf_counter()
+        for lane in self._scheduler.order(now):
+            item = self._get_lane_nowait(lane)
+            if item is None:
+                self._scheduler.empty(lane, now)
+                continue
+            self._scheduler.served(lane, now)
+            return item
+        with self._marks.get_lock():
+            drained = self._marks[_MARKS_TAKEN] >= self._marks[_MARKS_PUT]
+        if not drained:
+            # some marks, and possibly batches ahead of them, are still on their way to the lanes
+            raise queue.Empty
+        return self._control.get(block=False)
+
+    def _get_lane_nowait(self, lane: int):
+        """:return: next batch of the lane, None if it has none, skipping marks"""
+        while True:
+            try:
+                item = self._lanes[lane].get(block=False)
+            except queue.Empty:
+                return None
+            if not isinstance(item, _LaneMark):
+                return item
+            with self._marks.get_lock():
+                self._marks[_MARKS_TAKEN] += 1
+
+
+class PriorityTransport(Transport):
+    """
+    One multiprocessing.Queue per priority, shared by all workers, see LanePolicy.
+    Messages are routed by their priority field, 0 being the most urgent.
+    Control messages have a lane of their own, which workers only read once all batches put before them are taken.
+    """
+
+    def __init__(self, maxsize: int = 1, policy: LanePolicy = None, priority_field: str = "priority",
+                 ctx: BaseContext = None):
+        """
+        :param maxsize: maximum number of batches each lane can hold at any given time
+        :param policy: how workers choose among lanes, two strict lanes by default
+        :param priority_field: msg[priority_field] for dict messages, the attribute otherwise.
+            Messages without one, and out of range priorities, go to the least urgent lane.
+        """
+        ctx = ctx or multiprocessing.get_context()
+        self._policy = policy if policy is not None else LanePolicy()
+        self._priority_field = priority_field
+        self._lanes = [ctx.Queue(maxsize) for _ in range(self._policy.priority_count)]
+        self._control = ctx.Queue()
+        self._marks = ctx.Array("q", 2)
+
+    @property
+    def channel_count(self) -> int:
+        return len(self._lanes)
+
+    @property
+    def priority_count(self) -> int:
+        return len(self._lanes)
+
+    def channel(self, index: int):
+        return self._lanes[index]
+
+    def control_channel(self):
+        return _ControlChannel(self._lanes, self._control, self._marks)
+
+    def worker_channel(self, worker_index: int):
+        return _LaneChannel(self._lanes, self._control, self._marks, self._policy)
+
+    def route(self, msg) -> int:
+        if isinstance(msg, dict):
+            priority = msg.get(self._priority_field)
+        else:
+            priority = getattr(msg, self._priority_field, None)
+        least_urgent = len(self._lanes) - 1
+        if not isinstance(priority, int) or not 0 <= priority <= least_urgent:
+            return least_urgent
+        return priority
+
+
+TRANSPORTS = ["queue", "simple_queue", "pipe", "queue_per_worker", "manager_queue", "shm_ring", "priority"]
+
+
+def create_transport(name: str, maxsize: int = 1, shm_slot_size: int = 4096,
+                     dispatch: DispatchPolicy = None, ctx: BaseContext = None,
+                     lane_policy: LanePolicy = None) -> Transport:
+    """
+    :param name: one of TRANSPORTS
+    :param maxsize: maximum number of batches a bounded channel can hold at any given time
+    :param shm_slot_size: shm_ring only: maximum size in bytes of a pickled batch
+    :param dispatch: pipe and queue_per_worker only: how messages are spread across workers
+    :param ctx: multiprocessing context of the ProcessManager using the transport, default context if None
+    :param lane_policy: priority only: number of lanes and how workers choose among them
+    """
+    if name == "queue":
+        return QueueTransport(maxsize, ctx)
+    if name == "simple_queue":
+        return SimpleQueueTransport(ctx)
+    if name == "pipe":
+        return PipeTransport(dispatch, ctx)
+    if name == "queue_per_worker":
+        return QueuePerWorkerTransport(maxsize, dispatch, ctx)
+    if name == "manager_queue":
+        return ManagerQueueTransport(maxsize, ctx)
+    if name == "shm_ring":
+        return ShmRingTransport(maxsize, shm_slot_size, ctx)
+    if name == "priority":
+        return PriorityTransport(maxsize, lane_policy, ctx=ctx)
+    raise ValueError(f"Unexpected transport {name}")
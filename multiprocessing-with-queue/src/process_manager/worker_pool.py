@@ -0,0 +1,148 @@
+"""
+Worker processes kept alive across several ProcessManager runs.
+"""
+import logging
+import os
+import queue
+from multiprocessing.context import BaseContext
+
+from src.perf import duration_s
+from .interfaces import MsgConsumer
+from .process_manager import ProcessManager
+
+
+class WorkerControl:
+    """Lets the pool know where its workers are, and hold them between runs"""
+
+    def __init__(self, ctx: BaseContext):
+        self._acks = ctx.Queue()
+        self._resume = ctx.Semaphore(0)
+
+    def end_run(self):
+        """Worker side: report the end of the run, then wait for the next one"""
+        self._acks.put(os.getpid())
+        self._resume.acquire()
+
+    def retire(self):
+        """Worker side: report leaving the pool"""
+        self._acks.put(os.getpid())
+
+    def wait_ack(self, workers: list, timeout: float = 0.1) -> int:
+        """Parent side: pid of the next worker reporting, fail if all workers are gone"""
+        while True:
+            try:
+                return self._acks.get(timeout=timeout)
+            except queue.Empty:
+                if not any(worker.is_alive() for worker in workers):
+                    raise RuntimeError("All pool workers terminated unexpectedly") from None
+
+    def resume(self):
+        """Parent side: let a worker waiting in end_run() go on"""
+        self._resume.release()
+
+
+class WorkerPool:
+    """
+    Long-lived worker processes, reused by successive runs so that process startup is paid once.
+
+    Between runs the number of active workers can grow (new processes are started)
+    or shrink (surplus workers are retired). Requires a transport with a shared channel.
+    """
+
+    logger = logging.getLogger("WorkerPool")
+
+    def __init__(self, proc_mgr: ProcessManager, consumer: MsgConsumer):
+        """
+        :param proc_mgr: provides transport, enqueuer and dequeuer
+        :param consumer: processes one message at a time, in every worker of the pool
+        """
+        # pylint: disable=protected-access
+        if not proc_mgr._transport.shared:
+            raise ValueError("WorkerPool requires a transport with a shared channel")
+        self._proc_mgr = proc_mgr
+        self._consumer = consumer
+        self._control = WorkerControl(proc_mgr.context)
+        self._workers = []
+        self._parked = 0
+        self._next_worker_index = 0
+
+    @property
+    def worker_count(self) -> int:
+        return len(self._workers)
+
+    def resize(self, worker_count: int) -> float:
+        """
+        Start or retire workers, then wait until every worker is ready for the next run.
+        :return: time spent (warm-up cost), in seconds
+        """
+        if worker_count < 1:
+            raise ValueError(f"worker_count must be at least 1, got {worker_count}")
+        elapsed, _ = duration_s(self._resize, worker_count)
+        self.logger.debug("Resized to %d workers in %f sec", worker_count, elapsed)
+        return elapsed
+
+    def run(self, producer, producer_count: int = 1) -> int:
+        """
+        Process all messages from the producer, leaving the workers running.
+        :param producer: source of messages, or list of MsgProducer, see ProcessManager.process()
+        :param producer_count: split a single producer into these many shards, see ProcessManager.process()
+        :return: number of messages processed
+        """
+        # pylint: disable=protected-access
+        if not self._workers:
+            raise ValueError("The pool has no workers, call resize() first")
+        self._resume_parked()
+        self._proc_mgr._begin_run(len(self._workers))
+        msg_count = self._proc_mgr._produce(self._proc_mgr._producers(producer, producer_count))
+        self._end_run()
+        return msg_count
+
+    def close(self):
+        """Stop all workers"""
+        # pylint: disable=protected-access
+        if not self._workers:
+            return
+        self._resume_parked()
+        self._proc_mgr._enqueue_quit(len(self._workers))
+        self._proc_mgr._join_workers(self._workers)
+        self._workers = []
+
+    def _resize(self, worker_count: int):
+        # pylint: disable=protected-access
+        self._resume_parked()
+
+        while len(self._workers) < worker_count:
+            worker = self._proc_mgr._start_worker(self._consumer, self._next_worker_index, self._control)
+            self._next_worker_index += 1
+            self._workers.append(worker)
+
+        surplus = len(self._workers) - worker_count
+        for _ in range(surplus):
+            self._put_control_msg(ProcessManager.MSG_TYPE_RETIRE)
+        retired_pids = {self._control.wait_ack(self._workers) for _ in range(surplus)}
+        retired = [worker for worker in self._workers if worker.pid in retired_pids]
+        self._proc_mgr._join_workers(retired)
+        self._workers = [worker for worker in self._workers if worker.pid not in retired_pids]
+
+        # returns once all workers, including new ones, are up and waiting
+        self._end_run()
+
+    def _end_run(self):
+        """
+        One END_RUN message per worker: each worker acknowledges it and then waits,
+        so it cannot take another worker's END_RUN.
+        """
+        for _ in self._workers:
+            self._put_control_msg(ProcessManager.MSG_TYPE_END_RUN)
+        for _ in self._workers:
+            self._control.wait_ack(self._workers)
+        self._parked = len(self._workers)
+
+    def _resume_parked(self):
+        for _ in range(self._parked):
+            self._control.resume()
+        self._parked = 0
+
+    def _put_control_msg(self, msg_type: int):
+        # pylint: disable=protected-access
+        self._proc_mgr._enqueuer.put_many(self._proc_mgr._transport.control_channel(), [(msg_type, "")])
@@ -0,0 +1,86 @@
+"""
+Per-worker and per-producer counters in shared memory, written by the workers and producers
+and read by the parent process.
+"""
+from multiprocessing.context import BaseContext
+
+
+class SlotCounters:
+    """
+    A fixed number of slots, each holding _FIELD_COUNT 64-bit counters.
+
+    Each process only ever writes its own slot, so no lock is needed:
+    the parent may read a slightly stale value, never a torn one.
+    """
+
+    _FIELD_COUNT = 0
+
+    def __init__(self, ctx: BaseContext, slot_count: int):
+        self._slot_count = slot_count
+        self._values = ctx.Array("q", slot_count * self._FIELD_COUNT, lock=False)
+
+    @property
+    def slot_count(self) -> int:
+        return self._slot_count
+
+    def get(self, slot: int, field: int) -> int:
+        return self._values[slot * self._FIELD_COUNT + field]
+
+    def set(self, slot: int, field: int, value: int):
+        self._values[slot * self._FIELD_COUNT + field] = value
+
+    def add(self, slot: int, field: int, value: int):
+        """Add value to a counter of the caller's own slot"""
+        self._values[slot * self._FIELD_COUNT + field] += value
+
+    def reset(self, slot: int):
+        """Parent side: clear a slot before handing it to a new process"""
+        for field in range(self._FIELD_COUNT):
+            self.set(slot, field, 0)
+
+    def total(self, field: int) -> int:
+        return sum(self.get(slot, field) for slot in range(self._slot_count))
+
+
+class WorkerStats(SlotCounters):
+    """One slot per worker"""
+
+    PROCESSED = 0  # messages processed
+    BUSY_NS = 1  # time spent processing messages
+    FIRST_GET_NS = 2  # perf_counter_ns() when the worker first tried to get a message
+    RETIRE = 3  # set by the parent: the worker should exit after its current batch
+    CPU = 4  # 1 + CPU the worker last ran on, when it started and when it exited, 0 if unknown
+    HELD = 5  # supervised runs: 1 + key of the batch the worker is processing, 0 if none
+    HELD_DONE = 6  # supervised runs: messages of the held batch already processed, expired or timed out
+    EXPIRED = 7  # messages skipped because they expired before starting
+    TIMED_OUT = 8  # messages interrupted because they ran too long
+    WASTED_NS = 9  # time spent processing messages which then timed out
+    MSG_START_NS = 10  # supervised runs with timeouts: perf_counter_ns() when the current message started, 0 if none
+    WAIT_NS = 11  # metrics only: time spent in get() calls, see MsgProcessor.publish_to()
+    RETRIES = 12  # metrics only: get() attempts which timed out
+
+    _FIELD_COUNT = 13
+
+    # describe the process in the slot rather than count what happened during the run
+    _PROCESS_FIELDS = (FIRST_GET_NS, CPU, HELD, HELD_DONE, MSG_START_NS)
+
+    def reset_process(self, slot: int):
+        """Parent side: hand a slot over to a new process, keeping the counters of the previous ones"""
+        for field in self._PROCESS_FIELDS:
+            self.set(slot, field, 0)
+
+    def record(self, slot: int, msg_count: int, busy_ns: int):
+        """Worker side: account for msg_count messages processed in busy_ns"""
+        base = slot * self._FIELD_COUNT
+        self._values[base + self.PROCESSED] += msg_count
+        self._values[base + self.BUSY_NS] += busy_ns
+
+
+class ProducerStats(SlotCounters):
+    """One slot per producer, metrics only"""
+
+    ENQUEUED = 0  # user messages put on the transport
+    WAIT_NS = 1  # time spent in put() calls, blocked on a full channel included, see MsgProcessor.publish_to()
+    RETRIES = 2  # put() attempts which timed out
+
+    _FIELD_COUNT = 3
@@ -0,0 +1,129 @@
+"""
+Parameter sweeps over several config items at once, and their comparison against a saved baseline.
+
+A sweep file is a config file in which some items are lists of values rather than single values:
+every combination of these values is run.
+"""
+import itertools
+import json
+import logging
+
+from src.config import Config
+
+
+class Sweep:
+    """Cartesian product of the values of the swept config items"""
+
+    # config items which can be swept
+    AXES = [
+        "consumer_count",
+        "producer_count",
+        "queue_max_size",
+        "msg_count",
+        "payload_size",
+        "task_duration_sec",
+        "batch_size",
+        "adaptive_chunking",
+        "consumer_threads",
+        "cpu_affinity",
+        "crash_probability",
+        "queue_backend",
+        "lane_mode",
+        "serializer",
+    ]
+
+    # config items holding a list of values even when not swept
+    LIST_ITEMS = ["forkserver_preload", "affinity_cores", "lane_weights"]
+
+    def __init__(self, config: Config):
+        """
+        :param config: as loaded from a sweep file, swept items holding a list of values
+        """
+        self.axes = {}
+        for item in list(config):
+            if not isinstance(config[item], list) or item in self.LIST_ITEMS:
+                continue
+            if item not in self.AXES:
+                raise ValueError(f"Cannot sweep {item}, expected one of {', '.join(self.AXES)}")
+            if not config[item]:
+                raise ValueError(f"No value to sweep for {item}")
+            self.axes[item] = list(config[item])
+        self.config = Config(config)
+
+    @classmethod
+    def from_file(cls, filename: str) -> "Sweep":
+        return cls(Config.from_file(filename))
+
+    def __len__(self):
+        count = 1
+        for values in self.axes.values():
+            count *= len(values)
+        return count
+
+    def points(self):
+        """
+        Yield the config of each combination, the last axis varying fastest.
+        The config attribute is updated and yielded each time.
+        """
+        for values in itertools.product(*self.axes.values()):
+            for item, value in zip(self.axes, values):
+                self.config[item] = value
+            yield self.config
+
+
+def point_key(run: dict, axes: list) -> tuple:
+    """Values of the swept items in a run of a session JSON file"""
+    return tuple(run.get("config", {}).get(item) for item in axes)
+
+
+def compare_to_baseline(runs: list, baseline_runs: list, axes: list, threshold_pct: float) -> list:
+    """
+    Compare the throughput of each point with the baseline point having the same swept values.
+    :param runs: "runs" of a session JSON file, see SessionReport
+    :param baseline_runs: "runs" of an earlier session JSON file
+    :param threshold_pct: report a regression when throughput drops by more than this percentage
+    :return: one dict per regression: point, msgs_per_sec, baseline_msgs_per_sec, change_pct,
+        and one dict per point which could not be compared: point, error
+    """
+    logger = logging.getLogger("Sweep")
+
+    baseline = {point_key(run, axes): run for run in baseline_runs}
+    regressions = []
+    for run in runs:
+        key = point_key(run, axes)
+        point = dict(zip(axes, key))
+        if key not in baseline:
+            logger.warning("No baseline for %s", point)
+            continue
+        try:
+            msgs_per_sec = float(run["msgs_per_sec"])
+            baseline_msgs_per_sec = float(baseline[key]["msgs_per_sec"])
+            change_pct = 100 * (msgs_per_sec - baseline_msgs_per_sec) / baseline_msgs_per_sec
+        except KeyError as ex:
+            regressions.append(_comparison_error(point, f"no {ex.args[0]} to compare"))
+            continue
+        except (TypeError, ValueError, ZeroDivisionError) as ex:
+            regressions.append(_comparison_error(point, f"invalid msgs_per_sec: {ex}"))
+            continue
+        if change_pct < -threshold_pct:
+            logger.error("Regression %+.1f%% at %s: %.1f msgs/sec, baseline %.1f",
+                         change_pct, point, msgs_per_sec, baseline_msgs_per_sec)
+            regressions.append({
+                "point": point,
+                "msgs_per_sec": msgs_per_sec,
+                "baseline_msgs_per_sec": baseline_msgs_per_sec,
+                "change_pct": change_pct,
+            })
+        else:
+            logger.info("%+.1f%% at %s", change_pct, point)
+    return regressions
+
+
+def _comparison_error(point: dict, error: str) -> dict:
+    logging.getLogger("Sweep").error("Cannot compare %s with the baseline: %s", point, error)
+    return {"point": point, "error": error}
+
+
+def load_runs(filename: str) -> list:
+    with open(filename, encoding="utf-8") as json_file:
+        return json.load(json_file)["runs"]
@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+from src.process_manager import create_affinity_policy
+from src.process_manager.affinity import CompactAffinity
+from src.process_manager.affinity import ExplicitAffinity
+from src.process_manager.affinity import ScatterAffinity
+from src.process_manager.affinity import current_cpu
+from src.process_manager.affinity import numa_nodes
+from src.process_manager.affinity import parse_cpu_list
+
+# two NUMA nodes of four CPUs
+NODES = [[0, 1, 2, 3], [4, 5, 6, 7]]
+
+
+class TestTopology:
+
+    def test_should_parse_cpu_lists(self):
+        assert parse_cpu_list("0-3,8,10-11\n") == [0, 1, 2, 3, 8, 10, 11]
+        assert parse_cpu_list("5") == [5]
+
+    def test_nodes_should_only_hold_allowed_cpus(self):
+        nodes = numa_nodes()
+        assert nodes
+        assert sorted(cpu for node in nodes for cpu in node) == sorted(os.sched_getaffinity(0))
+
+    def test_current_cpu_should_be_allowed(self):
+        assert current_cpu() in os.sched_getaffinity(0)
+
+
+class TestAffinityPolicies:
+
+    def test_compact_should_fill_a_node_first(self):
+        policy = CompactAffinity(nodes=NODES)
+        assert [policy.cores(i) for i in range(5)] == [[0], [1], [2], [3], [4]]
+        assert policy.cores(8) == [0]
+
+    def test_compact_should_give_neighbouring_cores(self):
+        policy = CompactAffinity(cores_per_worker=2, nodes=NODES)
+        assert [policy.cores(i) for i in range(3)] == [[0, 1], [2, 3], [4, 5]]
+
+    def test_scatter_should_alternate_nodes(self):
+        policy = ScatterAffinity(nodes=NODES)
+        assert [policy.cores(i) for i in range(4)] == [[0], [4], [1], [5]]
+
+    def test_scatter_should_keep_a_worker_cores_on_one_node(self):
+        policy = ScatterAffinity(cores_per_worker=2, nodes=NODES)
+        assert [policy.cores(i) for i in range(4)] == [[0, 1], [4, 5], [2, 3], [6, 7]]
+
+    def test_explicit_should_reuse_core_lists_in_turn(self):
+        policy = ExplicitAffinity(["0-1", [3, 2]])
+        assert [policy.cores(i) for i in range(3)] == [[0, 1], [2, 3], [0, 1]]
+
+    def test_apply_should_pin_the_process(self):
+        cpu = min(os.sched_getaffinity(0))
+        previous = os.sched_getaffinity(0)
+        try:
+            assert ExplicitAffinity([[cpu]]).apply(0) == [cpu]
+            assert os.sched_getaffinity(0) == {cpu}
+        finally:
+            os.sched_setaffinity(0, previous)
+
+    def test_factory(self):
+        assert create_affinity_policy("none") is None
+        assert isinstance(create_affinity_policy("compact"), CompactAffinity)
+        assert isinstance(create_affinity_policy("scatter", cores_per_worker=1), ScatterAffinity)
+        assert isinstance(create_affinity_policy("explicit", worker_cores=["0"]), ExplicitAffinity)
+        with pytest.raises(ValueError):
+            create_affinity_policy("explicit")
+        with pytest.raises(ValueError):
+            create_affinity_policy("compact", cores_per_worker=0)
+        with pytest.raises(ValueError):
+            create_affinity_policy("diagonal")
@@ -0,0 +1,135 @@
+from time import sleep
+
+import pytest
+
+from src.process_manager import AutoscalePolicy
+from src.process_manager import AutoscaleSample
+from src.process_manager import MsgDequeuer
+from src.process_manager import MsgEnqueuer
+from src.process_manager import ProcessManager
+from src.process_manager import WorkerStats
+from src.process_manager.transports import PipeTransport
+from .test_process_manager import CountingMsgConsumer
+from .test_process_manager import CountingMsgProducer
+from .test_process_manager import LongProcessMsgConsumer
+
+
+class SlowMsgProducer(CountingMsgProducer):
+
+    def __init__(self, num_of_msg_to_produce: int, interval_sec: float):
+        super().__init__(num_of_msg_to_produce)
+        self._interval_sec = interval_sec
+
+    def yield_msgs(self):
+        for msg in super().yield_msgs():
+            sleep(self._interval_sec)
+            yield msg
+
+
+def busy_sample(worker_count: int = 2) -> AutoscaleSample:
+    return AutoscaleSample(worker_count, queue_depth=2, producer_blocked_ratio=0.9, utilization=0.95)
+
+
+def idle_sample(worker_count: int = 2) -> AutoscaleSample:
+    return AutoscaleSample(worker_count, queue_depth=0, producer_blocked_ratio=0.0, utilization=0.1)
+
+
+class TestAutoscalePolicy:
+
+    def test_should_reject_inconsistent_bounds(self):
+        with pytest.raises(ValueError):
+            AutoscalePolicy(min_workers=3, max_workers=2)
+        with pytest.raises(ValueError):
+            AutoscalePolicy(min_workers=0, max_workers=2)
+        with pytest.raises(ValueError):
+            AutoscalePolicy(high_utilization=0.3, low_utilization=0.5)
+
+    def test_should_scale_up_after_hysteresis_samples(self):
+        policy = AutoscalePolicy(min_workers=1, max_workers=4, hysteresis=3)
+        assert [policy.decide(busy_sample()) for _ in range(3)] == [0, 0, 1]
+
+    def test_should_scale_down_after_hysteresis_samples(self):
+        policy = AutoscalePolicy(min_workers=1, max_workers=4, hysteresis=2)
+        assert [policy.decide(idle_sample()) for _ in range(2)] == [0, -1]
+
+    def test_should_restart_streak_on_disagreeing_sample(self):
+        policy = AutoscalePolicy(min_workers=1, max_workers=4, hysteresis=2)
+        decisions = [policy.decide(sample) for sample in [busy_sample(), idle_sample(), busy_sample()]]
+        assert decisions == [0, 0, 0]
+
+    def test_should_not_scale_up_busy_workers_without_backlog(self):
+        policy = AutoscalePolicy(hysteresis=1)
+        sample = AutoscaleSample(2, queue_depth=0, producer_blocked_ratio=0.0, utilization=0.95)
+        assert policy.decide(sample) == 0
+
+    def test_should_honour_bounds(self):
+        policy = AutoscalePolicy(min_workers=2, max_workers=3, hysteresis=1)
+        assert policy.decide(busy_sample(worker_count=3)) == 0
+        assert policy.decide(idle_sample(worker_count=2)) == 0
+        assert policy.clamp(1) == 2
+        assert policy.clamp(5) == 3
+
+
+class TestWorkerStats:
+
+    def test_should_accumulate_per_slot(self):
+        proc_mgr = ProcessManager(enqueuer=MsgEnqueuer(), dequeuer=MsgDequeuer())
+        stats = WorkerStats(proc_mgr.context, 2)
+        stats.record(0, 3, 100)
+        stats.record(0, 2, 50)
+        stats.record(1, 1, 10)
+        assert stats.get(0, WorkerStats.PROCESSED) == 5
+        assert stats.get(0, WorkerStats.BUSY_NS) == 150
+        assert stats.total(WorkerStats.PROCESSED) == 6
+        stats.reset(0)
+        assert stats.get(0, WorkerStats.PROCESSED) == 0
+
+
+class PhasedMsgProducer(CountingMsgProducer):
+    """The first slow_count messages come every interval_sec, then all the others at once"""
+
+    def __init__(self, num_of_msg_to_produce: int, slow_count: int, interval_sec: float):
+        super().__init__(num_of_msg_to_produce)
+        self._slow_count = slow_count
+        self._interval_sec = interval_sec
+
+    def yield_msgs(self):
+        for i, msg in enumerate(super().yield_msgs()):
+            if i < self._slow_count:
+                sleep(self._interval_sec)
+            yield msg
+
+
+class TestProcessManagerAutoscale:
+
+    def test_should_reject_per_worker_transport(self):
+        proc_mgr = ProcessManager(enqueuer=MsgEnqueuer(timeout=1), dequeuer=MsgDequeuer(timeout=1),
+                                  transport=PipeTransport(), autoscale=AutoscalePolicy())
+        with pytest.raises(ValueError):
+            proc_mgr.process(CountingMsgProducer(1), CountingMsgConsumer(), 1)
+
+    def test_should_add_workers_under_load(self):
+        policy = AutoscalePolicy(min_workers=1, max_workers=3, interval_sec=0.05, hysteresis=1)
+        proc_mgr = ProcessManager(enqueuer=MsgEnqueuer(timeout=10), dequeuer=MsgDequeuer(timeout=10),
+                                  queue_max_size=1, autoscale=policy)
+        proc_mgr.process(CountingMsgProducer(60), LongProcessMsgConsumer(0.01), 1)
+        assert len(proc_mgr._workers) > 1
+        assert not any(worker.is_alive() for worker in proc_mgr._workers)
+
+    def test_should_retire_idle_workers(self):
+        policy = AutoscalePolicy(min_workers=1, max_workers=3, interval_sec=0.05, hysteresis=1)
+        proc_mgr = ProcessManager(enqueuer=MsgEnqueuer(timeout=10), dequeuer=MsgDequeuer(timeout=10),
+                                  autoscale=policy)
+        proc_mgr.process(SlowMsgProducer(5, 0.1), CountingMsgConsumer(), 3)
+        retired = [slot for slot in range(3) if proc_mgr.worker_stats.get(slot, WorkerStats.RETIRE)]
+        assert retired
+        assert not any(worker.is_alive() for worker in proc_mgr._workers)
+
+    def test_should_keep_counters_of_retired_workers(self):
+        policy = AutoscalePolicy(min_workers=1, max_workers=2, interval_sec=0.05, hysteresis=1)
+        proc_mgr = ProcessManager(enqueuer=MsgEnqueuer(timeout=10), dequeuer=MsgDequeuer(timeout=10),
+                                  queue_max_size=1, autoscale=policy)
+        proc_mgr.process(PhasedMsgProducer(60, 6, 0.1), LongProcessMsgConsumer(0.01), 2)
+        # idle at first, a worker retires, then another one starts in its slot
+        assert len(proc_mgr._workers) > 2
+        assert proc_mgr.worker_stats.total(WorkerStats.PROCESSED) == 60
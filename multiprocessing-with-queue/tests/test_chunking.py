@@ -0,0 +1,38 @@
+import pytest
+
+from src.process_manager import AdaptiveChunking
+
+
+class TestAdaptiveChunking:
+
+    def test_should_shrink_chunks_near_the_end(self):
+        chunking = AdaptiveChunking(max_chunk=1000, guided_factor=2)
+        sizes = [chunking.next_size(remaining, 4, None) for remaining in (800, 400, 40, 7, 1)]
+        assert sizes == [100, 50, 5, 1, 1]
+
+    def test_should_size_chunks_from_service_time(self):
+        chunking = AdaptiveChunking(max_chunk=1000, target_chunk_sec=0.01)
+        # 100 usec per message: 100 messages make 10 ms
+        assert chunking.next_size(None, 4, 100_000) == 100
+        assert chunking.next_size(1_000_000, 4, 100_000) == 100
+        # long tasks: one at a time
+        assert chunking.next_size(1_000_000, 4, 1e9) == 1
+
+    def test_should_stay_within_bounds(self):
+        chunking = AdaptiveChunking(min_chunk=4, max_chunk=64)
+        assert chunking.next_size(1_000_000, 1, 1) == 64
+        assert chunking.next_size(0, 8, None) == 4
+
+    def test_should_start_small_without_msg_count_or_service_time(self):
+        chunking = AdaptiveChunking(min_chunk=2, max_chunk=64)
+        assert chunking.next_size(None, 2, None) == 2
+
+    @pytest.mark.parametrize("kwargs", [
+        {"min_chunk": 0},
+        {"min_chunk": 10, "max_chunk": 5},
+        {"target_chunk_sec": 0},
+        {"guided_factor": 0},
+    ])
+    def test_should_reject_invalid_settings(self, kwargs):
+        with pytest.raises(ValueError):
+            AdaptiveChunking(**kwargs)
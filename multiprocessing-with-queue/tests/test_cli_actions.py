@@ -1,9 +1,17 @@
+import asyncio
+import json
+import logging
+
 import pytest
 
+from src.cli_actions import SimpleAsyncMsgConsumer
+from src.cli_actions import SimpleMsg
 from src.cli_actions import SimpleMsgConsumer
 from src.cli_actions import SimpleMsgProducer
 from src.cli_actions import run_session
 from src.cli_actions import run_single
+from src.cli_actions import run_serializer_benchmark
+from src.cli_actions import run_transport_benchmark
 from src.config import Config
 
 
@@ -17,13 +25,44 @@ class TestSimpleMsgProducer:
             assert msg is not None
         assert msg_count == 3
 
+    def test_should_split_into_consecutive_msg_ids(self):
+        shards = SimpleMsgProducer(10, 0).split(3)
+        assert [[msg.msg_id for msg in shard.yield_msgs()] for shard in shards] == [
+            [0, 1, 2, 3], [4, 5, 6], [7, 8, 9]
+        ]
+
+    def test_should_mark_every_nth_message_urgent(self):
+        shards = SimpleMsgProducer(6, 0, urgent_every=3, bulk_priority=1).split(2)
+        assert [msg.priority for shard in shards for msg in shard.yield_msgs()] == [0, 1, 1, 0, 1, 1]
+
+    def test_should_slow_down_every_nth_message(self):
+        shards = SimpleMsgProducer(5, 0.1, slow_every=2, slow_task_duration_s=3).split(2)
+        assert [msg.duration_s for shard in shards for msg in shard.yield_msgs()] == [3, 0.1, 3, 0.1, 3]
+
+    def test_should_sample_debug_lines(self, caplog):
+        with caplog.at_level(logging.DEBUG, logger="SimpleMsgProducer"):
+            for shard in SimpleMsgProducer(6, 0, log_sample_every=3).split(2):
+                list(shard.yield_msgs())
+        assert [record.getMessage() for record in caplog.records if record.msg.startswith("Creating")] == [
+            "Creating message 2", "Creating message 5"
+        ]
+
 
 class TestSimpleMsgConsumer:
 
     def test_should_count_processed_messages(self):
         obj = SimpleMsgConsumer()
         assert obj.processed_message_count == 0
-        obj.process_msg({"duration_s": 0})
+        obj.process_msg(SimpleMsg(0, 0))
+        assert obj.processed_message_count == 1
+
+
+class TestSimpleAsyncMsgConsumer:
+
+    def test_should_count_processed_messages(self):
+        obj = SimpleAsyncMsgConsumer()
+        assert obj.processed_message_count == 0
+        asyncio.run(obj.process_msg(SimpleMsg(0, 0)))
         assert obj.processed_message_count == 1
 
 
@@ -41,7 +80,8 @@ class TestRuns:
         config.queue_get_timeout_sec = 1
         config.queue_empty_max_attempts = 5
         config.queue_empty_wait_sec = 0
-        run_single(config)
+        latency_histograms = run_single(config)
+        assert latency_histograms["end_to_end"].count == 1
 
     def test_should_run_session(self):
         config = Config()
@@ -60,6 +100,67 @@ class TestRuns:
         consumer_step = 1
         run_session(config, consumer_min, consumer_max, consumer_step)
 
+    def test_should_repeat_runs_and_write_json(self, capsys, tmp_path):
+        config = Config()
+        config.msg_count = 2
+        config.task_duration_sec = 0
+        config.queue_max_size = 1
+        config.consumer_count = 1
+        config.queue_put_timeout_sec = 1
+        config.queue_full_max_attempts = 5
+        config.queue_full_wait_sec = 0
+        config.queue_get_timeout_sec = 1
+        config.queue_empty_max_attempts = 5
+        config.queue_empty_wait_sec = 0
+        config.warmup_runs = 1
+        config.repetitions = 3
+        json_output = tmp_path / "session.json"
+        run_session(config, 1, 2, 1, json_output=str(json_output))
+
+        lines = capsys.readouterr().out.splitlines()
+        assert [line.split(",")[0] for line in lines[1:]] == ["1", "2"]
+        runs = json.loads(json_output.read_text())["runs"]
+        assert [run["config"]["consumer_count"] for run in runs] == [1, 2]
+        assert all(len(run["elapsed"]["samples"]) == 3 for run in runs)
+
+    def test_should_run_session_over_processes_and_threads(self, capsys):
+        config = Config()
+        config.msg_count = 2
+        config.task_duration_sec = 0
+        config.queue_max_size = 1
+        config.consumer_count = 1
+        config.queue_put_timeout_sec = 1
+        config.queue_full_max_attempts = 5
+        config.queue_full_wait_sec = 0
+        config.queue_get_timeout_sec = 1
+        config.queue_empty_max_attempts = 5
+        config.queue_empty_wait_sec = 0
+        run_session(config, 1, 2, 1, range(1, 3))
+        lines = capsys.readouterr().out.splitlines()
+        assert len(lines) == 1 + 2 * 2
+        headers = lines[0].split(",")
+        assert "end_to_end_p999_usec" in headers
+        assert all(line.split(",")[headers.index("service_p50_usec")] for line in lines[1:])
+
+    def test_should_run_session_reusing_workers(self, capsys):
+        config = Config()
+        config.msg_count = 2
+        config.task_duration_sec = 0
+        config.queue_max_size = 1
+        config.consumer_count = 1
+        config.queue_put_timeout_sec = 1
+        config.queue_full_max_attempts = 5
+        config.queue_full_wait_sec = 0
+        config.queue_get_timeout_sec = 1
+        config.queue_empty_max_attempts = 5
+        config.queue_empty_wait_sec = 0
+        config.reuse_workers = True
+        run_session(config, 1, 3, 2)
+        lines = capsys.readouterr().out.splitlines()
+        assert len(lines) == 3
+        assert lines[0].endswith(",warmup_sec")
+        assert ",elapsed,elapsed_median," in lines[0]
+
     def test_should_fail_if_run_session_and_consumer_step_zero(self):
         config = Config()
         config.msg_count = 1
@@ -77,3 +178,57 @@ class TestRuns:
         consumer_step = 0
         with pytest.raises(ValueError):
             run_session(config, consumer_min, consumer_max, consumer_step)
+
+    def test_should_run_transport_benchmark(self, capsys):
+        config = Config()
+        config.msg_count = 2
+        config.task_duration_sec = 0
+        config.queue_max_size = 1
+        config.consumer_count = 1
+        config.queue_put_timeout_sec = 1
+        config.queue_full_max_attempts = 5
+        config.queue_full_wait_sec = 0
+        config.queue_get_timeout_sec = 1
+        config.queue_empty_max_attempts = 5
+        config.queue_empty_wait_sec = 0
+        config.warmup_runs = 1
+        config.repetitions = 2
+        run_transport_benchmark(config, ["queue", "pipe"])
+        lines = capsys.readouterr().out.splitlines()
+        assert len(lines) == 3
+        headers = lines[0].split(",")
+        assert "usec_per_msg" not in headers
+        for line, transport in zip(lines[1:], ["queue", "pipe"]):
+            row = dict(zip(headers, line.split(",")))
+            assert row["queue_backend"] == transport
+            # percentiles over the 2 measured runs, from enqueue to completion of each message
+            assert float(row["end_to_end_p50_usec"]) <= float(row["end_to_end_p999_usec"])
+
+    def test_should_run_single_with_struct_serializer(self):
+        config = Config()
+        config.msg_count = 5
+        config.task_duration_sec = 0
+        config.queue_max_size = 1
+        config.consumer_count = 2
+        config.queue_put_timeout_sec = 1
+        config.queue_full_max_attempts = 5
+        config.queue_full_wait_sec = 0
+        config.queue_get_timeout_sec = 1
+        config.queue_empty_max_attempts = 5
+        config.queue_empty_wait_sec = 0
+        config.payload_size = 10
+        config.serializer = "struct"
+        latency_histograms = run_single(config)
+        assert latency_histograms["end_to_end"].count == 5
+
+    def test_should_run_serializer_benchmark(self, capsys):
+        config = Config()
+        config.msg_count = 10
+        config.task_duration_sec = 0
+        config.batch_size = 4
+        run_serializer_benchmark(config, ["pickle", "struct"])
+        lines = capsys.readouterr().out.splitlines()
+        assert len(lines) == 3
+        assert lines[0].startswith("serializer,")
+        assert lines[1].startswith("pickle,10,4,")
+        assert lines[2].startswith("struct,10,4,")
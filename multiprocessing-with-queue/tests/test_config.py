@@ -52,6 +52,24 @@ class TestConfigBasicFeatures:
             assert eval(f"obj.{key}") == 2
 
 
+class TestConfigOptionalItems:
+
+    def test_optional_item_should_have_default_if_unset(self):
+        obj = Config()
+        for key, value in obj.OPTIONAL_CONFIG_ITEMS.items():
+            assert obj[key] == value
+            assert eval(f"obj.{key}") == value
+
+    def test_optional_item_can_be_overwritten(self):
+        obj = Config()
+        obj.batch_size = 16
+        assert obj.batch_size == 16
+
+    def test_config_file_can_omit_optional_items(self):
+        obj = Config.from_file(fixture_path('config_test.yaml'))
+        assert obj.batch_size == 1
+
+
 class TestConfigLogging:
 
     def test_should_log_values(self):
@@ -73,6 +91,15 @@ class TestConfigFactory:
         for key in obj.CONFIG_ITEMS:
             assert obj[key] == 1
 
+    def test_cli_args_left_unset_should_fall_back_to_defaults(self):
+        mock_args = Config()
+        for key in mock_args.CONFIG_ITEMS:
+            mock_args[key] = 1
+        mock_args.batch_size = None
+
+        obj = Config.from_argparser_args(mock_args)
+        assert obj.batch_size == Config.OPTIONAL_CONFIG_ITEMS["batch_size"]
+
     def test_can_build_config_obj_from_json_str(self):
         json_str = '{ "msg_count": 5 }'
         obj = Config.from_json(json_str)
@@ -111,7 +138,7 @@ class TestConfigCSV:
     def test_header_count(self):
         config = Config()
         headers = config.csv_headers()
-        assert len(headers.split(",")) == 12
+        assert len(headers.split(",")) == 12 + len(Config.OPTIONAL_CONFIG_ITEMS)
 
     def test_row_field_count(self):
         config = Config()
@@ -127,4 +154,10 @@ class TestConfigCSV:
         config.queue_empty_wait_sec = 0
 
         row_string = config.csv_row(elapsed_sec=1.0)
-        assert len(row_string.split(",")) == 12
+        assert len(row_string.split(",")) == 12 + len(Config.OPTIONAL_CONFIG_ITEMS)
+
+    def test_row_should_start_with_run_id(self):
+        config = Config()
+        for item in Config.CONFIG_ITEMS:
+            config[item] = 0
+        assert config.csv_row(elapsed_sec=1.0, run_id=7).split(",")[0] == "7"
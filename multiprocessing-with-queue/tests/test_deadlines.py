@@ -0,0 +1,142 @@
+import asyncio
+import signal
+from time import perf_counter_ns, sleep
+
+import pytest
+
+from src.process_manager import AsyncMsgConsumer
+from src.process_manager import DeadlinePolicy
+from src.process_manager import MsgConsumer
+from src.process_manager import MsgDequeuer
+from src.process_manager import MsgEnqueuer
+from src.process_manager import MsgProducer
+from src.process_manager import MsgTimeout
+from src.process_manager import ProcessManager
+from src.process_manager import SupervisePolicy
+from src.process_manager import WorkerStats
+from src.process_manager.deadlines import install_alarm, interrupt_after
+
+
+class TestDeadlinePolicy:
+
+    def test_should_expire_msgs_after_expire_sec(self):
+        policy = DeadlinePolicy(expire_sec=0.5)
+        assert not policy.expired({}, 0, 400_000_000)
+        assert policy.expired({}, 0, 600_000_000)
+
+    def test_msg_expiry_should_override_default(self):
+        policy = DeadlinePolicy(expire_sec=0.5)
+        assert policy.expired({"deadline_sec": 0.1}, 0, 200_000_000)
+        assert not DeadlinePolicy().expired({}, 0, 10**12)
+
+    def test_should_kill_after_timeout_and_grace(self):
+        assert DeadlinePolicy(timeout_sec=1, kill_grace_sec=0.5).kill_after_ns == 1_500_000_000
+        assert DeadlinePolicy().kill_after_ns is None
+
+    @pytest.mark.parametrize("kwargs", [{"expire_sec": 0}, {"timeout_sec": -1}, {"kill_grace_sec": -1}])
+    def test_should_reject_invalid_arguments(self, kwargs):
+        with pytest.raises(ValueError):
+            DeadlinePolicy(**kwargs)
+
+    def test_should_interrupt_long_calls(self):
+        previous = signal.getsignal(signal.SIGALRM)
+        install_alarm()
+        try:
+            t_start = perf_counter_ns()
+            with pytest.raises(MsgTimeout):
+                with interrupt_after(0.05):
+                    sleep(5)
+            assert perf_counter_ns() - t_start < 1_000_000_000
+            with interrupt_after(0.05):
+                pass
+            # cancelled: nothing fires later
+            sleep(0.1)
+        finally:
+            signal.signal(signal.SIGALRM, previous)
+
+
+class DeadlineMsgProducer(MsgProducer):
+    """Messages whose msg_id is in expiring carry an expiry already over"""
+
+    def __init__(self, msg_count: int, expiring: set = frozenset()):
+        self._msg_count = msg_count
+        self._expiring = expiring
+
+    def yield_msgs(self):
+        for i in range(self._msg_count):
+            msg = {"msg_id": i}
+            if i in self._expiring:
+                msg["deadline_sec"] = 1e-9
+            yield msg
+
+
+class StallingMsgConsumer(MsgConsumer):
+    """Stalls for 30 sec on the stalling messages, deaf to SIGALRM if uninterruptible, like native code"""
+
+    def __init__(self, stalling_ids: set, uninterruptible: bool = False):
+        self._stalling_ids = stalling_ids
+        self._uninterruptible = uninterruptible
+
+    def process_msg(self, msg):
+        if msg["msg_id"] in self._stalling_ids:
+            if self._uninterruptible:
+                signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGALRM})
+            sleep(30)
+        return msg["msg_id"]
+
+
+class StallingAsyncMsgConsumer(AsyncMsgConsumer):
+
+    def __init__(self, stalling_ids: set):
+        self._stalling_ids = stalling_ids
+
+    async def process_msg(self, msg):
+        if msg["msg_id"] in self._stalling_ids:
+            await asyncio.sleep(30)
+        return msg["msg_id"]
+
+
+def deadline_proc_mgr(deadlines: DeadlinePolicy, **kwargs) -> ProcessManager:
+    return ProcessManager(MsgEnqueuer(timeout=5), MsgDequeuer(timeout=5), queue_max_size=4, batch_size=3,
+                          deadlines=deadlines, **kwargs)
+
+
+class TestProcessManagerDeadlines:
+
+    def test_should_skip_expired_msgs(self):
+        proc_mgr = deadline_proc_mgr(DeadlinePolicy())
+        proc_mgr.process(DeadlineMsgProducer(10, {2, 3, 7}), StallingMsgConsumer(set()), consumer_count=2)
+        stats = proc_mgr.deadline_stats
+        assert (stats.expired, stats.timed_out) == (3, 0)
+        assert proc_mgr.worker_stats.total(WorkerStats.PROCESSED) == 7
+
+    def test_should_interrupt_msgs_past_timeout(self):
+        proc_mgr = deadline_proc_mgr(DeadlinePolicy(timeout_sec=0.2))
+        results = list(proc_mgr.process_iter(DeadlineMsgProducer(9), StallingMsgConsumer({4}), consumer_count=2,
+                                             ordered=True))
+        assert results == [0, 1, 2, 3, 5, 6, 7, 8]
+        stats = proc_mgr.deadline_stats
+        assert (stats.expired, stats.timed_out, stats.killed) == (0, 1, 0)
+        assert stats.wasted_ns >= 200_000_000
+
+    def test_should_cancel_async_msgs_past_timeout(self):
+        proc_mgr = deadline_proc_mgr(DeadlinePolicy(timeout_sec=0.2))
+        results = proc_mgr.process_iter(DeadlineMsgProducer(6, {0}), StallingAsyncMsgConsumer({3}), consumer_count=1)
+        assert sorted(results) == [1, 2, 4, 5]
+        stats = proc_mgr.deadline_stats
+        assert (stats.expired, stats.timed_out) == (1, 1)
+
+    def test_should_kill_workers_which_do_not_yield(self):
+        proc_mgr = deadline_proc_mgr(DeadlinePolicy(timeout_sec=0.1, kill_grace_sec=0.1),
+                                     supervise=SupervisePolicy(interval_sec=0.01))
+        proc_mgr.process(DeadlineMsgProducer(12), StallingMsgConsumer({5}, uninterruptible=True), consumer_count=2)
+        stats = proc_mgr.deadline_stats
+        assert (stats.timed_out, stats.killed) == (1, 1)
+        assert stats.wasted_ns >= 200_000_000
+        assert proc_mgr.supervisor_stats.crashes == 0
+        # the rest of the killed worker's batch is redelivered
+        assert proc_mgr.worker_stats.total(WorkerStats.PROCESSED) == 11
+
+    def test_should_reject_timeouts_with_consumer_threads(self):
+        with pytest.raises(ValueError):
+            deadline_proc_mgr(DeadlinePolicy(timeout_sec=1), consumer_threads=2)
@@ -0,0 +1,73 @@
+import pytest
+
+from src.cli_actions import SimpleMsg
+from src.process_manager import DISPATCH_POLICIES
+from src.process_manager import create_dispatch_policy
+from src.process_manager.dispatch import KeyHashDispatch
+from src.process_manager.dispatch import LeastLoadedDispatch
+from src.process_manager.dispatch import RoundRobinDispatch
+
+
+class TestDispatchFactory:
+
+    @pytest.mark.parametrize("name", DISPATCH_POLICIES)
+    def test_should_create_each_policy(self, name):
+        assert create_dispatch_policy(name) is not None
+
+    def test_should_reject_unknown_policy(self):
+        with pytest.raises(ValueError):
+            create_dispatch_policy("foo")
+
+
+class TestRoundRobinDispatch:
+
+    def test_should_route_to_each_channel_in_turn(self):
+        obj = RoundRobinDispatch()
+        obj.open(3, [0, 0, 0])
+        assert [obj.route({}) for _ in range(5)] == [0, 1, 2, 0, 1]
+
+
+class TestLeastLoadedDispatch:
+
+    def test_should_track_outstanding_work(self):
+        completed = [0, 0]
+        obj = LeastLoadedDispatch()
+        obj.open(2, completed)
+        obj.route({})
+        obj.route({})
+        assert obj.outstanding(0) + obj.outstanding(1) == 2
+
+    def test_should_route_to_worker_with_least_outstanding_work(self):
+        completed = [0, 0, 0]
+        obj = LeastLoadedDispatch()
+        obj.open(3, completed)
+        assert [obj.route({}) for _ in range(3)] == [0, 1, 2]
+        # worker 1 sends back its credit: it is now the least loaded
+        completed[1] = 1
+        assert obj.route({}) == 1
+        assert obj.route({}) in (0, 2)
+
+
+class TestKeyHashDispatch:
+
+    def test_same_key_should_go_to_same_channel(self):
+        obj = KeyHashDispatch("user")
+        obj.open(4, [0, 0, 0, 0])
+        first = obj.route({"user": "alice"})
+        for _ in range(10):
+            assert obj.route({"user": "alice"}) == first
+
+    def test_integer_keys_should_spread_evenly(self):
+        obj = KeyHashDispatch("msg_id")
+        obj.open(3, [0, 0, 0])
+        assert [obj.route({"msg_id": i}) for i in range(6)] == [0, 1, 2, 0, 1, 2]
+
+    def test_non_dict_message_is_its_own_key(self):
+        obj = KeyHashDispatch()
+        obj.open(2, [0, 0])
+        assert obj.route(3) == 1
+
+    def test_should_read_key_attribute_of_messages(self):
+        obj = KeyHashDispatch("msg_id")
+        obj.open(3, [0, 0, 0])
+        assert [obj.route(SimpleMsg(i, 0)) for i in range(4)] == [0, 1, 2, 0]
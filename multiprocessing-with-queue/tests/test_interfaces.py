@@ -1,6 +1,8 @@
+import asyncio
+
 import pytest
 
-from src.process_manager import MsgConsumer, MsgProducer
+from src.process_manager import AsyncMsgConsumer, MsgConsumer, MsgProducer
 
 
 class TestBaseClasses:
@@ -15,3 +17,8 @@ class TestBaseClasses:
         with pytest.raises(NotImplementedError):
             obj = MsgConsumer()
             obj.process_msg({})
+
+    def test_async_msg_consumer_is_abstract(self):
+        with pytest.raises(NotImplementedError):
+            obj = AsyncMsgConsumer()
+            asyncio.run(obj.process_msg({}))
@@ -0,0 +1,54 @@
+import pytest
+
+from src.process_manager import LanePolicy
+
+
+class TestLanePolicy:
+
+    @pytest.mark.parametrize("kwargs", [
+        {"priority_count": 0},
+        {"mode": "fifo"},
+        {"priority_count": 2, "weights": [1]},
+        {"priority_count": 2, "weights": [1, 0]},
+    ])
+    def test_should_reject_invalid_arguments(self, kwargs):
+        with pytest.raises(ValueError):
+            LanePolicy(**kwargs)
+
+    def test_weights_should_halve_by_default(self):
+        assert LanePolicy(3, "weighted").weights == [4, 2, 1]
+
+
+class TestLaneScheduler:
+
+    def test_strict_should_try_most_urgent_lane_first(self):
+        scheduler = LanePolicy(3, aging_sec=0).scheduler()
+        for now in range(5):
+            assert scheduler.order(now) == [0, 1, 2]
+            scheduler.served(0, now)
+
+    def test_weighted_should_serve_lanes_in_proportion(self):
+        scheduler = LanePolicy(2, "weighted", weights=[3, 1], aging_sec=0).scheduler()
+        served = []
+        for now in range(8):
+            lane = scheduler.order(now)[0]
+            scheduler.served(lane, now)
+            served.append(lane)
+        assert served.count(0) == 6
+        assert served.count(1) == 2
+
+    def test_should_serve_waiting_lane_first_once_aged(self):
+        scheduler = LanePolicy(2, aging_sec=1.0).scheduler()
+        assert scheduler.order(0.0) == [0, 1]
+        scheduler.served(0, 0.0)
+        scheduler.served(0, 0.5)
+        assert scheduler.order(1.0) == [1, 0]
+        scheduler.served(1, 1.0)
+        assert scheduler.order(1.1) == [0, 1]
+
+    def test_empty_lane_should_not_age(self):
+        scheduler = LanePolicy(2, aging_sec=1.0).scheduler()
+        scheduler.order(0.0)
+        scheduler.served(0, 0.0)
+        scheduler.empty(1, 0.9)
+        assert scheduler.order(1.5) == [0, 1]
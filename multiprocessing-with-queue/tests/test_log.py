@@ -1,8 +1,11 @@
 # pylint: disable=missing-module-docstring,missing-class-docstring,missing-function-docstring
 import logging
+import multiprocessing
 
 import pytest
 
+from src.log import LogQueue
+from src.log import LogSampler
 from src.log import log_setup
 
 
@@ -29,3 +32,66 @@ class TestLog:
 
     def test_log_setup_should_accept_uppercase_log_devel(self):
         log_setup("DEBUG")
+
+
+class ListHandler(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def log_from_child(log_queue: LogQueue):
+    log_queue.worker_setup(logging.INFO)
+    logging.getLogger("Child").info("hello from %s", "child")
+
+
+class TestLogQueue:
+
+    def test_child_records_should_reach_parent_handlers(self):
+        handler = ListHandler()
+        root_logger = logging.getLogger()
+        root_logger.addHandler(handler)
+        ctx = multiprocessing.get_context("spawn")
+        log_queue = LogQueue(ctx)
+        log_queue.start()
+        try:
+            child = ctx.Process(target=log_from_child, args=(log_queue,))
+            child.start()
+            child.join()
+        finally:
+            log_queue.stop()
+            root_logger.removeHandler(handler)
+        messages = [record.getMessage() for record in handler.records if record.name == "Child"]
+        assert messages == ["hello from child"]
+        assert handler.records[-1].process == child.pid
+
+
+class TestLogSampler:
+
+    def test_should_let_one_in_every_through(self):
+        logger = logging.getLogger("TestLogSampler")
+        logger.setLevel(logging.DEBUG)
+        sampler = LogSampler(logger, every=3)
+        assert [sampler() for _ in range(6)] == [False, False, True, False, False, True]
+
+    def test_should_skip_everything_above_debug(self):
+        logger = logging.getLogger("TestLogSamplerInfo")
+        logger.setLevel(logging.INFO)
+        sampler = LogSampler(logger)
+        assert not any(sampler() for _ in range(3))
+
+    def test_should_follow_level_changes(self):
+        logger = logging.getLogger("TestLogSamplerLevel")
+        logger.setLevel(logging.INFO)
+        sampler = LogSampler(logger, every=2)
+        assert not any(sampler() for _ in range(2))
+        logger.setLevel(logging.DEBUG)
+        assert [sampler() for _ in range(4)] == [False, True, False, True]
+
+    def test_should_reject_zero(self):
+        with pytest.raises(ValueError):
+            LogSampler(logging.getLogger(), every=0)
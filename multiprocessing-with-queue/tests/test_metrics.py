@@ -0,0 +1,100 @@
+import multiprocessing
+import queue
+import re
+import urllib.request
+
+import pytest
+
+from src.cli_actions import SimpleMsgProducer
+from src.process_manager import MetricsExporter
+from src.process_manager import MsgDequeuer
+from src.process_manager import MsgEnqueuer
+from src.process_manager import ProcessManager
+from src.process_manager import ProducerStats
+from src.process_manager import RetryPolicy
+from .test_process_manager import CountingMsgConsumer
+from .test_process_manager import CountingMsgProducer
+from .test_process_manager import SquaringMsgConsumer
+
+
+def metric_value(text: str, name: str, labels: str = "") -> float:
+    match = re.search(rf"^process_manager_{name}{re.escape(labels)} (\S+)$", text, re.MULTILINE)
+    assert match is not None, f"{name}{labels} not found in:\n{text}"
+    return float(match.group(1))
+
+
+def scrape(exporter: MetricsExporter) -> str:
+    host, port = exporter.address
+    with urllib.request.urlopen(f"http://{host}:{port}/metrics", timeout=5) as response:
+        assert response.headers["Content-Type"].startswith("text/plain")
+        return response.read().decode("utf-8")
+
+
+class TestMsgProcessorPublishing:
+
+    def test_should_publish_wait_time_and_retries(self):
+        stats = ProducerStats(multiprocessing.get_context(), 2)
+        enqueuer = MsgEnqueuer(timeout=0.01, retry_policy=RetryPolicy(max_attempts=3, wait_sec=0.01))
+        enqueuer.publish_to(stats, 1)
+        full = queue.Queue(maxsize=1)
+        enqueuer.put_many(full, [("USER", 0)])
+        with pytest.raises(queue.Full):
+            enqueuer.put_many(full, [("USER", 1)])
+        assert stats.get(1, ProducerStats.RETRIES) == 3
+        assert stats.get(1, ProducerStats.WAIT_NS) >= 30_000_000
+        assert stats.get(0, ProducerStats.WAIT_NS) == 0
+
+
+class TestMetricsExporter:
+
+    def test_should_need_an_output(self):
+        with pytest.raises(ValueError):
+            MetricsExporter()
+
+    def test_should_serve_metrics_over_http(self):
+        exporter = MetricsExporter(port=0)
+        proc_mgr = ProcessManager(MsgEnqueuer(timeout=1), MsgDequeuer(timeout=1), batch_size=2, metrics=exporter)
+        try:
+            # before the first run: the transport only
+            assert "process_manager_queue_depth" in scrape(exporter)
+            results = proc_mgr.process_iter(CountingMsgProducer(20), SquaringMsgConsumer(), consumer_count=2)
+            next(results)
+            # during the run
+            assert "process_manager_msgs_processed_total" in scrape(exporter)
+            list(results)
+            text = scrape(exporter)
+        finally:
+            proc_mgr.close()
+        assert metric_value(text, "msgs_enqueued_total", '{producer="0"}') == 20
+        processed = [metric_value(text, "msgs_processed_total", f'{{worker="{slot}"}}') for slot in range(2)]
+        assert sum(processed) == 20
+        assert 0 <= metric_value(text, "worker_busy_ratio", '{worker="0"}') <= 1
+        assert metric_value(text, "get_retries_total", '{worker="0"}') == 0
+        assert "# TYPE process_manager_producer_blocked_seconds_total counter" in text
+        assert exporter.address is None
+
+    def test_should_rewrite_stats_file(self, tmp_path):
+        stats_file = tmp_path / "metrics.prom"
+        exporter = MetricsExporter(stats_file=str(stats_file), interval_sec=0.01)
+        proc_mgr = ProcessManager(MsgEnqueuer(timeout=1), MsgDequeuer(timeout=1), metrics=exporter)
+        try:
+            proc_mgr.process(CountingMsgProducer(10), CountingMsgConsumer(), consumer_count=2)
+        finally:
+            proc_mgr.close()
+        # rewritten a last time when closing
+        text = stats_file.read_text(encoding="utf-8")
+        assert metric_value(text, "msgs_enqueued_total", '{producer="0"}') == 10
+        assert metric_value(text, "workers") == 0
+
+    def test_should_count_each_producer_process(self):
+        exporter = MetricsExporter(port=0)
+        proc_mgr = ProcessManager(MsgEnqueuer(timeout=5), MsgDequeuer(timeout=5), start_method="spawn",
+                                  metrics=exporter)
+        try:
+            proc_mgr.process(SimpleMsgProducer(10, 0), CountingMsgConsumer(), consumer_count=1, producer_count=2)
+            text = scrape(exporter)
+        finally:
+            proc_mgr.close()
+        assert [metric_value(text, "msgs_enqueued_total", f'{{producer="{slot}"}}') for slot in range(2)] == [5, 5]
+        assert metric_value(text, "msgs_processed_total", '{worker="0"}') == 10
+        assert metric_value(text, "worker_idle_seconds_total", '{worker="0"}') > 0
@@ -144,3 +144,25 @@ class TestMsgProcessorRetryLogic:
             obj._run_with_retry(self.raise_queue_empty_once, ctx)
             assert ctx.call_count == 2
             assert mock_sleep.call_count == 1
+
+    # counters
+
+    def test_should_count_timeouts(self):
+        obj = MsgProcessor(
+            timeout=0,
+            max_attempts=2,
+            wait_between_attempts=0,
+        )
+        ctx = Box()
+        ctx.call_count = 0
+        obj._run_with_retry(self.raise_queue_full_once, ctx)
+        assert obj.timeout_count == 1
+
+    def test_should_accumulate_wait_time(self):
+        obj = MsgProcessor(
+            timeout=0,
+            max_attempts=1,
+            wait_between_attempts=0,
+        )
+        obj._run_with_retry(sleep, 0.01)
+        assert obj.wait_ns >= 10_000_000
@@ -0,0 +1,56 @@
+import pytest
+
+from src.perf import BenchmarkStats
+from src.perf import benchmark
+from src.perf import reject_outliers
+
+
+class TestRejectOutliers:
+
+    def test_should_keep_everything_below_four_samples(self):
+        assert reject_outliers([1, 2, 100]) == ([1, 2, 100], [])
+
+    def test_should_reject_far_samples(self):
+        kept, rejected = reject_outliers([1.0, 1.1, 0.9, 1.05, 0.95, 10.0])
+        assert rejected == [10.0]
+        assert len(kept) == 5
+
+
+class TestBenchmarkStats:
+
+    def test_should_require_samples(self):
+        with pytest.raises(ValueError):
+            BenchmarkStats([])
+
+    def test_single_sample_should_have_no_confidence_interval(self):
+        stats = BenchmarkStats([2.0])
+        assert stats.mean == stats.median == 2.0
+        assert stats.stddev == 0
+        assert stats.ci95_low is None and stats.ci95_high is None
+
+    def test_should_summarize_kept_samples(self):
+        stats = BenchmarkStats([1.0, 2.0, 3.0, 100.0, 2.0, 2.0])
+        assert stats.rejected == [100.0]
+        assert stats.mean == pytest.approx(2.0)
+        assert stats.median == 2.0
+        assert stats.ci95_low < stats.mean < stats.ci95_high
+        assert stats.to_dict()["samples"] == [1.0, 2.0, 3.0, 100.0, 2.0, 2.0]
+
+    def test_should_keep_outliers_if_asked(self):
+        stats = BenchmarkStats([1.0, 2.0, 3.0, 100.0, 2.0, 2.0], outlier_k=None)
+        assert stats.rejected == []
+        assert stats.max == 100.0
+
+
+class TestBenchmark:
+
+    def test_should_warm_up_then_measure(self):
+        calls = []
+        result = benchmark(lambda: calls.append(1) or len(calls), warmup=2, repeat=3)
+        assert len(calls) == 5
+        assert result.results == [3, 4, 5]
+        assert len(result.stats.samples) == 3
+
+    def test_should_reject_zero_repetitions(self):
+        with pytest.raises(ValueError):
+            benchmark(lambda: None, repeat=0)
@@ -0,0 +1,46 @@
+import pytest
+
+from src.perf import LatencyHistogram
+
+
+class TestLatencyHistogram:
+
+    def test_should_count_small_values_exactly(self):
+        for value in [0, 1, 100, 127]:
+            assert LatencyHistogram.bucket_value(LatencyHistogram.bucket_index(value)) == value
+
+    def test_should_bound_relative_error(self):
+        for value in [128, 1000, 123_456, 10_000_000, 987_654_321]:
+            approx = LatencyHistogram.bucket_value(LatencyHistogram.bucket_index(value))
+            assert approx == pytest.approx(value, rel=1 / 64)
+
+    def test_should_clamp_huge_values(self):
+        assert LatencyHistogram.bucket_index(2 ** 60) == LatencyHistogram.BUCKET_COUNT - 1
+
+    def test_should_report_none_if_empty(self):
+        assert LatencyHistogram().percentile(50) is None
+
+    def test_should_report_percentiles(self):
+        histogram = LatencyHistogram()
+        for value in range(1, 1001):
+            histogram.record(value * 1000)
+        percentiles = histogram.percentiles()
+        assert histogram.count == 1000
+        assert percentiles[50] == pytest.approx(500_000, rel=0.02)
+        assert percentiles[99] == pytest.approx(990_000, rel=0.02)
+        assert percentiles[99.9] == pytest.approx(999_000, rel=0.02)
+
+    def test_should_merge(self):
+        low, high = LatencyHistogram(), LatencyHistogram()
+        for _ in range(10):
+            low.record(10)
+            high.record(1000)
+        low.merge(high)
+        assert low.count == 20
+        assert low.percentile(50) == 10
+        assert low.percentile(100) == pytest.approx(1000, rel=1 / 64)
+
+    def test_should_rebuild_from_counts(self):
+        histogram = LatencyHistogram()
+        histogram.record(42)
+        assert LatencyHistogram(histogram.counts).percentile(50) == 42
@@ -1,14 +1,21 @@
+import asyncio
+import os
 import queue
+import threading
 from multiprocessing import Queue
-from time import sleep
+from time import perf_counter, sleep
 
 import pytest
 
+from src.process_manager import AdaptiveChunking
+from src.process_manager import AsyncMsgConsumer
 from src.process_manager import MsgConsumer
 from src.process_manager import MsgDequeuer
 from src.process_manager import MsgEnqueuer
 from src.process_manager import MsgProducer
 from src.process_manager import ProcessManager
+from src.process_manager import WorkerStats
+from src.process_manager.affinity import ExplicitAffinity
 
 
 class CountingMsgProducer(MsgProducer):
@@ -43,6 +50,27 @@ class CountingMsgConsumer(MsgConsumer):
         return self._processed_msg_count
 
 
+class StallingMsgProducer(MsgProducer):
+    """Yields msg_count messages, then stalls until the workers processed them or timeout_sec, then yields one more"""
+
+    def __init__(self, proc_mgr: ProcessManager, msg_count: int, timeout_sec: float):
+        self._proc_mgr = proc_mgr
+        self._msg_count = msg_count
+        self._timeout_sec = timeout_sec
+        self.stall_sec = None
+
+    def yield_msgs(self):
+        for i in range(self._msg_count):
+            yield {"msg_id": i}
+        t_start = perf_counter()
+        while perf_counter() - t_start < self._timeout_sec:
+            if self._proc_mgr.worker_stats.total(WorkerStats.PROCESSED) >= self._msg_count:
+                break
+            sleep(0.01)
+        self.stall_sec = perf_counter() - t_start
+        yield {"msg_id": self._msg_count}
+
+
 class LongProcessMsgConsumer(MsgConsumer):
 
     def __init__(self, process_msg_duration_s: float):
@@ -120,6 +148,13 @@ class TestMsgDequeuer:
             _ = obj.get(q)
 
 
+    def test_get_many_should_return_whole_batch(self):
+        q = Queue()
+        MsgEnqueuer().put_many(q, [("foo", 1), ("bar", 2)])
+        obj = MsgDequeuer(timeout=1)
+        assert obj.get_many(q) == [("foo", 1), ("bar", 2)]
+
+
 class TestMsgEnqueuer:
 
     def test_with_defaults_should_raise_queue_full_if_no_consumers(self):
@@ -136,6 +171,13 @@ class TestMsgEnqueuer:
         with pytest.raises(queue.Full):
             obj.put(q, "bar", "second messagse")
 
+    def test_put_many_should_use_a_single_queue_slot(self):
+        q = Queue(maxsize=1)
+        obj = MsgEnqueuer()
+        obj.put_many(q, [("foo", "first message"), ("foo", "second message")])
+        with pytest.raises(queue.Full):
+            obj.put_many(q, [("bar", "third message")])
+
 
 class TestProcessManager:
 
@@ -155,3 +197,310 @@ class TestProcessManager:
         proc_mgr = ProcessManager(enqueuer=enqueuer, dequeuer=dequeuer, queue_max_size=1)
         with pytest.raises(queue.Full):
             proc_mgr.process(src, dest, consumer_count=1)
+
+    def test_should_process_batches(self):
+        src = CountingMsgProducer(10)
+        dest = CountingMsgConsumer()
+        enqueuer = BatchRecordingMsgEnqueuer()
+        dequeuer = MsgDequeuer(timeout=1)
+        proc_mgr = ProcessManager(enqueuer=enqueuer, dequeuer=dequeuer, queue_max_size=2, batch_size=4)
+        proc_mgr.process(src, dest, consumer_count=2)
+        assert len(src.produced_msgs) == 10
+        assert enqueuer.batch_sizes == [4, 4, 2]
+        assert proc_mgr.worker_stats.total(WorkerStats.PROCESSED) == 10
+
+    def test_should_flush_partial_batch_after_linger(self):
+        enqueuer = BatchRecordingMsgEnqueuer()
+        dequeuer = MsgDequeuer(timeout=1)
+        proc_mgr = ProcessManager(enqueuer=enqueuer, dequeuer=dequeuer, batch_size=100, batch_linger_sec=0.05)
+        src = StallingMsgProducer(proc_mgr, 3, timeout_sec=5)
+        proc_mgr.process(src, CountingMsgConsumer(), consumer_count=1)
+        # the first 3 messages were processed while the producer stalled, without waiting for the 4th one
+        assert src.stall_sec < 5
+        assert enqueuer.batch_sizes == [3, 1]
+        assert proc_mgr.worker_stats.total(WorkerStats.PROCESSED) == 4
+
+    def test_should_reject_batch_size_zero(self):
+        with pytest.raises(ValueError):
+            ProcessManager(enqueuer=MsgEnqueuer(), dequeuer=MsgDequeuer(), batch_size=0)
+
+
+class SquaringMsgConsumer(MsgConsumer):
+
+    def process_msg(self, msg):
+        # later messages finish first, so completion order differs from submission order
+        sleep(0.001 * (10 - msg["msg_id"] % 10))
+        return msg["msg_id"] ** 2
+
+
+class TestProcessManagerResults:
+
+    def test_process_iter_should_yield_one_result_per_msg(self):
+        proc_mgr = ProcessManager(enqueuer=MsgEnqueuer(timeout=1), dequeuer=MsgDequeuer(timeout=1))
+        results = list(proc_mgr.process_iter(CountingMsgProducer(20), SquaringMsgConsumer(), consumer_count=3))
+        assert sorted(results) == [i ** 2 for i in range(20)]
+
+    def test_process_iter_ordered_should_yield_in_submission_order(self):
+        proc_mgr = ProcessManager(enqueuer=MsgEnqueuer(timeout=1), dequeuer=MsgDequeuer(timeout=1), batch_size=3)
+        results = list(proc_mgr.process_iter(CountingMsgProducer(30), SquaringMsgConsumer(), consumer_count=3,
+                                             ordered=True, reorder_buffer_size=4))
+        assert results == [i ** 2 for i in range(30)]
+
+    def test_process_iter_should_batch_results(self):
+        proc_mgr = ProcessManager(enqueuer=MsgEnqueuer(timeout=1), dequeuer=MsgDequeuer(timeout=1),
+                                  result_batch_size=5, result_linger_sec=10)
+        results = list(proc_mgr.process_iter(CountingMsgProducer(12), SquaringMsgConsumer(), consumer_count=2))
+        assert len(results) == 12
+
+    def test_process_iter_should_yield_none_for_consumers_without_results(self):
+        proc_mgr = ProcessManager(enqueuer=MsgEnqueuer(timeout=1), dequeuer=MsgDequeuer(timeout=1))
+        results = list(proc_mgr.process_iter(CountingMsgProducer(3), CountingMsgConsumer(), consumer_count=1))
+        assert results == [None, None, None]
+
+    def test_process_iter_can_stop_early(self):
+        proc_mgr = ProcessManager(enqueuer=MsgEnqueuer(timeout=1), dequeuer=MsgDequeuer(timeout=1))
+        results = proc_mgr.process_iter(CountingMsgProducer(20), SquaringMsgConsumer(), consumer_count=2,
+                                        ordered=True, reorder_buffer_size=2)
+        assert next(results) == 0
+        results.close()
+
+    def test_process_iter_should_raise_producer_errors(self):
+        proc_mgr = ProcessManager(enqueuer=MsgEnqueuer(), dequeuer=MsgDequeuer(timeout=1), queue_max_size=1)
+        with pytest.raises(queue.Full):
+            list(proc_mgr.process_iter(CountingMsgProducer(3), SquaringMsgConsumer(), consumer_count=1))
+
+
+class TestProcessManagerStartMethod:
+
+    @pytest.mark.parametrize("start_method", ["fork", "spawn", "forkserver"])
+    def test_should_produce_consume_with_each_start_method(self, start_method):
+        proc_mgr = ProcessManager(enqueuer=MsgEnqueuer(timeout=5), dequeuer=MsgDequeuer(timeout=5),
+                                  start_method=start_method, forkserver_preload=["src.process_manager"])
+        assert proc_mgr.context.get_start_method() == start_method
+        proc_mgr.process(CountingMsgProducer(3), CountingMsgConsumer(), consumer_count=2)
+
+    def test_should_reject_unknown_start_method(self):
+        with pytest.raises(ValueError):
+            ProcessManager(enqueuer=MsgEnqueuer(), dequeuer=MsgDequeuer(), start_method="foo")
+
+    def test_should_record_startup_latency_per_worker(self):
+        proc_mgr = ProcessManager(enqueuer=MsgEnqueuer(timeout=1), dequeuer=MsgDequeuer(timeout=1))
+        assert proc_mgr.startup_latencies_ns == []
+        proc_mgr.process(CountingMsgProducer(3), CountingMsgConsumer(), consumer_count=3)
+        latencies = proc_mgr.startup_latencies_ns
+        assert len(latencies) == 3
+        assert all(latency > 0 for latency in latencies)
+
+
+class SleepingAsyncMsgConsumer(AsyncMsgConsumer):
+
+    def __init__(self, process_msg_duration_s: float):
+        self._process_msg_duration_s = process_msg_duration_s
+
+    async def process_msg(self, msg):
+        await asyncio.sleep(self._process_msg_duration_s)
+        return msg["msg_id"]
+
+
+class TestProcessManagerAsyncConsumer:
+
+    def test_should_yield_results_of_async_consumer(self):
+        proc_mgr = ProcessManager(enqueuer=MsgEnqueuer(timeout=1), dequeuer=MsgDequeuer(timeout=1),
+                                  queue_max_size=4, batch_size=5)
+        results = proc_mgr.process_iter(CountingMsgProducer(20), SleepingAsyncMsgConsumer(0.01), consumer_count=2,
+                                        ordered=True)
+        assert list(results) == list(range(20))
+
+    def test_should_keep_several_msgs_in_flight_per_process(self):
+        proc_mgr = ProcessManager(enqueuer=MsgEnqueuer(timeout=1), dequeuer=MsgDequeuer(timeout=1),
+                                  queue_max_size=4, batch_size=10, async_max_in_flight=20)
+        t_start = perf_counter()
+        proc_mgr.process(CountingMsgProducer(20), SleepingAsyncMsgConsumer(0.5), consumer_count=1)
+        # one at a time, this would take 10 seconds
+        assert perf_counter() - t_start < 5
+
+
+class TestProcessManagerConsumerThreads:
+
+    def test_should_reject_zero_threads(self):
+        with pytest.raises(ValueError):
+            ProcessManager(enqueuer=MsgEnqueuer(), dequeuer=MsgDequeuer(), consumer_threads=0)
+
+    def test_should_yield_results_of_each_thread(self):
+        proc_mgr = ProcessManager(enqueuer=MsgEnqueuer(timeout=1), dequeuer=MsgDequeuer(timeout=1),
+                                  queue_max_size=4, batch_size=3, consumer_threads=3)
+        results = proc_mgr.process_iter(CountingMsgProducer(30), SquaringMsgConsumer(), consumer_count=2,
+                                        ordered=True)
+        assert list(results) == [i ** 2 for i in range(30)]
+
+    def test_threads_should_process_msgs_concurrently(self):
+        proc_mgr = ProcessManager(enqueuer=MsgEnqueuer(timeout=1), dequeuer=MsgDequeuer(timeout=1),
+                                  queue_max_size=4, batch_size=4, consumer_threads=4)
+        t_start = perf_counter()
+        proc_mgr.process(CountingMsgProducer(8), LongProcessMsgConsumer(0.5), consumer_count=1)
+        # one at a time, this would take 4 seconds
+        assert perf_counter() - t_start < 3
+
+
+class RangeMsgProducer(MsgProducer):
+
+    def __init__(self, start: int, stop: int, fail: bool = False):
+        self._start = start
+        self._stop = stop
+        self._fail = fail
+
+    def yield_msgs(self):
+        for i in range(self._start, self._stop):
+            yield {"msg_id": i}
+        if self._fail:
+            raise RuntimeError("Producer failure")
+
+    def split(self, shard_count: int) -> list:
+        step = -(-(self._stop - self._start) // shard_count)
+        return [RangeMsgProducer(start, min(start + step, self._stop))
+                for start in range(self._start, self._stop, step)]
+
+
+class TestProcessManagerProducers:
+
+    def test_should_consume_msgs_of_each_producer(self):
+        proc_mgr = ProcessManager(enqueuer=MsgEnqueuer(timeout=1), dequeuer=MsgDequeuer(timeout=1), batch_size=2)
+        producers = [RangeMsgProducer(0, 10), RangeMsgProducer(10, 15), RangeMsgProducer(15, 30)]
+        results = list(proc_mgr.process_iter(producers, SquaringMsgConsumer(), consumer_count=2))
+        assert sorted(results) == [i ** 2 for i in range(30)]
+
+    def test_should_split_producer_into_shards(self):
+        proc_mgr = ProcessManager(enqueuer=MsgEnqueuer(timeout=1), dequeuer=MsgDequeuer(timeout=1), batch_size=4)
+        proc_mgr.process(RangeMsgProducer(0, 25), SquaringMsgConsumer(), consumer_count=2, producer_count=3)
+        assert proc_mgr.worker_stats.total(WorkerStats.PROCESSED) == 25
+
+    def test_should_reject_ordered_results_of_several_producers(self):
+        proc_mgr = ProcessManager(enqueuer=MsgEnqueuer(timeout=1), dequeuer=MsgDequeuer(timeout=1))
+        with pytest.raises(ValueError):
+            list(proc_mgr.process_iter(RangeMsgProducer(0, 4), SquaringMsgConsumer(), consumer_count=1,
+                                       ordered=True, producer_count=2))
+
+    def test_consumers_should_stop_after_every_producer_even_on_failure(self):
+        proc_mgr = ProcessManager(enqueuer=MsgEnqueuer(timeout=1), dequeuer=MsgDequeuer(timeout=1))
+        producers = [RangeMsgProducer(0, 5, fail=True), RangeMsgProducer(5, 20)]
+        with pytest.raises(RuntimeError):
+            proc_mgr.process(producers, SquaringMsgConsumer(), consumer_count=2)
+        assert proc_mgr.worker_stats.total(WorkerStats.PROCESSED) == 20
+
+
+class SizedRangeMsgProducer(RangeMsgProducer):
+
+    def msg_count(self) -> int:
+        return self._stop - self._start
+
+
+class BatchRecordingMsgEnqueuer(MsgEnqueuer):
+    """Records the number of user messages in each batch put"""
+
+    def __init__(self):
+        super().__init__(timeout=1)
+        self.batch_sizes = []
+
+    def put_many(self, msg_queue, msgs: list):
+        user_msg_count = sum(msg_type == ProcessManager.MSG_TYPE_USER for msg_type, _ in msgs)
+        if user_msg_count:
+            self.batch_sizes.append(user_msg_count)
+        return super().put_many(msg_queue, msgs)
+
+
+class TestProcessManagerChunking:
+
+    def test_chunks_should_shrink_towards_the_end(self):
+        enqueuer = BatchRecordingMsgEnqueuer()
+        proc_mgr = ProcessManager(enqueuer=enqueuer, dequeuer=MsgDequeuer(timeout=1), queue_max_size=100,
+                                  chunking=AdaptiveChunking(max_chunk=64, target_chunk_sec=10))
+        results = list(proc_mgr.process_iter(SizedRangeMsgProducer(0, 200), SquaringMsgConsumer(), consumer_count=2))
+        assert sorted(results) == [i ** 2 for i in range(200)]
+        assert sum(enqueuer.batch_sizes) == 200
+        assert enqueuer.batch_sizes[0] == 50
+        assert enqueuer.batch_sizes[-1] == 1
+        assert enqueuer.batch_sizes == sorted(enqueuer.batch_sizes, reverse=True)
+
+    def test_chunks_should_follow_service_time(self):
+        enqueuer = BatchRecordingMsgEnqueuer()
+        proc_mgr = ProcessManager(enqueuer=enqueuer, dequeuer=MsgDequeuer(timeout=1), queue_max_size=100,
+                                  chunking=AdaptiveChunking(max_chunk=64, target_chunk_sec=0.001))
+        proc_mgr.process(RangeMsgProducer(0, 10), LongProcessMsgConsumer(0.01), consumer_count=1)
+        assert proc_mgr.worker_stats.total(WorkerStats.PROCESSED) == 10
+        # msg_count unknown, 10 ms per message: one at a time
+        assert enqueuer.batch_sizes == [1] * 10
+
+
+class TestProcessManagerAffinity:
+
+    def test_workers_should_run_on_their_cores(self):
+        cpu = max(os.sched_getaffinity(0))
+        proc_mgr = ProcessManager(enqueuer=MsgEnqueuer(timeout=1), dequeuer=MsgDequeuer(timeout=1),
+                                  affinity=ExplicitAffinity([[cpu]]))
+        proc_mgr.process(CountingMsgProducer(10), SquaringMsgConsumer(), consumer_count=2)
+        assert proc_mgr.worker_cpus == [cpu, cpu]
+
+    def test_workers_should_report_their_cpu_without_affinity(self):
+        proc_mgr = ProcessManager(enqueuer=MsgEnqueuer(timeout=1), dequeuer=MsgDequeuer(timeout=1))
+        proc_mgr.process(CountingMsgProducer(4), SquaringMsgConsumer(), consumer_count=2)
+        assert all(cpu in os.sched_getaffinity(0) for cpu in proc_mgr.worker_cpus)
+
+
+class TestProcessManagerShutdown:
+
+    def test_should_report_shutdown_duration(self):
+        proc_mgr = ProcessManager(enqueuer=MsgEnqueuer(timeout=1), dequeuer=MsgDequeuer(timeout=1))
+        assert proc_mgr.shutdown_sec is None
+        proc_mgr.process(CountingMsgProducer(10), CountingMsgConsumer(), consumer_count=4)
+        assert 0 < proc_mgr.shutdown_sec < 1
+
+    def test_should_reject_unknown_mode(self):
+        proc_mgr = ProcessManager(enqueuer=MsgEnqueuer(timeout=1), dequeuer=MsgDequeuer(timeout=1))
+        with pytest.raises(ValueError):
+            proc_mgr.shutdown("later")
+
+    def test_drain_should_process_every_enqueued_msg(self):
+        proc_mgr = ProcessManager(enqueuer=MsgEnqueuer(timeout=1), dequeuer=MsgDequeuer(timeout=1), queue_max_size=2)
+        results = proc_mgr.process_iter(CountingMsgProducer(1000), SquaringMsgConsumer(), consumer_count=2)
+        received = [next(results)]
+        proc_mgr.shutdown(ProcessManager.SHUTDOWN_DRAIN)
+        received.extend(results)
+        assert len(received) < 1000
+        assert len(set(received)) == len(received)
+
+    @pytest.mark.parametrize("consumer_threads", [1, 2])
+    def test_abort_should_skip_queued_msgs(self, consumer_threads):
+        proc_mgr = ProcessManager(enqueuer=MsgEnqueuer(timeout=1), dequeuer=MsgDequeuer(timeout=1), queue_max_size=50,
+                                  consumer_threads=consumer_threads)
+        timer = threading.Timer(0.1, proc_mgr.shutdown, (ProcessManager.SHUTDOWN_ABORT,))
+        timer.start()
+        t_start = perf_counter()
+        proc_mgr.process(CountingMsgProducer(1000), LongProcessMsgConsumer(0.01), consumer_count=2)
+        assert perf_counter() - t_start < 1
+        assert proc_mgr.worker_stats.total(WorkerStats.PROCESSED) < 100
+        assert proc_mgr.shutdown_sec < 0.5
+
+
+class TestProcessManagerLatencyTracing:
+
+    def test_should_not_trace_by_default(self):
+        proc_mgr = ProcessManager(enqueuer=MsgEnqueuer(timeout=1), dequeuer=MsgDequeuer(timeout=1))
+        proc_mgr.process(CountingMsgProducer(3), CountingMsgConsumer(), consumer_count=1)
+        assert proc_mgr.latency_histograms is None
+
+    @pytest.mark.parametrize("consumer_threads", [1, 2])
+    def test_should_merge_histograms_of_all_workers(self, consumer_threads):
+        proc_mgr = ProcessManager(enqueuer=MsgEnqueuer(timeout=1), dequeuer=MsgDequeuer(timeout=1),
+                                  queue_max_size=4, batch_size=2, consumer_threads=consumer_threads,
+                                  trace_latency=True)
+        proc_mgr.process(CountingMsgProducer(20), LongProcessMsgConsumer(0.01), consumer_count=2)
+        histograms = proc_mgr.latency_histograms
+        assert all(histogram.count == 20 for histogram in histograms.values())
+        assert histograms["service"].percentile(50) >= 10_000_000
+        assert histograms["end_to_end"].percentile(99) >= histograms["service"].percentile(99)
+
+    def test_should_trace_async_consumer(self):
+        proc_mgr = ProcessManager(enqueuer=MsgEnqueuer(timeout=1), dequeuer=MsgDequeuer(timeout=1),
+                                  trace_latency=True)
+        proc_mgr.process(CountingMsgProducer(5), SleepingAsyncMsgConsumer(0), consumer_count=1)
+        assert proc_mgr.latency_histograms["queue_wait"].count == 5
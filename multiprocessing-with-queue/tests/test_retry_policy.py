@@ -0,0 +1,94 @@
+import multiprocessing
+import queue
+import threading
+from time import perf_counter, sleep
+from unittest import mock
+
+import pytest
+
+from src.process_manager import MsgDequeuer
+from src.process_manager import MsgEnqueuer
+from src.process_manager import QueueNotifier
+from src.process_manager import RetryPolicy
+
+
+class TestRetryPolicy:
+
+    def test_should_require_attempts_or_deadline(self):
+        with pytest.raises(ValueError):
+            RetryPolicy(max_attempts=None, deadline_sec=None)
+        with pytest.raises(ValueError):
+            RetryPolicy(max_attempts=0)
+        with pytest.raises(ValueError):
+            RetryPolicy(jitter=1.5)
+
+    def test_should_back_off_exponentially_up_to_max_wait(self):
+        policy = RetryPolicy(wait_sec=0.1, multiplier=2, max_wait_sec=0.3)
+        assert [policy.wait_after(attempt) for attempt in range(1, 5)] == pytest.approx([0.1, 0.2, 0.3, 0.3])
+
+    def test_jitter_should_only_shorten_waits(self):
+        policy = RetryPolicy(wait_sec=1, multiplier=1, jitter=0.5)
+        waits = [policy.wait_after(1) for _ in range(100)]
+        assert all(0.5 <= wait_sec <= 1 for wait_sec in waits)
+        assert len(set(waits)) > 1
+
+    def test_budget_should_end_at_max_attempts(self):
+        budget = RetryPolicy(max_attempts=2).start()
+        budget.attempts = 1
+        assert not budget.exhausted()
+        budget.attempts = 2
+        assert budget.exhausted()
+
+    def test_budget_should_end_at_deadline(self):
+        budget = RetryPolicy(max_attempts=None, deadline_sec=0.05).start()
+        budget.attempts = 100
+        assert not budget.exhausted()
+        assert budget.limit(10) <= 0.05
+        sleep(0.06)
+        assert budget.exhausted()
+        assert budget.limit(10) == 0
+
+
+class TestMsgProcessorRetryPolicy:
+
+    def test_deadline_should_bound_total_time(self):
+        dequeuer = MsgDequeuer(timeout=0.02, retry_policy=RetryPolicy(max_attempts=None, wait_sec=0.01,
+                                                                      deadline_sec=0.1))
+        t_start = perf_counter()
+        with pytest.raises(queue.Empty):
+            dequeuer.get_many(queue.Queue())
+        assert 0.1 <= perf_counter() - t_start < 0.5
+        assert dequeuer.timeout_count > 1
+
+    def test_should_wake_up_on_data(self):
+        ctx = multiprocessing.get_context()
+        space, data = QueueNotifier(ctx), QueueNotifier(ctx)
+        enqueuer = MsgEnqueuer(timeout=1)
+        dequeuer = MsgDequeuer(timeout=0.01, retry_policy=RetryPolicy(max_attempts=2, wait_sec=10))
+        enqueuer.attach_notifiers(wake_on=space, notify=data)
+        dequeuer.attach_notifiers(wake_on=data, notify=space)
+
+        q = queue.Queue()
+        timer = threading.Timer(0.1, enqueuer.put_many, (q, [("USER", 1)]))
+        timer.start()
+        t_start = perf_counter()
+        assert dequeuer.get_many(q) == [("USER", 1)]
+        assert perf_counter() - t_start < 5
+        timer.join()
+
+    def test_should_notify_only_registered_waiters(self):
+        notifier = QueueNotifier(multiprocessing.get_context())
+        # nobody waits: the condition is left alone
+        with mock.patch.object(notifier, "_cond") as mock_cond:
+            notifier.notify()
+        mock_cond.__enter__.assert_not_called()
+
+        waiter = threading.Thread(target=notifier.wait, args=(10,))
+        waiter.start()
+        deadline = perf_counter() + 5
+        while notifier.waiters == 0:
+            assert perf_counter() < deadline, "waiter never registered"
+        notifier.notify()
+        waiter.join(5)
+        assert not waiter.is_alive()
+        assert notifier.waiters == 0
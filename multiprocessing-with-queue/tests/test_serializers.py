@@ -0,0 +1,138 @@
+import pickle
+
+import pytest
+
+from src.cli_actions import SIMPLE_MSG_SCHEMA
+from src.cli_actions import SimpleMsg
+from src.process_manager import Envelope
+from src.process_manager import MsgDequeuer
+from src.process_manager import MsgEnqueuer
+from src.process_manager import MsgConsumer
+from src.process_manager import MsgProducer
+from src.process_manager import MsgSchema
+from src.process_manager import ProcessManager
+from src.process_manager import SERIALIZERS
+from src.process_manager import create_serializer
+
+
+class Point:
+
+    __slots__ = ("x", "y")
+
+    def __init__(self, x: int, y: float):
+        self.x = x
+        self.y = y
+
+
+POINT_SCHEMA = MsgSchema(Point, ("x", "y"), "id")
+
+
+class Task:
+    """Without __slots__: any attribute can be added"""
+
+    def __init__(self, task_id: int):
+        self.task_id = task_id
+
+
+def user_msg(seq: int, msg, enqueue_ns: int = 0) -> tuple:
+    return ProcessManager.MSG_TYPE_USER, Envelope(seq, msg, enqueue_ns)
+
+
+class TestSerializers:
+
+    @pytest.mark.parametrize("name", SERIALIZERS)
+    def test_should_create_each_serializer(self, name):
+        assert create_serializer(name, SIMPLE_MSG_SCHEMA) is not None
+
+    def test_should_reject_unknown_serializer(self):
+        with pytest.raises(ValueError):
+            create_serializer("unknown")
+
+    def test_struct_serializer_should_need_a_schema(self):
+        with pytest.raises(ValueError):
+            create_serializer("struct")
+
+    def test_schema_should_match_fields(self):
+        with pytest.raises(ValueError):
+            MsgSchema(Point, ("x", "y"), "i")
+
+    def test_schema_should_hold_every_slot(self):
+        with pytest.raises(ValueError, match="priority"):
+            MsgSchema(SimpleMsg, ("msg_id", "duration_s"), "qd", tail_field="payload")
+
+    def test_should_reject_attributes_outside_schema(self):
+        serializer = create_serializer("struct", MsgSchema(Task, ("task_id",), "q"))
+        assert serializer.decode(serializer.encode([user_msg(0, Task(1))]))[0][1].msg.task_id == 1
+        task = Task(2)
+        task.deadline_sec = 0.5
+        with pytest.raises(ValueError, match="deadline_sec"):
+            serializer.encode([user_msg(1, task)])
+
+    def test_should_round_trip_fixed_layout(self):
+        serializer = create_serializer("struct", POINT_SCHEMA)
+        msgs = [user_msg(7, Point(1, 2.5), 123), (ProcessManager.MSG_TYPE_QUIT, "")]
+        decoded = serializer.decode(serializer.encode(msgs))
+        assert len(decoded) == 2
+        msg_type, envelope = decoded[0]
+        assert msg_type == ProcessManager.MSG_TYPE_USER
+        assert (envelope.seq, envelope.enqueue_ns, envelope.msg.x, envelope.msg.y) == (7, 123, 1, 2.5)
+        assert decoded[1] == (ProcessManager.MSG_TYPE_QUIT, None)
+
+    def test_should_round_trip_tail_field(self):
+        serializer = create_serializer("struct", SIMPLE_MSG_SCHEMA)
+        msgs = [user_msg(i, SimpleMsg(i, 0.5, bytes([i]) * i)) for i in range(3)]
+        msgs.append((ProcessManager.MSG_TYPE_END_RUN, ""))
+        decoded = serializer.decode(serializer.encode(msgs))
+        assert [(env.seq, env.msg.msg_id, env.msg.duration_s, env.msg.payload) for _, env in decoded[:3]] == [
+            (i, i, 0.5, bytes([i]) * i) for i in range(3)
+        ]
+        assert decoded[2][1].msg.priority == 0
+        assert decoded[3][0] == ProcessManager.MSG_TYPE_END_RUN
+
+    def test_should_keep_msg_priority(self):
+        serializer = create_serializer("struct", SIMPLE_MSG_SCHEMA)
+        decoded = serializer.decode(serializer.encode([user_msg(0, SimpleMsg(0, 0.5, b"ab", priority=3))]))
+        assert (decoded[0][1].msg.payload, decoded[0][1].msg.priority) == (b"ab", 3)
+
+    def test_should_round_trip_priority(self):
+        serializer = create_serializer("struct", POINT_SCHEMA)
+        msgs = [(ProcessManager.MSG_TYPE_USER, Envelope(3, Point(1, 2.0), 0, priority=2))]
+        assert serializer.decode(serializer.encode(msgs))[0][1].priority == 2
+
+    def test_struct_single_msg_batches_should_be_smaller_than_pickled_ones(self):
+        msgs = [user_msg(1, SimpleMsg(1, 0.0))]
+        pickled = len(pickle.dumps(msgs, protocol=pickle.HIGHEST_PROTOCOL))
+        packed = len(pickle.dumps(create_serializer("struct", SIMPLE_MSG_SCHEMA).encode(msgs),
+                                  protocol=pickle.HIGHEST_PROTOCOL))
+        assert packed < pickled / 2
+
+
+class PointProducer(MsgProducer):
+
+    def yield_msgs(self):
+        for i in range(20):
+            yield Point(i, i / 2)
+
+
+class PointConsumer(MsgConsumer):
+
+    def process_msg(self, msg):
+        return msg.x, msg.y
+
+
+class TestProcessManagerSerializer:
+
+    def test_should_process_struct_encoded_batches(self):
+        proc_mgr = ProcessManager(MsgEnqueuer(timeout=5), MsgDequeuer(timeout=5), queue_max_size=2, batch_size=3,
+                                  serializer=create_serializer("struct", POINT_SCHEMA))
+        try:
+            assert sorted(proc_mgr.process_iter(PointProducer(), PointConsumer(), 2)) == [
+                (i, i / 2) for i in range(20)
+            ]
+        finally:
+            proc_mgr.close()
+
+    def test_should_reject_binary_serializer_with_large_payloads(self):
+        with pytest.raises(ValueError):
+            ProcessManager(MsgEnqueuer(), MsgDequeuer(), large_payload_threshold=1024,
+                           serializer=create_serializer("struct", POINT_SCHEMA))
@@ -0,0 +1,122 @@
+import multiprocessing
+from time import sleep
+from multiprocessing.shared_memory import SharedMemory
+
+import pytest
+
+from src.process_manager import AsyncMsgConsumer
+from src.process_manager import MsgConsumer
+from src.process_manager import MsgDequeuer
+from src.process_manager import MsgEnqueuer
+from src.process_manager import MsgProducer
+from src.process_manager import ProcessManager
+from src.process_manager import ShmPayloadStore
+from src.process_manager.shm_payloads import OutOfBandBatch
+
+
+@pytest.fixture
+def store():
+    payload_store = ShmPayloadStore(multiprocessing.get_context(), threshold=1024)
+    yield payload_store
+    payload_store.close()
+
+
+class TestShmPayloadStore:
+
+    def test_small_buffers_should_stay_inline(self, store):
+        msgs = [("USER", b"x" * 10), ("USER", bytearray(100))]
+        packed = store.pack(msgs)
+        assert packed.segments == []
+        unpacked = store.unpack(packed)
+        assert unpacked == msgs
+        assert not hasattr(unpacked, "lease")
+        assert store.segments_in_use == 0
+
+    def test_should_pass_other_items_through(self, store):
+        msgs = [("QUIT", "")]
+        assert store.unpack(msgs) is msgs
+
+    def test_should_move_large_buffers_out_of_the_batch(self, store):
+        msgs = [("USER", {"payload": b"a" * 5000}), ("USER", bytearray(b"b" * 3000)), ("QUIT", "")]
+        packed = store.pack(msgs)
+        assert isinstance(packed, OutOfBandBatch)
+        assert len(packed.segments) == 2
+        assert len(packed.data) < 1000
+        assert store.segments_in_use == 2
+
+        unpacked = store.unpack(packed)
+        assert unpacked == msgs
+        assert type(unpacked[0][1]["payload"]) is bytes  # pylint: disable=unidiomatic-typecheck
+
+    def test_should_reuse_segments_once_all_msgs_are_done(self, store):
+        packed = store.pack([("USER", b"a" * 5000), ("USER", b"b" * 10)])
+        name = packed.segments[0][0]
+        batch = store.unpack(packed)
+
+        batch.lease.done()
+        sleep(0.05)
+        assert store.segments_in_use == 1
+        batch.lease.done()
+        sleep(0.05)  # released names travel through a multiprocessing queue
+        assert store.segments_in_use == 0
+
+        assert store.pack([("USER", b"c" * 6000)]).segments[0][0] == name
+
+    def test_close_should_destroy_segments(self, store):
+        name = store.pack([("USER", b"a" * 5000)]).segments[0][0]
+        store.close()
+        with pytest.raises(FileNotFoundError):
+            SharedMemory(name)
+
+
+class PayloadMsgProducer(MsgProducer):
+
+    def __init__(self, msg_count: int, payload_size: int):
+        self._msg_count = msg_count
+        self._payload_size = payload_size
+
+    def yield_msgs(self):
+        for i in range(self._msg_count):
+            yield {"id": i, "payload": bytes([i % 256]) * self._payload_size}
+
+
+class PayloadMsgConsumer(MsgConsumer):
+
+    def process_msg(self, msg):
+        return msg["id"], len(msg["payload"]), msg["payload"][-1]
+
+
+class AsyncPayloadMsgConsumer(AsyncMsgConsumer):
+
+    async def process_msg(self, msg):
+        return msg["id"], len(msg["payload"]), msg["payload"][-1]
+
+
+class TestProcessManagerLargePayloads:
+
+    @pytest.mark.parametrize("consumer_class, consumer_threads", [
+        (PayloadMsgConsumer, 1),
+        (PayloadMsgConsumer, 3),
+        (AsyncPayloadMsgConsumer, 1),
+    ])
+    def test_should_pass_large_payloads_through_shared_memory(self, consumer_class, consumer_threads):
+        proc_mgr = ProcessManager(MsgEnqueuer(timeout=5), MsgDequeuer(timeout=5), queue_max_size=4, batch_size=3,
+                                  consumer_threads=consumer_threads, large_payload_threshold=4096)
+        try:
+            results = list(proc_mgr.process_iter(PayloadMsgProducer(20, 10000), consumer_class(), 2))
+            assert sorted(results) == [(i, 10000, i % 256) for i in range(20)]
+            assert proc_mgr._payload_store.segments_in_use == 0
+        finally:
+            proc_mgr.close()
+
+    def test_pooled_segments_should_outlive_workers(self):
+        proc_mgr = ProcessManager(MsgEnqueuer(timeout=5), MsgDequeuer(timeout=5), queue_max_size=4, batch_size=3,
+                                  large_payload_threshold=4096)
+        try:
+            # each run starts new workers, attaching the segments pooled by the previous one
+            for _ in range(3):
+                results = list(proc_mgr.process_iter(PayloadMsgProducer(20, 10000), PayloadMsgConsumer(), 2))
+                assert sorted(results) == [(i, 10000, i % 256) for i in range(20)]
+                assert proc_mgr._payload_store.segments_in_use == 0
+        finally:
+            proc_mgr.close()
@@ -0,0 +1,81 @@
+import queue
+from multiprocessing import Process
+
+import pytest
+
+from src.process_manager import MsgDequeuer
+from src.process_manager import MsgEnqueuer
+from src.process_manager import ProcessManager
+from src.process_manager.shm_ring_queue import ShmRingQueue
+from src.process_manager.transports import ShmRingTransport
+from .test_process_manager import CountingMsgConsumer
+from .test_process_manager import CountingMsgProducer
+
+
+def put_range(q: ShmRingQueue, count: int):
+    for i in range(count):
+        q.put(i, timeout=5)
+
+
+class TestShmRingQueue:
+
+    def test_should_get_items_in_fifo_order(self):
+        q = ShmRingQueue(maxsize=3)
+        for i in range(3):
+            q.put(("USER", {"msg_id": i}))
+        assert q.qsize() == 3
+        for i in range(3):
+            assert q.get() == ("USER", {"msg_id": i})
+        assert q.empty()
+
+    def test_should_wrap_around(self):
+        q = ShmRingQueue(maxsize=2)
+        for i in range(5):
+            q.put(i)
+            assert q.get() == i
+
+    def test_should_raise_queue_full(self):
+        q = ShmRingQueue(maxsize=1)
+        q.put("first")
+        assert q.full()
+        with pytest.raises(queue.Full):
+            q.put("second", timeout=0)
+
+    def test_should_raise_queue_empty(self):
+        q = ShmRingQueue(maxsize=1)
+        with pytest.raises(queue.Empty):
+            q.get(timeout=0)
+
+    def test_should_reject_item_larger_than_slot(self):
+        q = ShmRingQueue(maxsize=1, slot_size=16)
+        with pytest.raises(ValueError):
+            q.put(b"x" * 100)
+
+    def test_should_transfer_items_across_processes(self):
+        q = ShmRingQueue(maxsize=2)
+        producer = Process(target=put_range, args=(q, 10))
+        producer.start()
+        assert [q.get(timeout=5) for _ in range(10)] == list(range(10))
+        producer.join()
+
+    def test_should_work_with_enqueuer_retry_semantics(self):
+        q = ShmRingQueue(maxsize=1)
+        obj = MsgEnqueuer(max_attempts=2)
+        obj.put_many(q, [("foo", "first message")])
+        with pytest.raises(queue.Full):
+            obj.put_many(q, [("bar", "second message")])
+        assert MsgDequeuer().get_many(q) == [("foo", "first message")]
+
+
+class TestProcessManagerShmRingBackend:
+
+    def test_should_produce_consume_with_shm_ring_backend(self):
+        src = CountingMsgProducer(10)
+        dest = CountingMsgConsumer()
+        proc_mgr = ProcessManager(
+            enqueuer=MsgEnqueuer(timeout=1),
+            dequeuer=MsgDequeuer(timeout=1),
+            batch_size=3,
+            transport=ShmRingTransport(maxsize=2),
+        )
+        proc_mgr.process(src, dest, consumer_count=2)
@@ -0,0 +1,159 @@
+import multiprocessing
+import os
+
+import pytest
+
+from src.process_manager import AutoscalePolicy
+from src.process_manager import Envelope
+from src.process_manager import MsgConsumer
+from src.process_manager import MsgDequeuer
+from src.process_manager import MsgEnqueuer
+from src.process_manager import MsgProducer
+from src.process_manager import ProcessManager
+from src.process_manager import SupervisePolicy
+from src.process_manager import WorkerStats
+from src.process_manager.supervisor import AckLog
+from src.process_manager.supervisor import InFlightLedger
+
+
+def user_batch(*seqs) -> list:
+    return [(ProcessManager.MSG_TYPE_USER, Envelope(seq, {"msg_id": seq}, 0)) for seq in seqs]
+
+
+class TestInFlightLedger:
+
+    def test_should_key_batches_by_their_first_msg(self):
+        ledger = InFlightLedger()
+        batch = user_batch(4, 5, 6)
+        ledger.add(1, batch)
+        assert ledger.take(4) == (1, batch)
+        assert ledger.take(4) is None
+
+    def test_acknowledged_batches_should_be_forgotten(self):
+        ledger = InFlightLedger()
+        ledger.add(0, user_batch(0, 1))
+        ledger.add(0, user_batch(2, 3))
+        ledger.add(0, [(ProcessManager.MSG_TYPE_QUIT, "")])
+        ledger.ack([0, 7])
+        assert len(ledger) == 1
+        assert ledger.take(0) is None
+
+    def test_should_count_redeliveries(self):
+        ledger = InFlightLedger()
+        assert [ledger.redelivered(3) for _ in range(3)] == [1, 2, 3]
+        assert ledger.redelivered(4) == 1
+
+
+class TestAckLog:
+
+    def test_should_tell_when_capacity_keys_are_unsent(self):
+        ack_log = AckLog(multiprocessing.get_context(), 2, capacity=3)
+        assert [ack_log.add(1, key) for key in (0, 3, 6)] == [False, False, True]
+        assert ack_log.unsent(1) == [0, 3, 6]
+        ack_log.mark_sent(1)
+        assert not ack_log.add(1, 9)
+        assert ack_log.unsent(1) == [9]
+        assert ack_log.unsent_count(0) == 0
+
+    def test_should_keep_the_last_keys_sent_or_not(self):
+        ack_log = AckLog(multiprocessing.get_context(), 1, capacity=3)
+        for key in range(5):
+            ack_log.add(0, key)
+            ack_log.mark_sent(0)
+        assert ack_log.recent(0) == [2, 3, 4]
+        ack_log.reset(0)
+        assert ack_log.recent(0) == []
+
+
+class IdMsgProducer(MsgProducer):
+
+    def __init__(self, msg_count: int):
+        self._msg_count = msg_count
+
+    def yield_msgs(self):
+        for i in range(self._msg_count):
+            yield {"msg_id": i}
+
+
+class CrashingMsgConsumer(MsgConsumer):
+    """Exits abruptly on the crashing messages, the first time only unless always"""
+
+    def __init__(self, marker_dir: str, crashing_ids: set, always: bool = False):
+        self._marker_dir = marker_dir
+        self._crashing_ids = crashing_ids
+        self._always = always
+
+    def process_msg(self, msg):
+        if msg["msg_id"] in self._crashing_ids:
+            marker = os.path.join(self._marker_dir, str(msg["msg_id"]))
+            if self._always or not os.path.exists(marker):
+                open(marker, "w", encoding="ascii").close()
+                os._exit(1)
+
+
+class DyingBeforeHoldProcessManager(ProcessManager):
+    """Its workers exit abruptly right after getting the batch holding crashing_id, before recording it, once"""
+
+    def __init__(self, marker_dir: str, crashing_id: int, **kwargs):
+        super().__init__(**kwargs)
+        self._marker = os.path.join(marker_dir, str(crashing_id))
+        self._crashing_id = crashing_id
+
+    def _hold(self, worker_index: int, batch: list) -> int:
+        ids = [envelope.msg["msg_id"] for msg_type, envelope in batch if msg_type == self.MSG_TYPE_USER]
+        if self._crashing_id in ids and not os.path.exists(self._marker):
+            open(self._marker, "w", encoding="ascii").close()
+            os._exit(1)
+        return super()._hold(worker_index, batch)
+
+
+def supervised_proc_mgr(**kwargs) -> ProcessManager:
+    return ProcessManager(MsgEnqueuer(timeout=5), MsgDequeuer(timeout=5), queue_max_size=4, batch_size=3,
+                          supervise=SupervisePolicy(interval_sec=0.01, **kwargs))
+
+
+class TestProcessManagerSupervision:
+
+    def test_should_redeliver_msgs_of_dead_workers(self, tmp_path):
+        proc_mgr = supervised_proc_mgr()
+        proc_mgr.process(IdMsgProducer(30), CrashingMsgConsumer(str(tmp_path), {4, 17}), consumer_count=2)
+        stats = proc_mgr.supervisor_stats
+        assert stats.crashes == 2
+        assert stats.dropped == 0
+        # the crashing message and the rest of its batch
+        assert stats.redelivered >= 2
+        # at most the crashing messages are processed twice
+        assert 30 <= proc_mgr.worker_stats.total(WorkerStats.PROCESSED) <= 32
+
+    def test_should_drop_msgs_killing_every_worker(self, tmp_path):
+        proc_mgr = supervised_proc_mgr(max_redeliveries=1)
+        proc_mgr.process(IdMsgProducer(12), CrashingMsgConsumer(str(tmp_path), {5}, always=True), consumer_count=2)
+        stats = proc_mgr.supervisor_stats
+        assert stats.crashes == 2
+        assert stats.dropped == 1
+        assert proc_mgr.worker_stats.total(WorkerStats.PROCESSED) == 11
+
+    def test_should_redeliver_batches_lost_before_being_recorded(self, tmp_path):
+        proc_mgr = DyingBeforeHoldProcessManager(
+            str(tmp_path), 13, enqueuer=MsgEnqueuer(timeout=5), dequeuer=MsgDequeuer(timeout=5), queue_max_size=4,
+            batch_size=3, supervise=SupervisePolicy(interval_sec=0.01, lost_after_sec=0.2))
+        proc_mgr.process(IdMsgProducer(30), CrashingMsgConsumer("", set()), consumer_count=2)
+        stats = proc_mgr.supervisor_stats
+        assert stats.crashes == 1
+        assert stats.redelivered == 3
+        assert proc_mgr.worker_stats.total(WorkerStats.PROCESSED) == 30
+
+    def test_should_only_supervise_process(self):
+        proc_mgr = supervised_proc_mgr()
+        with pytest.raises(ValueError):
+            list(proc_mgr.process_iter(IdMsgProducer(3), CrashingMsgConsumer("", set()), consumer_count=1))
+
+    def test_should_reject_autoscaling(self):
+        with pytest.raises(ValueError):
+            ProcessManager(MsgEnqueuer(), MsgDequeuer(), supervise=SupervisePolicy(), autoscale=AutoscalePolicy())
+
+    def test_should_reject_invalid_policies(self):
+        with pytest.raises(ValueError):
+            SupervisePolicy(max_redeliveries=-1)
+        with pytest.raises(ValueError):
+            SupervisePolicy(lost_after_sec=0)
@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+from src.cli_actions import run_sweep
+from src.config import Config
+from src.sweep import Sweep
+from src.sweep import compare_to_baseline
+from .fixtures_utils import fixture_path
+
+
+def sweep_run(consumer_count: int, msgs_per_sec: float) -> dict:
+    return {"config": {"consumer_count": consumer_count, "msg_count": 10}, "msgs_per_sec": msgs_per_sec}
+
+
+class TestSweep:
+
+    def test_should_read_axes_from_file(self):
+        sweep = Sweep.from_file(fixture_path("sweep_test.yaml"))
+        assert sweep.axes == {"queue_max_size": [1, 4], "consumer_count": [1, 2], "payload_size": [0, 16]}
+        assert len(sweep) == 8
+
+    def test_should_yield_cartesian_product(self):
+        sweep = Sweep(Config(msg_count=[1, 2], consumer_count=[1, 2, 3], task_duration_sec=0))
+        points = [(config.msg_count, config.consumer_count, config.task_duration_sec) for config in sweep.points()]
+        assert points == [(1, 1, 0), (1, 2, 0), (1, 3, 0), (2, 1, 0), (2, 2, 0), (2, 3, 0)]
+
+    def test_should_reject_unknown_axis(self):
+        with pytest.raises(ValueError):
+            Sweep(Config(queue_put_timeout_sec=[1, 2]))
+
+    def test_should_reject_empty_axis(self):
+        with pytest.raises(ValueError):
+            Sweep(Config(consumer_count=[]))
+
+
+class TestCompareToBaseline:
+
+    def test_should_report_drops_beyond_threshold(self):
+        baseline = [sweep_run(1, 100.0), sweep_run(2, 200.0)]
+        runs = [sweep_run(1, 96.0), sweep_run(2, 150.0)]
+        regressions = compare_to_baseline(runs, baseline, ["consumer_count"], threshold_pct=5)
+        assert [regression["point"] for regression in regressions] == [{"consumer_count": 2}]
+        assert regressions[0]["change_pct"] == pytest.approx(-25)
+
+    def test_should_skip_points_without_baseline(self):
+        regressions = compare_to_baseline([sweep_run(4, 1.0)], [sweep_run(1, 100.0)], ["consumer_count"], 5)
+        assert regressions == []
+
+    @pytest.mark.parametrize("baseline_run", [{"config": {"consumer_count": 1}}, sweep_run(1, 0), sweep_run(1, None)])
+    def test_should_report_baselines_which_cannot_be_compared(self, baseline_run):
+        regressions = compare_to_baseline([sweep_run(1, 100.0)], [baseline_run], ["consumer_count"], 5)
+        assert [regression["point"] for regression in regressions] == [{"consumer_count": 1}]
+        assert "error" in regressions[0]
+
+
+class TestRunSweep:
+
+    def test_should_store_results_and_fail_on_regression(self, tmp_path, capsys):
+        sweep = Sweep(Config.from_file(fixture_path("sweep_test.yaml")))
+        output = tmp_path / "sweep.json"
+        assert run_sweep(sweep, str(output)) == 0
+        runs = json.loads(output.read_text())["runs"]
+        assert len(runs) == 8
+        assert len(capsys.readouterr().out.splitlines()) == 1 + 8
+
+        for run in runs:
+            run["msgs_per_sec"] *= 1000
+        baseline = tmp_path / "baseline.json"
+        baseline.write_text(json.dumps({"runs": runs}))
+        sweep = Sweep(Config.from_file(fixture_path("sweep_test.yaml")))
+        assert run_sweep(sweep, baseline=str(baseline), threshold_pct=10) == 1
@@ -0,0 +1,192 @@
+import queue
+from time import perf_counter
+
+import pytest
+
+from src.cli_actions import SimpleMsg
+from src.cli_actions import SimpleMsgProducer
+from src.process_manager import LanePolicy
+from src.process_manager import MsgDequeuer
+from src.process_manager import MsgEnqueuer
+from src.process_manager import ProcessManager
+from src.process_manager import TRANSPORTS
+from src.process_manager import WorkerStats
+from src.process_manager import create_transport
+from src.process_manager import create_dispatch_policy
+from src.process_manager.transports import PipeTransport
+from src.process_manager.transports import PriorityTransport
+from src.process_manager.transports import QueuePerWorkerTransport
+from .test_process_manager import CountingMsgConsumer
+from .test_process_manager import CountingMsgProducer
+
+
+def wait_until_readable(*lanes, timeout: float = 1.0):
+    """Puts reach a multiprocessing.Queue through its feeder thread"""
+    deadline = perf_counter() + timeout
+    while any(lane.empty() for lane in lanes):
+        assert perf_counter() < deadline, "lanes still empty"
+
+
+class TestTransportFactory:
+
+    def test_should_reject_unknown_transport(self):
+        with pytest.raises(ValueError):
+            create_transport("foo")
+
+    @pytest.mark.parametrize("name", TRANSPORTS)
+    def test_should_create_each_transport(self, name):
+        transport = create_transport(name, maxsize=2)
+        transport.close()
+
+
+class TestTransportChannels:
+
+    @pytest.mark.parametrize("name", TRANSPORTS)
+    def test_worker_should_get_what_parent_put(self, name):
+        transport = create_transport(name, maxsize=2)
+        transport.open(1)
+        try:
+            transport.channel(transport.route("msg")).put([("USER", "msg")], timeout=1)
+            assert transport.worker_channel(0).get(timeout=1) == [("USER", "msg")]
+        finally:
+            transport.close()
+
+    @pytest.mark.parametrize("name", TRANSPORTS)
+    def test_get_should_raise_queue_empty_on_timeout(self, name):
+        transport = create_transport(name, maxsize=2)
+        transport.open(1)
+        try:
+            with pytest.raises(queue.Empty):
+                transport.worker_channel(0).get(timeout=0.01)
+        finally:
+            transport.close()
+
+    def test_pipe_transport_should_dispatch_round_robin(self):
+        transport = PipeTransport()
+        transport.open(3)
+        try:
+            assert transport.channel_count == 3
+            assert [transport.route(i) for i in range(4)] == [0, 1, 2, 0]
+        finally:
+            transport.close()
+
+
+    def test_per_worker_transport_should_count_credits(self):
+        transport = QueuePerWorkerTransport(maxsize=2, dispatch=create_dispatch_policy("least_loaded"))
+        transport.open(2)
+        try:
+            assert transport.route({}) == 0
+            assert transport.route({}) == 1
+            transport.complete(1, 1)
+            assert transport.route({}) == 1
+        finally:
+            transport.close()
+
+
+class TestProcessManagerTransports:
+
+    @pytest.mark.parametrize("name", TRANSPORTS)
+    def test_should_produce_consume_over_each_transport(self, name):
+        src = CountingMsgProducer(10)
+        dest = CountingMsgConsumer()
+        proc_mgr = ProcessManager(
+            enqueuer=MsgEnqueuer(timeout=1),
+            dequeuer=MsgDequeuer(timeout=1),
+            batch_size=2,
+            transport=create_transport(name, maxsize=2),
+        )
+        try:
+            proc_mgr.process(src, dest, consumer_count=3)
+        finally:
+            proc_mgr.close()
+
+    @pytest.mark.parametrize("policy", ["round_robin", "least_loaded", "key_hash"])
+    def test_should_produce_consume_with_each_dispatch_policy(self, policy):
+        src = CountingMsgProducer(20)
+        dest = CountingMsgConsumer()
+        transport = QueuePerWorkerTransport(maxsize=2, dispatch=create_dispatch_policy(policy))
+        proc_mgr = ProcessManager(
+            enqueuer=MsgEnqueuer(timeout=1),
+            dequeuer=MsgDequeuer(timeout=1),
+            batch_size=2,
+            transport=transport,
+        )
+        try:
+            proc_mgr.process(src, dest, consumer_count=3)
+        finally:
+            proc_mgr.close()
+
+
+    def test_producers_should_share_pipes(self):
+        # batches far larger than PIPE_BUF: the OS splits their writes
+        proc_mgr = ProcessManager(
+            enqueuer=MsgEnqueuer(timeout=5),
+            dequeuer=MsgDequeuer(timeout=5),
+            batch_size=32,
+            transport=PipeTransport(),
+        )
+        try:
+            proc_mgr.process(SimpleMsgProducer(4000, 0, payload_size=3000), CountingMsgConsumer(), consumer_count=2,
+                             producer_count=4)
+        finally:
+            proc_mgr.close()
+        assert proc_mgr.worker_stats.total(WorkerStats.PROCESSED) == 4000
+
+
+class TestPriorityTransport:
+
+    def test_should_route_by_priority(self):
+        transport = PriorityTransport(maxsize=2, policy=LanePolicy(3))
+        try:
+            assert transport.priority_count == 3
+            assert [transport.route({"priority": p}) for p in (0, 1, 2)] == [0, 1, 2]
+            assert transport.route(SimpleMsg(0, 0, priority=1)) == 1
+            # missing or out of range: least urgent
+            assert [transport.route(msg) for msg in ({}, {"priority": 7}, {"priority": "high"})] == [2, 2, 2]
+        finally:
+            transport.close()
+
+    def test_worker_should_get_urgent_batches_first(self):
+        transport = PriorityTransport(maxsize=4, policy=LanePolicy(2, aging_sec=0))
+        try:
+            transport.channel(1).put(["bulk"], timeout=1)
+            transport.channel(0).put(["urgent"], timeout=1)
+            channel = transport.worker_channel(0)
+            wait_until_readable(transport.channel(0), transport.channel(1))
+            assert channel.get(timeout=1) == ["urgent"]
+            assert channel.get(timeout=1) == ["bulk"]
+        finally:
+            transport.close()
+
+    def test_control_msgs_should_wait_for_batches_put_before(self):
+        transport = PriorityTransport(maxsize=4)
+        try:
+            channel = transport.worker_channel(0)
+            for i in range(20):
+                transport.channel(i % 2).put([i], timeout=1)
+                transport.control_channel().put(["quit"], timeout=1)
+                # the control message reaches its lane through another feeder thread, possibly first
+                assert channel.get(timeout=1) == [i]
+                assert channel.get(timeout=1) == ["quit"]
+            with pytest.raises(queue.Empty):
+                channel.get(timeout=0.1)
+        finally:
+            transport.close()
+
+    def test_should_report_latency_per_priority(self):
+        src = CountingMsgProducer(12)
+        dest = CountingMsgConsumer()
+        proc_mgr = ProcessManager(
+            enqueuer=MsgEnqueuer(timeout=1),
+            dequeuer=MsgDequeuer(timeout=1),
+            transport=PriorityTransport(maxsize=2, policy=LanePolicy(2)),
+            trace_latency=True,
+        )
+        try:
+            proc_mgr.process(src, dest, consumer_count=2)
+        finally:
+            proc_mgr.close()
+        by_priority = proc_mgr.latency_histograms_by_priority
+        # CountingMsgProducer messages have no priority: all in the least urgent lane
+        assert [histograms["end_to_end"].count for histograms in by_priority] == [0, 12]
+        assert proc_mgr.latency_histograms["end_to_end"].count == 12
@@ -0,0 +1,57 @@
+import pytest
+
+from src.process_manager import MsgDequeuer
+from src.process_manager import MsgEnqueuer
+from src.process_manager import ProcessManager
+from src.process_manager import WorkerPool
+from src.process_manager.transports import PipeTransport
+from .test_process_manager import CountingMsgConsumer
+from .test_process_manager import CountingMsgProducer
+
+
+def create_proc_mgr(**kwargs) -> ProcessManager:
+    return ProcessManager(enqueuer=MsgEnqueuer(timeout=1), dequeuer=MsgDequeuer(timeout=1), **kwargs)
+
+
+class TestWorkerPool:
+
+    def test_should_reject_per_worker_transport(self):
+        with pytest.raises(ValueError):
+            WorkerPool(create_proc_mgr(transport=PipeTransport()), CountingMsgConsumer())
+
+    def test_should_require_workers_before_run(self):
+        pool = WorkerPool(create_proc_mgr(), CountingMsgConsumer())
+        with pytest.raises(ValueError):
+            pool.run(CountingMsgProducer(1))
+
+    def test_should_reject_empty_pool_size(self):
+        pool = WorkerPool(create_proc_mgr(), CountingMsgConsumer())
+        with pytest.raises(ValueError):
+            pool.resize(0)
+
+    def test_should_reuse_workers_across_runs(self):
+        pool = WorkerPool(create_proc_mgr(batch_size=2), CountingMsgConsumer())
+        try:
+            assert pool.resize(2) > 0
+            pids = {worker.pid for worker in pool._workers}
+            assert pool.run(CountingMsgProducer(10)) == 10
+            assert pool.run(CountingMsgProducer(5)) == 5
+            assert {worker.pid for worker in pool._workers} == pids
+        finally:
+            pool.close()
+        assert pool.worker_count == 0
+
+    def test_should_grow_and_shrink(self):
+        pool = WorkerPool(create_proc_mgr(), CountingMsgConsumer())
+        try:
+            pool.resize(1)
+            pool.run(CountingMsgProducer(3))
+            pool.resize(3)
+            assert pool.worker_count == 3
+            assert all(worker.is_alive() for worker in pool._workers)
+            pool.run(CountingMsgProducer(3))
+            pool.resize(1)
+            assert pool.worker_count == 1
+            pool.run(CountingMsgProducer(3))
+        finally:
+            pool.close()